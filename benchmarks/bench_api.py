@@ -0,0 +1,123 @@
+"""Latency and throughput of every Resources, Info and Actions method against the fake PVE API.
+
+Usage::
+
+    python benchmarks/bench_api.py --nodes 12 --guests 10000 --latency 0.002
+
+Snapshot backed lookups are reported twice, ``warm`` served from the shared snapshot and ``cold`` with the
+snapshot invalidated before every call.
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from proximate_utils.actions import Actions
+from proximate_utils.info import Info
+
+# the fake PVE API lives with the tests, it is not shipped in the package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from tests.fake_pve import FakeCluster, FakePVEServer  # noqa: E402
+
+
+def bench(name, fn, repeat, setup=None) -> dict:
+    latencies = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "name": name,
+        "calls": repeat,
+        "p50": statistics.median(latencies),
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "max": latencies[-1],
+        "throughput": repeat / total if total else float("inf"),
+    }
+
+
+def report(results):
+    print("%-36s %6s %10s %10s %10s %12s" % ("method", "calls", "p50 ms", "p95 ms", "max ms", "calls/s"))
+    for r in results:
+        print(
+            "%-36s %6d %10.2f %10.2f %10.2f %12.1f"
+            % (r["name"], r["calls"], r["p50"] * 1000, r["p95"] * 1000, r["max"] * 1000, r["throughput"])
+        )
+
+
+def run(args) -> list:
+    cluster = FakeCluster(
+        nodes=args.nodes,
+        guests=args.guests,
+        storages=args.storages,
+        content=args.content,
+        latency=args.latency,
+        task_duration=args.task_duration,
+    )
+    with FakePVEServer(cluster) as server:
+        proxmox = server.connect()
+        info = Info(proxmox)
+        actions = Actions(proxmox, info)
+        snapshot = info.snapshot
+        vmids = sorted(cluster.guests)
+        node = cluster.nodes[0]
+        storage = cluster.storages[0]
+        n = args.repeat
+
+        def vmid(i):
+            return vmids[(i * 7919) % len(vmids)]
+
+        upid = cluster.start_task(node, "vzdump", vmids[0], duration=0)
+        results = [
+            bench("Resources.get_nodes", lambda i: info.get_nodes(), n),
+            bench("Resources.get_node", lambda i: info.get_node(node), n),
+            bench("Resources.get_vms (cold)", lambda i: info.get_vms(), n, setup=snapshot.invalidate),
+            bench("Resources.get_vms (warm)", lambda i: info.get_vms(), n),
+            bench("Resources.get_vm (cold)", lambda i: info.get_vm(vmid(i)), n, setup=snapshot.invalidate),
+            bench("Resources.get_vm (warm)", lambda i: info.get_vm(vmid(i)), n),
+            bench("Resources.get_pool", lambda i: info.get_pool(cluster.pools[i % len(cluster.pools)]), n),
+            bench("Resources.get_storages", lambda i: info.get_storages(None), n),
+            bench("Resources.get_storage_content", lambda i: info.get_storage_content(node, storage), n),
+            bench("Info.version", lambda i: info.version(), n),
+            bench("Info.capabilities (cold)", lambda i: info.capabilities(node), n, setup=info.invalidate_capabilities),
+            bench("Info.capabilities (warm)", lambda i: info.capabilities(node), n),
+            bench("Info.get_nextvmid", lambda i: info.get_nextvmid(), n),
+            bench("Info.get_vmid (cold)", lambda i: info.get_vmid("ct%d" % vmid(i)), n, setup=snapshot.invalidate),
+            bench("Info.get_vmid (warm)", lambda i: info.get_vmid("ct%d" % vmid(i)), n),
+            bench("Info.api_task_ok", lambda i: info.api_task_ok(node, upid), n),
+            bench("Actions.is_template_container", lambda i: actions.is_template_container(node, vmids[0]), n),
+        ]
+
+        first = max(vmids) + 1
+        create = dict(disk="%s:8" % storage, storage=storage, cpus=1, memory=256, swap=0, timeout=60, clone=None)
+        results.append(
+            bench(
+                "Actions.create_instance",
+                lambda i: actions.create_instance(vmid=first + i, node=cluster.nodes[i % len(cluster.nodes)], **create),
+                args.create,
+            )
+        )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--guests", type=int, default=1000)
+    parser.add_argument("--storages", type=int, default=2)
+    parser.add_argument("--content", type=int, default=50, help="volumes per node and storage")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--task-duration", type=float, default=0.1, help="seconds until a task finishes")
+    parser.add_argument("--repeat", type=int, default=50, help="calls per method")
+    parser.add_argument("--create", type=int, default=5, help="number of create_instance calls")
+    report(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
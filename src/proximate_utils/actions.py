@@ -7,19 +7,128 @@ https://github.com/ansible-collections/community.general/blob/d2d7deb4ecb978dd21
 
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from proxmoxer import ProxmoxAPI
 
+from proximate_utils.bulk import BulkSummary, OperationResult, run_per_node
 from proximate_utils.info import Info
+from proximate_utils.lifecycle import (
+    MIGRATE,
+    SHUTDOWN,
+    START,
+    STOP,
+    TARGET_STATUS,
+    parse_startup,
+    select_guests,
+    startup_groups,
+)
 from proximate_utils.resources import Resources
-from proximate_utils.version import LooseVersion
+from proximate_utils.tasks import TaskWaiter
+
+
+def instance_options(vz_type, capabilities, cpus, disk, clone, kwargs) -> dict:
+    """Validate and translate ``create_instance`` options into API parameters
+    :param vz_type: str - lxc or openvz
+    :param capabilities: Capabilities - features of the target node
+    :return: dict - parameters for the create call
+    :raises ValueError: if an option is not supported or not valid
+    """
+    # Version limited features
+    version_limited = ("tags", "timezone")
+
+    # Remove all empty kwarg entries
+    kwargs = dict((k, v) for k, v in kwargs.items() if v is not None)
+
+    # Fail on unsupported features
+    for option in version_limited:
+        if option in kwargs and not capabilities.supports(option):
+            raise ValueError(
+                "Feature {option} is only supported in PVE {version}+, and you're using PVE {pve_version}".format(
+                    option=option, version=capabilities.minimum_version(option), pve_version=capabilities.version
+                )
+            )
+
+    if vz_type == "lxc":
+        kwargs["cpulimit"] = cpus
+        kwargs["rootfs"] = disk
+        if "netif" in kwargs:
+            kwargs.update(kwargs["netif"])
+            del kwargs["netif"]
+        if "mounts" in kwargs:
+            kwargs.update(kwargs["mounts"])
+            del kwargs["mounts"]
+        if "pubkey" in kwargs:
+            if capabilities.supports("ssh-public-keys"):
+                kwargs["ssh-public-keys"] = kwargs["pubkey"]
+            del kwargs["pubkey"]
+    else:
+        kwargs["cpus"] = cpus
+        kwargs["disk"] = disk
+
+    # LXC tags are expected to be valid and presented as a comma/semi-colon delimited string
+    if "tags" in kwargs:
+        re_tag = re.compile(r"^[a-z0-9_][a-z0-9_\-\+\.]*$")
+        for tag in kwargs["tags"]:
+            if not re_tag.match(tag):
+                raise ValueError("%s is not a valid tag" % tag)
+        kwargs["tags"] = ",".join(kwargs["tags"])
+
+    if kwargs.get("ostype") == "auto":
+        kwargs.pop("ostype")
+
+    if clone is not None and vz_type != "lxc":
+        raise ValueError("Clone operator is only supported for LXC enabled proxmox clusters.")
+
+    return kwargs
+
+
+def clone_parameters(clone_is_template, storage, clone_type, kwargs) -> dict:
+    """Select the parameters of a clone call
+    :param clone_is_template: bool - the source container is a template, which allows linked clones
+    :param storage: str, optional - target storage, required for full clones
+    :param clone_type: str - ``linked``, ``full`` or ``opportunistic`` (linked when the source is a template, full
+        otherwise)
+    :param kwargs: dict - ``create_instance`` options, only those the clone endpoint accepts are used
+    :return: dict - parameters for the clone call
+    :raises ValueError: if the combination can not be cloned
+    """
+    if clone_type not in ("linked", "full", "opportunistic"):
+        raise ValueError("Unknown clone type %s" % clone_type)
+
+    # Only accept parameters that are compatible with the clone endpoint
+    valid_clone_parameters = ["hostname", "pool", "description", "target"]
+    # By default, create a full copy only when the cloned container is not a template
+    create_full_copy = not clone_is_template
+    if storage is not None and clone_is_template:
+        # Cloning a template to another storage needs a full copy
+        create_full_copy = True
+    elif storage is None and not clone_is_template:
+        raise ValueError("Cloned container is not a template, storage needs to be specified.")
+
+    if clone_type == "linked":
+        if not clone_is_template:
+            raise ValueError("'linked' clone type is specified, but cloned container is not a template container.")
+        create_full_copy = False
+    elif clone_type == "full":
+        create_full_copy = True
+
+    parameters = {"full": 1 if create_full_copy else 0}
+    if create_full_copy and storage is not None:
+        parameters["storage"] = storage
+    for param in valid_clone_parameters:
+        if kwargs.get(param) is not None:
+            parameters[param] = kwargs[param]
+    return parameters
 
 
 class Actions(Resources):
-    def __init__(self, proxmox: ProxmoxAPI, info: Info):
-        super().__init__(proxmox)
+    def __init__(self, proxmox: ProxmoxAPI, info: Info, task_waiter: TaskWaiter = None):
+        super().__init__(proxmox, info.snapshot)
         self.info: Info = info
-        self.VZ_TYPE = "openvz" if LooseVersion(self.info.version()) < "4.0" else "lxc"
+        self.task_waiter: TaskWaiter = task_waiter if task_waiter is not None else TaskWaiter(proxmox)
+        capabilities = self.info.capabilities()
+        self.VZ_TYPE = capabilities.vz_type if capabilities is not None else "lxc"
 
     def is_template_container(self, node, vmid):
         """Check if the specified container is a template."""
@@ -27,77 +136,261 @@ class Actions(Resources):
         config = getattr(proxmox_node, self.VZ_TYPE)(vmid).config.get()
         return config.get("template", False)
 
-    def create_instance(self, vmid, node, disk, storage, cpus, memory, swap, timeout, clone, **kwargs):
-        # Version limited features
-        minimum_version = {"tags": "6.1", "timezone": "6.3"}
+    def create_instance(
+        self, vmid, node, disk, storage, cpus, memory, swap, timeout, clone, clone_type="opportunistic", progress=None, **kwargs
+    ):
+        """Create a container, or clone ``clone`` into a new one
+        :param clone_type: str - ``linked``, ``full`` or ``opportunistic``, see ``clone_parameters``
+        :param progress: callable, optional - called with every task log line as it is written
+        :return: bool - the creating task finished successfully
+        """
         proxmox_node = self.proxmox.nodes(node)
 
-        # Remove all empty kwarg entries
-        kwargs = dict((k, v) for k, v in kwargs.items() if v is not None)
+        capabilities = self.info.capabilities(node)
+        if capabilities is None:
+            self.log.error(msg="Unable to determine the Proxmox VE version of node %s" % node)
+            return False
 
-        pve_version = LooseVersion(self.info.version())
+        try:
+            kwargs = instance_options(self.VZ_TYPE, capabilities, cpus, disk, clone, kwargs)
+        except ValueError as e:
+            self.log.error(msg=str(e))
+            return False
 
-        # Fail on unsupported features
-        for option, version in minimum_version.items():
-            if pve_version < LooseVersion(version) and option in kwargs:
-                self.log.error(
-                    msg="Feature {option} is only supported in PVE {version}+, and you're using PVE {pve_version}".format(
-                        option=option, version=version, pve_version=pve_version
-                    )
-                )
+        if clone is not None:
+            try:
+                parameters = clone_parameters(self.is_template_container(node, clone), storage, clone_type, kwargs)
+            except Exception as e:
+                self.log.error(msg="Unable to clone %s: %s" % (clone, e))
                 return False
 
-        if self.VZ_TYPE == "lxc":
-            kwargs["cpulimit"] = cpus
-            kwargs["rootfs"] = disk
-            if "netif" in kwargs:
-                kwargs.update(kwargs["netif"])
-                del kwargs["netif"]
-            if "mounts" in kwargs:
-                kwargs.update(kwargs["mounts"])
-                del kwargs["mounts"]
-            if "pubkey" in kwargs:
-                if self.info.version() >= "4.2":
-                    kwargs["ssh-public-keys"] = kwargs["pubkey"]
-                del kwargs["pubkey"]
+            taskid = getattr(proxmox_node, self.VZ_TYPE)(clone).clone.post(newid=vmid, **parameters)
         else:
-            kwargs["cpus"] = cpus
-            kwargs["disk"] = disk
+            taskid = getattr(proxmox_node, self.VZ_TYPE).create(vmid=vmid, storage=storage, memory=memory, swap=swap, **kwargs)
+        # the new guest shows up in cluster resources as soon as the task is accepted
+        self.snapshot.invalidate()
 
-        # LXC tags are expected to be valid and presented as a comma/semi-colon delimited string
-        if "tags" in kwargs:
-            re_tag = re.compile(r"^[a-z0-9_][a-z0-9_\-\+\.]*$")
-            for tag in kwargs["tags"]:
-                if not re_tag.match(tag):
-                    self.log.error(msg="%s is not a valid tag" % tag)
-                    return False
-            kwargs["tags"] = ",".join(kwargs["tags"])
+        tail = self.task_waiter.tail(taskid, node, timeout=timeout)
+        try:
+            if progress is not None:
+                for line in tail:
+                    progress(line)
+                status = tail.status
+            else:
+                status = self.task_waiter.submit(taskid, node).result(timeout=timeout)
+        except TimeoutError:
+            self.task_waiter.discard(taskid)
+            if tail.last_line is None:
+                try:
+                    tail.read()
+                except Exception as e:
+                    self.log.error(msg="Unable to read log of task %s: %s" % (taskid, e))
+            self.log.error(
+                msg="Reached timeout while waiting for creating VM. Last line in task before timeout: %s" % tail.last_line
+            )
+            return False
 
-        if kwargs.get("ostype") == "auto":
-            kwargs.pop("ostype")
+        if not self.task_waiter.task_ok(status):
+            self.log.error(msg="Task %s on node %s failed: %s" % (taskid, node, status.get("exitstatus")))
+            return False
+        return True
 
-        if clone is not None:
-            if self.VZ_TYPE != "lxc":
-                self.log.error(msg="Clone operator is only supported for LXC enabled proxmox clusters.")
-                return False
+    def _create_from_spec(self, spec) -> OperationResult:
+        start = time.monotonic()
+        try:
+            ok = self.create_instance(**spec)
+            error = None if ok else "Unable to create instance, see log for details"
+        except Exception as e:
+            ok, error = False, str(e)
+        return OperationResult(spec.get("vmid"), spec.get("node"), ok, time.monotonic() - start, error)
+
+    def iter_create_instances(self, specs, max_workers=8, per_node=2):
+        """Create instances in parallel, yielding results as they finish
+        :param specs: iterable of dicts - keyword arguments for ``create_instance``
+        :param max_workers: int - number of instances created at once across the cluster
+        :param per_node: int - number of instances created at once on a single node
+        :return: generator of OperationResult
+        """
+        for _, future in run_per_node(specs, self._create_from_spec, lambda spec: spec.get("node"), max_workers, per_node):
+            yield future.result()
+
+    def create_instances(self, specs, max_workers=8, per_node=2, callback=None) -> BulkSummary:
+        """Create instances in parallel
+        :param specs: iterable of dicts - keyword arguments for ``create_instance``
+        :param callback: callable, optional - called with each OperationResult as it finishes
+        :return: BulkSummary - all results and the overall throughput
+        """
+        summary = BulkSummary()
+        start = time.monotonic()
+        for result in self.iter_create_instances(specs, max_workers, per_node):
+            summary.results.append(result)
+            if callback is not None:
+                callback(result)
+        summary.elapsed = time.monotonic() - start
+        self.log.info(msg="Created instances: %s" % summary)
+        return summary
+
+    def select_guests(self, vmids=None, node=None, pool=None, tags=None) -> list:
+        """Guests in the snapshot matching a selector, see ``lifecycle.select_guests``. QEMU guests are selected as
+        well, ``bulk_lifecycle`` reports them as failed instead of leaving them behind unnoticed.
+        """
+        return select_guests(self.snapshot.vms(), vmids, node, pool, tags)
+
+    def startup_options(self, guests, max_workers=8) -> dict:
+        """Parsed ``startup`` option of every guest, the configs are read concurrently
+        :return: dict - vmid to startup dict, empty for guests whose config could not be read
+        """
+
+        def read(vm):
+            vmid = int(vm["vmid"])
+            try:
+                config = getattr(self.proxmox.nodes(vm["node"]), self.VZ_TYPE)(vmid).config.get()
+                return vmid, parse_startup(config.get("startup"))
+            except Exception as e:
+                self.log.error(msg="Unable to read startup order of %s: %s" % (vmid, e))
+                return vmid, {}
+
+        if not guests:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(guests)))) as pool:
+            return dict(pool.map(read, guests))
+
+    def _lifecycle_call(self, action, vm, params, timeout) -> OperationResult:
+        start = time.monotonic()
+        vmid, node = int(vm["vmid"]), vm["node"]
+        try:
+            guest = getattr(self.proxmox.nodes(node), self.VZ_TYPE)(vmid)
+            if action == MIGRATE:
+                taskid = guest.migrate.post(**params)
+            else:
+                taskid = getattr(guest.status, action).post(**params)
+        except Exception as e:
+            return OperationResult(vmid, node, False, time.monotonic() - start, str(e))
 
-            # clone_is_template = self.is_template_container(node, clone)
-            # TODO: Integrate options back without adopting ansible structure completely
-            clone_parameters = {}
+        try:
+            status = self.task_waiter.submit(taskid, node).result(timeout=timeout)
+        except TimeoutError:
+            self.task_waiter.discard(taskid)
+            error = "Task %s did not finish within %ss" % (taskid, timeout)
+            return OperationResult(vmid, node, False, time.monotonic() - start, error)
+        ok = self.task_waiter.task_ok(status)
+        error = None if ok else "Task %s failed: %s" % (taskid, status.get("exitstatus"))
+        return OperationResult(vmid, node, ok, time.monotonic() - start, error)
 
-            taskid = getattr(proxmox_node, self.VZ_TYPE)(clone).clone.post(newid=vmid, **clone_parameters)
+    def bulk_lifecycle(
+        self,
+        action,
+        guests,
+        params=None,
+        ordered=True,
+        max_workers=8,
+        per_node=4,
+        timeout=300,
+        stop_on_failure=True,
+        callback=None,
+    ) -> BulkSummary:
+        """Start, stop, shut down or migrate many guests, waiting on all their tasks through the task waiter
+        :param action: str - ``start``, ``stop``, ``shutdown`` or ``migrate``
+        :param guests: list of dicts - e.g. from ``select_guests``, guests already in the target status (or on the
+            migration target) are skipped, guests that are not containers are reported as failed as every call goes
+            to the container endpoints
+        :param params: dict, optional - API parameters of every call, e.g. ``target`` for migrate
+        :param ordered: bool - honour the ``startup`` option: guests of the same order run in parallel, one group
+            after another, ascending for start and descending otherwise. Start waits the ``up`` delay after a group,
+            shutdown uses ``down`` as the shutdown timeout of a guest.
+        :param per_node: int - operations running at once on a single (source) node
+        :param timeout: float - seconds a single task may take
+        :param stop_on_failure: bool - once an operation failed, later groups are reported as failed without running
+        :param callback: callable, optional - called with each OperationResult as it finishes
+        :return: BulkSummary
+        """
+        params = dict(params or {})
+        if action in TARGET_STATUS:
+            pending = [vm for vm in guests if vm.get("status") != TARGET_STATUS[action]]
+        elif action == MIGRATE:
+            pending = [vm for vm in guests if vm.get("node") != params.get("target")]
         else:
-            taskid = getattr(proxmox_node, self.VZ_TYPE).create(vmid=vmid, storage=storage, memory=memory, swap=swap, **kwargs)
+            raise ValueError("Unknown lifecycle action %s" % action)
+        unsupported = [vm for vm in pending if vm.get("type", self.VZ_TYPE) != self.VZ_TYPE]
+        pending = [vm for vm in pending if vm.get("type", self.VZ_TYPE) == self.VZ_TYPE]
+
+        startups = self.startup_options(pending, max_workers) if ordered else {}
+        groups = startup_groups(pending, startups, reverse=action != START)
+
+        def guest_params(vm):
+            startup = startups.get(int(vm["vmid"]), {})
+            if action == SHUTDOWN and "down" in startup:
+                return dict({"timeout": startup["down"]}, **params)
+            if action == MIGRATE and vm.get("status") != "running":
+                # restart only applies to running containers
+                return {k: v for k, v in params.items() if k not in ("restart", "timeout")}
+            return params
 
-        while timeout:
-            if self.info.api_task_ok(node, taskid):
-                return True
-            timeout -= 1
-            if timeout == 0:
-                self.log.error(
-                    msg="Reached timeout while waiting for creating VM. Last line in task before timeout: %s"
-                    % proxmox_node.tasks(taskid).log.get()[:1]
+        summary = BulkSummary()
+        start = time.monotonic()
+        for vm in unsupported:
+            # reported, but they did not run and do not stop the containers
+            error = "%s guests are not supported" % vm.get("type")
+            result = OperationResult(int(vm["vmid"]), vm["node"], False, 0.0, error)
+            summary.results.append(result)
+            if callback is not None:
+                callback(result)
+        failed = False
+        for index, group in enumerate(groups):
+            if failed and stop_on_failure:
+                error = "skipped, an earlier group failed"
+                results = [OperationResult(int(vm["vmid"]), vm["node"], False, 0.0, error) for vm in group]
+            else:
+                runs = run_per_node(
+                    group,
+                    lambda vm: self._lifecycle_call(action, vm, guest_params(vm), timeout),
+                    lambda vm: vm["node"],
+                    max_workers,
+                    per_node,
                 )
-                return False
-            time.sleep(1)
-        return False
+                results = (future.result() for _, future in runs)
+            for result in results:
+                failed = failed or not result.ok
+                summary.results.append(result)
+                if callback is not None:
+                    callback(result)
+            finished = len(summary.results) - len(unsupported)
+            self.log.info(msg="%s group %d/%d done, %d of %d guests" % (action, index + 1, len(groups), finished, len(pending)))
+            up = max(startups.get(int(vm["vmid"]), {}).get("up", 0) for vm in group)
+            if action == START and up and index + 1 < len(groups) and not (failed and stop_on_failure):
+                time.sleep(up)
+        if pending:
+            self.snapshot.invalidate()
+        summary.elapsed = time.monotonic() - start
+        self.log.info(msg="%s guests: %s" % (action.capitalize(), summary))
+        return summary
+
+    def start_guests(self, vmids=None, node=None, pool=None, tags=None, **options) -> BulkSummary:
+        """Start the selected guests in startup order, see ``bulk_lifecycle`` for the options"""
+        return self.bulk_lifecycle(START, self.select_guests(vmids, node, pool, tags), **options)
+
+    def stop_guests(self, vmids=None, node=None, pool=None, tags=None, **options) -> BulkSummary:
+        """Stop the selected guests immediately, in reverse startup order"""
+        return self.bulk_lifecycle(STOP, self.select_guests(vmids, node, pool, tags), **options)
+
+    def shutdown_guests(self, vmids=None, node=None, pool=None, tags=None, force=True, **options) -> BulkSummary:
+        """Shut down the selected guests in reverse startup order
+        :param force: bool - stop guests that did not shut down within their timeout
+        """
+        params = dict(options.pop("params", None) or {}, forceStop=1 if force else 0)
+        return self.bulk_lifecycle(SHUTDOWN, self.select_guests(vmids, node, pool, tags), params=params, **options)
+
+    def migrate_guests(self, target, vmids=None, node=None, pool=None, tags=None, restart=True, **options) -> BulkSummary:
+        """Move the selected guests to node ``target``, unordered unless ``ordered`` is given
+        :param restart: bool - shut running containers down, move and start them again, running containers can not
+            be moved otherwise
+        """
+        params = dict(options.pop("params", None) or {}, target=target)
+        if restart:
+            params["restart"] = 1
+        options.setdefault("ordered", False)
+        return self.bulk_lifecycle(MIGRATE, self.select_guests(vmids, node, pool, tags), params=params, **options)
+
+    def evacuate_node(self, node, target, **options) -> BulkSummary:
+        """Move every guest off ``node`` to ``target``, see ``migrate_guests``"""
+        return self.migrate_guests(target, node=node, **options)
@@ -0,0 +1,683 @@
+"""asyncio client for the Proxmox VE API.
+
+Mirrors ``Resources``, ``Info`` and ``Actions`` on top of aiohttp so that many API calls can share one event loop
+instead of a thread per request. ``AsyncProxmoxAPI`` follows the attribute chaining of proxmoxer's ``ProxmoxAPI``,
+e.g. ``await proxmox.nodes(node).tasks(upid).status.get()``.
+"""
+
+import asyncio
+import json
+import logging
+import posixpath
+import time
+from http import client as httplib
+from urllib import parse as urlparse
+
+from proxmoxer.core import AuthenticationError, ResourceException
+
+from proximate_utils.actions import clone_parameters, instance_options
+from proximate_utils.capabilities import Capabilities
+from proximate_utils.coalesce import request_key
+from proximate_utils.limiter import OVERLOAD_STATUS
+from proximate_utils.records import Node, Storage
+from proximate_utils.resources import normalize_volume, storage_pairs
+from proximate_utils.snapshot import ResourceSnapshot
+from proximate_utils.tasks import TaskLogTail, TaskWaiter, new_log_lines, parse_upid
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncProxmoxResource:
+    def __init__(self, api, base_url):
+        self._api = api
+        self._base_url = base_url
+
+    def __repr__(self):
+        return "AsyncProxmoxResource (%s)" % self._base_url
+
+    def __getattr__(self, item):
+        if item.startswith("_"):
+            raise AttributeError(item)
+        return AsyncProxmoxResource(self._api, self._url_join(item))
+
+    def __call__(self, resource_id=None):
+        if resource_id in (None, ""):
+            return self
+
+        if isinstance(resource_id, (bytes, str)):
+            resource_id = resource_id.split("/")
+        elif not isinstance(resource_id, (tuple, list)):
+            resource_id = [str(resource_id)]
+        return AsyncProxmoxResource(self._api, self._url_join(*resource_id))
+
+    def _url_join(self, *args):
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(self._base_url)
+        path = posixpath.join(path or "/", *[str(x) for x in args])
+        return urlparse.urlunsplit([scheme, netloc, path, query, fragment])
+
+    async def get(self, *args, **params):
+        return await self._api.request("GET", self(args)._base_url, params=params)
+
+    async def post(self, *args, **data):
+        return await self._api.request("POST", self(args)._base_url, data=data)
+
+    async def put(self, *args, **data):
+        return await self._api.request("PUT", self(args)._base_url, data=data)
+
+    async def delete(self, *args, **params):
+        return await self._api.request("DELETE", self(args)._base_url, params=params)
+
+    async def create(self, *args, **data):
+        return await self.post(*args, **data)
+
+    async def set(self, *args, **data):
+        return await self.put(*args, **data)
+
+
+class AsyncProxmoxAPI(AsyncProxmoxResource):
+    # number of seconds between renewing access tickets, same as proxmoxer
+    renew_age = 3600
+
+    def __init__(
+        self,
+        host=None,
+        user=None,
+        password=None,
+        token_name=None,
+        token_value=None,
+        port=8006,
+        verify_ssl=True,
+        timeout=5,
+        base_url=None,
+        service="PVE",
+        limit=100,
+        metrics=None,
+        coalesce=True,
+        limiter=None,
+    ):
+        """Connection to a single PVE host
+        :param base_url: str, optional - full API url, e.g. ``http://127.0.0.1:8080/api2/json`` for a local stand-in
+        :param limit: int - maximum number of simultaneous connections
+        :param metrics: ApiMetrics, optional - records every API call
+        :param coalesce: bool - identical GETs issued while one is in flight share its response
+        :param limiter: ApiLimiter, optional - rate and concurrency limits every request waits for
+        """
+        if aiohttp is None:
+            raise ImportError("The asyncio client requires the 'aiohttp' module")
+        if password is None and token_name is None:
+            raise AuthenticationError("No valid authentication credentials were supplied")
+
+        super().__init__(self, base_url or "https://%s:%s/api2/json" % (host, port))
+        self._user = user
+        self._password = password
+        self._token_name = token_name
+        self._token_value = token_value
+        self._verify_ssl = verify_ssl
+        self._timeout = timeout
+        self._service = service
+        self._limit = limit
+        self._metrics = metrics
+        self._coalesce = coalesce
+        self._limiter = limiter
+        self._inflight: dict = {}
+        # requests sent, and GETs that were answered by another caller's request
+        self.requests = 0
+        self.coalesced = 0
+        self._session = None
+        self._ticket = None
+        self._csrf_token = None
+        self._birth_time = None
+        self._login_lock = None
+
+    def __repr__(self):
+        return "AsyncProxmoxAPI (%s)" % self._base_url
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._limit, ssl=None if self._verify_ssl else False)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self._timeout),
+                headers={"accept": "application/json"},
+            )
+            self._login_lock = asyncio.Lock()
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def login(self):
+        """Retrieve a fresh ticket, renewing with the current ticket once we have one"""
+        session = self._get_session()
+        password = self._ticket if self._ticket is not None else self._password
+        async with session.post(
+            self._base_url + "/access/ticket", data={"username": self._user, "password": password}
+        ) as response:
+            if response.status != 200:
+                raise AuthenticationError(
+                    "Couldn't authenticate user: {0} to {1} code: {2}".format(
+                        self._user, self._base_url + "/access/ticket", response.status
+                    )
+                )
+            data = (await response.json(content_type=None))["data"]
+        self._ticket = data["ticket"]
+        self._csrf_token = data["CSRFPreventionToken"]
+        self._birth_time = time.monotonic()
+
+    async def _auth_headers(self, method) -> dict:
+        if self._token_name is not None:
+            return {
+                "Authorization": "%sAPIToken=%s!%s=%s" % (self._service, self._user, self._token_name, self._token_value)
+            }
+
+        if self._ticket is None or time.monotonic() - self._birth_time >= self.renew_age:
+            async with self._login_lock:
+                if self._ticket is None or time.monotonic() - self._birth_time >= self.renew_age:
+                    await self.login()
+
+        headers = {"Cookie": "%sAuthCookie=%s" % (self._service, self._ticket)}
+        # only attach CSRF token if needed (reduce interception risk)
+        if method != "GET":
+            headers["CSRFPreventionToken"] = self._csrf_token
+        return headers
+
+    @staticmethod
+    def _encode(values) -> dict:
+        # passing None values breaks the API and booleans are expected as integers
+        return {k: str(int(v)) if isinstance(v, bool) else str(v) for k, v in (values or {}).items() if v is not None}
+
+    async def request(self, method, url, data=None, params=None):
+        if not self._coalesce or method != "GET":
+            status, reason, content = await self._send(method, url, data, params)
+        else:
+            key = request_key(method, url, params)
+            fetch = self._inflight.get(key)
+            if fetch is None:
+                fetch = self._inflight[key] = asyncio.ensure_future(self._send(method, url, data, params))
+                fetch.add_done_callback(lambda _: self._inflight.pop(key, None))
+            else:
+                self.coalesced += 1
+            # a cancelled caller must not cancel the request the others are waiting for
+            status, reason, content = await asyncio.shield(fetch)
+
+        if status >= 400:
+            raise ResourceException(status, httplib.responses.get(status, ""), reason or content.decode("utf-8", "replace"))
+        # every caller parses its own copy, so coalesced callers never share the returned objects
+        payload = json.loads(content) if content else None
+        return payload.get("data") if payload else None
+
+    async def _send(self, method, url, data=None, params=None) -> tuple:
+        session = self._get_session()
+        headers = await self._auth_headers(method)
+        data = self._encode(data) or None
+        scopes = await self._limiter.acquire_async(url) if self._limiter is not None else None
+        self.requests += 1
+        start = time.perf_counter()
+        try:
+            async with session.request(method, url, params=self._encode(params), data=data, headers=headers) as response:
+                content = await response.read()
+        except Exception as e:
+            if self._metrics is not None:
+                self._metrics.observe(method, url, time.perf_counter() - start, error=e)
+            if scopes is not None:
+                self._limiter.release(scopes, time.perf_counter() - start, overload=True)
+            raise
+        if scopes is not None:
+            self._limiter.release(scopes, time.perf_counter() - start, response.status in OVERLOAD_STATUS)
+        if self._metrics is not None:
+            self._metrics.observe(
+                method,
+                url,
+                time.perf_counter() - start,
+                status=response.status,
+                request_bytes=len(urlparse.urlencode(data or {})),
+                response_bytes=len(content),
+            )
+        return response.status, response.reason, content
+
+
+class AsyncResourceSnapshot(ResourceSnapshot):
+    """``ResourceSnapshot`` that fetches through an ``AsyncProxmoxAPI``"""
+
+    def __init__(self, proxmox: AsyncProxmoxAPI, ttl: float = ResourceSnapshot.ttl):
+        super().__init__(proxmox, ttl)
+        self._refresh_lock = None
+
+    async def refresh(self) -> list:
+        return self.load(await self.proxmox.cluster.resources.get(type="vm"))
+
+    async def _ensure_fresh(self):
+        if not self.stale:
+            return
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            # another coroutine may have refreshed while we waited on the lock
+            if self.stale:
+                await self.refresh()
+
+    async def vms(self) -> list:
+        await self._ensure_fresh()
+        return list(self._vms)
+
+    async def by_vmid(self, vmid):
+        await self._ensure_fresh()
+        return self._by_vmid.get(int(vmid))
+
+    async def by_name(self, name) -> list:
+        await self._ensure_fresh()
+        return list(self._by_name.get(name, []))
+
+    async def by_node(self, node) -> list:
+        await self._ensure_fresh()
+        return list(self._by_node.get(node, []))
+
+    async def by_pool(self, pool) -> list:
+        await self._ensure_fresh()
+        return list(self._by_pool.get(pool, []))
+
+
+class AsyncTaskLogTail:
+    """asyncio counterpart of ``TaskLogTail``, iterate with ``async for``"""
+
+    limit: int = TaskLogTail.limit
+
+    def __init__(self, waiter: "AsyncTaskWaiter", upid, node=None, timeout=None, start=0):
+        self.waiter = waiter
+        self.upid = upid
+        self.node = node or parse_upid(upid).get("node")
+        if self.node is None:
+            raise ValueError("Unable to determine the node of task %s" % upid)
+        self.timeout = timeout
+        self.offset = start
+        self.last_line = None
+        self.status = None
+
+    async def read(self) -> list:
+        log = self.waiter.proxmox.nodes(self.node).tasks(self.upid).log
+        lines = []
+        while True:
+            entries = await log.get(start=self.offset, limit=self.limit)
+            new = new_log_lines(entries, self.offset)
+            if new:
+                self.offset = int(new[-1]["n"])
+                lines.extend(entry.get("t", "") for entry in new)
+            if not new or len(entries) < self.limit:
+                break
+        if lines:
+            self.last_line = lines[-1]
+        return lines
+
+    async def __aiter__(self):
+        waiter = self.waiter
+        future = waiter.submit(self.upid, self.node)
+        loop = asyncio.get_running_loop()
+        deadline = None if self.timeout is None else loop.time() + self.timeout
+        interval = waiter.min_interval
+        while True:
+            finished = future.done()
+            try:
+                lines = await self.read()
+            except Exception as e:
+                waiter.log.error(msg="Unable to read log of task %s: %s" % (self.upid, e))
+                lines = []
+            for line in lines:
+                yield line
+            if finished:
+                self.status = future.result()
+                return
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                waiter.discard(self.upid)
+                raise TimeoutError("Task %s did not finish within %ss" % (self.upid, self.timeout))
+            interval = waiter.min_interval if lines else min(interval * waiter.backoff, waiter.max_interval)
+            await asyncio.wait([future], timeout=interval if remaining is None else min(interval, remaining))
+
+
+class AsyncTaskWaiter:
+    """asyncio counterpart of ``TaskWaiter``, polling every node with pending tasks concurrently"""
+
+    def __init__(
+        self,
+        proxmox: AsyncProxmoxAPI,
+        min_interval: float = TaskWaiter.min_interval,
+        max_interval: float = TaskWaiter.max_interval,
+        backoff: float = TaskWaiter.backoff,
+    ):
+        self.proxmox = proxmox
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.log: logging.Logger = logging.getLogger("TaskWaiter")
+        self._pending: dict = {}
+        self._wakeup = None
+        self._interval = min_interval
+        self._runner = None
+
+    task_ok = staticmethod(TaskWaiter.task_ok)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def submit(self, upid, node=None) -> asyncio.Future:
+        node = node or parse_upid(upid).get("node")
+        if node is None:
+            raise ValueError("Unable to determine the node of task %s" % upid)
+
+        loop = asyncio.get_running_loop()
+        entry = self._pending.get(upid)
+        if entry is None:
+            entry = {"node": node, "future": loop.create_future(), "starttime": parse_upid(upid).get("starttime")}
+            self._pending[upid] = entry
+        self._interval = self.min_interval
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._runner is None or self._runner.done():
+            self._runner = loop.create_task(self._run())
+        return entry["future"]
+
+    async def wait(self, upid, node=None, timeout=None) -> bool:
+        try:
+            return self.task_ok(await asyncio.wait_for(asyncio.shield(self.submit(upid, node)), timeout))
+        except asyncio.TimeoutError:
+            self.discard(upid)
+            return False
+
+    def tail(self, upid, node=None, timeout=None) -> AsyncTaskLogTail:
+        return AsyncTaskLogTail(self, upid, node, timeout)
+
+    def discard(self, upid):
+        entry = self._pending.pop(upid, None)
+        if entry is not None:
+            entry["future"].cancel()
+
+    async def poll(self) -> int:
+        by_node = {}
+        for upid, entry in self._pending.items():
+            by_node.setdefault(entry["node"], {})[upid] = entry
+
+        finished = 0
+        results = await asyncio.gather(*[self._poll_node(node, entries) for node, entries in by_node.items()])
+        for statuses in results:
+            for upid, status in statuses.items():
+                entry = self._pending.pop(upid, None)
+                if entry is not None and not entry["future"].done():
+                    entry["future"].set_result(status)
+                    finished += 1
+        return finished
+
+    async def _poll_node(self, node, entries) -> dict:
+        starttimes = [entry["starttime"] for entry in entries.values() if entry["starttime"] is not None]
+        since = min(starttimes) if len(starttimes) == len(entries) else None
+        try:
+            tasks = await self.proxmox.nodes(node).tasks.get(source="all", since=since, limit=TaskWaiter.limit)
+        except Exception as e:
+            self.log.error(msg="Unable to retrieve task list from node %s: %s" % (node, e))
+            return {}
+
+        finished = {}
+        for task in tasks:
+            upid = task.get("upid")
+            if upid in entries and task.get("endtime") is not None:
+                finished[upid] = dict(task, status="stopped", exitstatus=task.get("status"))
+
+        # entries beyond the list limit need an individual status call
+        if len(tasks) >= TaskWaiter.limit:
+            for upid in entries.keys() - finished.keys() - {task.get("upid") for task in tasks}:
+                try:
+                    status = await self.proxmox.nodes(node).tasks(upid).status.get()
+                except Exception as e:
+                    self.log.error(msg="Unable to retrieve API task ID from node %s: %s" % (node, e))
+                    continue
+                if status.get("status") == "stopped":
+                    finished[upid] = status
+        return finished
+
+    async def _run(self):
+        while self._pending:
+            self._wakeup.clear()
+            if await self.poll():
+                self._interval = self.min_interval
+            else:
+                self._interval = min(self._interval * self.backoff, self.max_interval)
+            if self._pending:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._interval)
+                except asyncio.TimeoutError:
+                    pass
+
+
+class AsyncResources:
+    def __init__(self, proxmox: AsyncProxmoxAPI, snapshot: AsyncResourceSnapshot = None):
+        self.proxmox = proxmox
+        self.snapshot: AsyncResourceSnapshot = snapshot if snapshot is not None else AsyncResourceSnapshot(proxmox)
+        self.log: logging.Logger = logging.getLogger("Resources")
+
+    async def get_nodes(self):
+        try:
+            return Node.from_payloads(await self.proxmox.nodes.get())
+        except Exception as e:
+            self.log.error(msg="Unable to retrieve Proxmox VE nodes: %s" % e)
+
+    async def get_node(self, node):
+        try:
+            return Node.from_payload([n for n in await self.proxmox.nodes.get() if n["node"] == node][0])
+        except Exception as e:
+            self.log.error(msg="Unable to retrieve Proxmox VE node: %s" % e)
+
+    async def get_vms(self) -> list:
+        return await self.snapshot.vms()
+
+    async def get_vm(self, vmid, ignore_missing=False):
+        try:
+            vm = await self.snapshot.by_vmid(vmid)
+        except Exception as e:
+            vm = None
+            self.log.error(msg="Unable to retrieve list of VMs filtered by vmid %s: %s" % (vmid, e))
+        if vm:
+            return vm
+        else:
+            if ignore_missing:
+                return None
+            self.log.error(msg="VM with vmid %s does not exist in cluster" % vmid)
+
+    async def get_pools(self):
+        try:
+            return await self.proxmox.pools.get()
+        except Exception as e:
+            self.log.error(msg="Unable to retrieve pools: %s" % e)
+
+    async def get_pool(self, poolid):
+        try:
+            return await self.proxmox.pools(poolid).get()
+        except Exception as e:
+            self.log.error(msg="Unable to retrieve pool %s information: %s" % (poolid, e))
+
+    async def get_storages(self, type):
+        try:
+            return Storage.from_payloads(await self.proxmox.storage.get(type=type))
+        except Exception as e:
+            self.log.error(msg="Unable to retrieve storages information with type %s: %s" % (type, e))
+
+    async def get_storage_content(self, node, storage, content=None, vmid=None):
+        try:
+            return await self.proxmox.nodes(node).storage(storage).content().get(content=content, vmid=vmid)
+        except Exception as e:
+            self.log.error(msg="Unable to list content on %s, %s for %s and %s: %s" % (node, storage, content, vmid, e))
+
+    async def iter_storage_content(self, content=None, vmid=None, shared_once=True, max_workers=8):
+        """Async generator counterpart of ``Resources.iter_storage_content``"""
+        nodes, storages = await asyncio.gather(self.get_nodes(), self.get_storages(None))
+        if nodes is None or storages is None:
+            return
+        types = None if content is None or isinstance(content, str) else set(content)
+        query = content if types is None else None
+        limit = asyncio.Semaphore(max(1, max_workers))
+
+        async def listing(node, storage):
+            async with limit:
+                return node, storage, await self.get_storage_content(node, storage, query, vmid)
+
+        tasks = [asyncio.ensure_future(listing(node, storage)) for node, storage in storage_pairs(nodes, storages, shared_once)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                node, storage, volumes = await next_done
+                for volume in volumes or ():
+                    if types is None or volume.get("content") in types:
+                        yield normalize_volume(node, storage, volume)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+class AsyncInfo(AsyncResources):
+    def __init__(self, proxmox: AsyncProxmoxAPI, snapshot: AsyncResourceSnapshot = None):
+        super().__init__(proxmox, snapshot)
+        self._capabilities: dict = {}
+
+    async def version(self):
+        try:
+            return await self.proxmox.version.get()
+        except Exception as e:
+            self.log.error(msg="Unable to retrieve Proxmox VE version: %s" % e)
+
+    async def node_version(self, node):
+        try:
+            return await self.proxmox.nodes(node).version.get()
+        except Exception as e:
+            self.log.error(msg="Unable to retrieve Proxmox VE version of node %s: %s" % (node, e))
+
+    async def capabilities(self, node=None) -> Capabilities:
+        if node not in self._capabilities:
+            version = await self.version() if node is None else await self.node_version(node)
+            if version is None:
+                return None
+            self._capabilities[node] = Capabilities(version)
+        return self._capabilities[node]
+
+    def invalidate_capabilities(self, node=None):
+        if node is None:
+            self._capabilities.clear()
+        else:
+            self._capabilities.pop(node, None)
+
+    async def get_nextvmid(self):
+        try:
+            return await self.proxmox.cluster.nextid.get()
+        except Exception as e:
+            self.log.error(msg="Unable to retrieve next free vmid: %s" % e)
+
+    async def get_vmid(self, name, ignore_missing=False):
+        vms = []
+        try:
+            vms = [vm["vmid"] for vm in await self.snapshot.by_name(name)]
+        except Exception as e:
+            vms = None
+            self.log.error(msg="Unable to retrieve list of VMs filtered by name %s: %s" % (name, e))
+        if not vms:
+            if ignore_missing:
+                return None
+            self.log.error(msg="No VM with name %s found" % name)
+        elif len(vms) > 1:
+            self.log.error(msg="Multiple VMs with name %s found, provide vmid instead" % name)
+        else:
+            return vms[0]
+
+    async def api_task_ok(self, node, taskid):
+        try:
+            status = await self.proxmox.nodes(node).tasks(taskid).status.get()
+            return status["status"] == "stopped" and status["exitstatus"] == "OK"
+        except Exception as e:
+            self.log.error(msg="Unable to retrieve API task ID from node %s: %s" % (node, e))
+
+
+class AsyncActions(AsyncResources):
+    def __init__(self, proxmox: AsyncProxmoxAPI, info: AsyncInfo, task_waiter: AsyncTaskWaiter = None):
+        super().__init__(proxmox, info.snapshot)
+        self.info: AsyncInfo = info
+        self.task_waiter: AsyncTaskWaiter = task_waiter if task_waiter is not None else AsyncTaskWaiter(proxmox)
+        self.VZ_TYPE = None
+
+    async def vz_type(self) -> str:
+        if self.VZ_TYPE is None:
+            capabilities = await self.info.capabilities()
+            self.VZ_TYPE = capabilities.vz_type if capabilities is not None else "lxc"
+        return self.VZ_TYPE
+
+    async def is_template_container(self, node, vmid):
+        """Check if the specified container is a template."""
+        proxmox_node = self.proxmox.nodes(node)
+        config = await getattr(proxmox_node, await self.vz_type())(vmid).config.get()
+        return config.get("template", False)
+
+    async def create_instance(
+        self, vmid, node, disk, storage, cpus, memory, swap, timeout, clone, clone_type="opportunistic", progress=None, **kwargs
+    ):
+        """Create a container, or clone ``clone`` into a new one, like ``Actions.create_instance``
+        :param clone_type: str - ``linked``, ``full`` or ``opportunistic``, see ``clone_parameters``
+        :param progress: callable, optional - called with every task log line as it is written
+        :return: bool - the creating task finished successfully
+        """
+        proxmox_node = self.proxmox.nodes(node)
+        vz_type = await self.vz_type()
+
+        capabilities = await self.info.capabilities(node)
+        if capabilities is None:
+            self.log.error(msg="Unable to determine the Proxmox VE version of node %s" % node)
+            return False
+
+        try:
+            kwargs = instance_options(vz_type, capabilities, cpus, disk, clone, kwargs)
+        except ValueError as e:
+            self.log.error(msg=str(e))
+            return False
+
+        if clone is not None:
+            try:
+                parameters = clone_parameters(await self.is_template_container(node, clone), storage, clone_type, kwargs)
+            except Exception as e:
+                self.log.error(msg="Unable to clone %s: %s" % (clone, e))
+                return False
+
+            taskid = await getattr(proxmox_node, vz_type)(clone).clone.post(newid=vmid, **parameters)
+        else:
+            taskid = await getattr(proxmox_node, vz_type).create(vmid=vmid, storage=storage, memory=memory, swap=swap, **kwargs)
+        # the new guest shows up in cluster resources as soon as the task is accepted
+        self.snapshot.invalidate()
+
+        tail = self.task_waiter.tail(taskid, node, timeout=timeout)
+        try:
+            if progress is not None:
+                async for line in tail:
+                    progress(line)
+                status = tail.status
+            else:
+                status = await asyncio.wait_for(self.task_waiter.submit(taskid, node), timeout)
+        except (asyncio.TimeoutError, TimeoutError):
+            self.task_waiter.discard(taskid)
+            if tail.last_line is None:
+                try:
+                    await tail.read()
+                except Exception as e:
+                    self.log.error(msg="Unable to read log of task %s: %s" % (taskid, e))
+            self.log.error(
+                msg="Reached timeout while waiting for creating VM. Last line in task before timeout: %s" % tail.last_line
+            )
+            return False
+
+        if not self.task_waiter.task_ok(status):
+            self.log.error(msg="Task %s on node %s failed: %s" % (taskid, node, status.get("exitstatus")))
+            return False
+        return True
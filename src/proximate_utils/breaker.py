@@ -0,0 +1,147 @@
+"""Per-node circuit breaking and retries for Proxmox VE API calls.
+
+``NodeBreaker`` is a request layer (see ``session.install_layer``) keeping one ``CircuitBreaker`` per node (and one
+for cluster wide endpoints). After ``failure_threshold`` consecutive failures (connection errors, timeouts and
+gateway or proxy statuses) the circuit opens and every call to that node raises ``CircuitOpenError`` at once
+instead of waiting out the connection timeout. After ``reset_timeout`` seconds a single half-open probe is let
+through, its success closes the circuit again. Idempotent GETs are retried with jittered exponential backoff while
+the circuit stays closed. Application errors such as a missing config file (PVE answers those with 500) say nothing
+about the node and are neither retried nor counted. Install it on a session without adapter retries
+(``SessionConfig(retries=0)``, as ``ProximateUtils.connection_config`` does), urllib3 would otherwise retry every
+attempt itself before the breaker sees the failure.
+"""
+
+import logging
+import random
+import threading
+import time
+
+from proximate_utils.limiter import node_of
+
+# gateway statuses, and the 595 and 596 pveproxy answers when it can not reach the node a request is proxied to
+FAILURE_STATUS = (502, 503, 504, 595, 596)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(ConnectionError):
+    """A call was refused because its node recently failed, ``retry_after`` is the number of seconds until probing"""
+
+    def __init__(self, scope, retry_after):
+        super().__init__("Circuit for %s is open, retry in %.1fs" % (scope, retry_after))
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, scope, failure_threshold=5, reset_timeout=30.0):
+        """
+        :param scope: str - node name, or ``cluster`` for cluster wide endpoints
+        :param failure_threshold: int - consecutive failures that open the circuit
+        :param reset_timeout: float - seconds the circuit stays open before a probe is let through
+        """
+        self.scope = scope
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Admit a call
+        :raises CircuitOpenError: if the circuit is open, or half-open with the probe still running
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state == OPEN and remaining <= 0:
+                # this call is the probe, everyone else keeps failing fast until it reports back
+                self.state = HALF_OPEN
+                return
+            self.rejected += 1
+            raise CircuitOpenError(self.scope, max(0.0, remaining))
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.state, self.failures = CLOSED, 0
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "opened": self.opened, "rejected": self.rejected}
+
+
+class NodeBreaker:
+    # scope name of cluster wide endpoints in ``stats``
+    CLUSTER = "cluster"
+    # only idempotent calls are retried
+    retry_methods = ("GET",)
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, retries=2, backoff=0.2, max_backoff=5.0):
+        """
+        :param failure_threshold: int - consecutive failures of a node that open its circuit
+        :param reset_timeout: float - seconds until an open circuit lets a probe through
+        :param retries: int - additional attempts of a failed GET
+        :param backoff: float - base of the exponential backoff between attempts, each sleep is drawn uniformly
+            between zero and ``backoff * 2 ** attempt`` capped at ``max_backoff``
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retried = 0
+        self.log: logging.Logger = logging.getLogger("NodeBreaker")
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def breaker(self, url) -> CircuitBreaker:
+        scope = node_of(url) or self.CLUSTER
+        breaker = self._breakers.get(scope)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(scope, CircuitBreaker(scope, self.failure_threshold, self.reset_timeout))
+        return breaker
+
+    def delay(self, attempt) -> float:
+        """Seconds to sleep before retry ``attempt`` (0 based), full jitter spreads out clients retrying together"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def __call__(self, request, method, url, **kwargs):
+        breaker = self.breaker(url)
+        attempts = 1 + (self.retries if method.upper() in self.retry_methods else 0)
+        for attempt in range(attempts):
+            if attempt:
+                self.retried += 1
+                time.sleep(self.delay(attempt - 1))
+            breaker.allow()
+            try:
+                response = request(method, url, **kwargs)
+            except Exception as e:
+                breaker.record(False)
+                if attempt + 1 == attempts:
+                    raise
+                self.log.debug(msg="Retrying %s %s after %s" % (method, url, e))
+                continue
+            failed = response.status_code in FAILURE_STATUS
+            breaker.record(not failed)
+            if not failed or attempt + 1 == attempts:
+                return response
+            self.log.debug(msg="Retrying %s %s after status %s" % (method, url, response.status_code))
+
+    def stats(self) -> dict:
+        """Scope (``cluster`` or node name) to state, consecutive failures, times opened and calls rejected"""
+        return {scope: breaker.stats() for scope, breaker in sorted(self._breakers.items())}
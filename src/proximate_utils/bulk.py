@@ -0,0 +1,74 @@
+"""Bulk operations for the Proxmoxer API.
+
+Runs many independent API operations on a worker pool while capping how many run at once on any single node
+and across the cluster.
+"""
+
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+
+@dataclass
+class OperationResult:
+    vmid: int
+    node: str
+    ok: bool
+    elapsed: float
+    error: str = None
+
+
+@dataclass
+class BulkSummary:
+    results: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def succeeded(self) -> int:
+        return sum(1 for result in self.results if result.ok)
+
+    @property
+    def failed(self) -> int:
+        return len(self.results) - self.succeeded
+
+    @property
+    def throughput(self) -> float:
+        """Completed operations per minute"""
+        return len(self.results) * 60 / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return "%d succeeded, %d failed in %.1fs (%.1f/min)" % (self.succeeded, self.failed, self.elapsed, self.throughput)
+
+
+def run_per_node(items, fn, node_of, max_workers=8, per_node=2):
+    """Run ``fn`` for every item, yielding ``(item, future)`` pairs as they finish
+    :param items: iterable - work items
+    :param fn: callable - called with a single item on a worker thread
+    :param node_of: callable - returns the node an item runs on
+    :param max_workers: int - cluster wide concurrency cap
+    :param per_node: int - concurrency cap per node
+    """
+    queue = deque(items)
+    running = {}
+    per_node_running = Counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while queue or running:
+            # schedule everything whose node has a free slot, keeping the original order otherwise
+            deferred = deque()
+            while queue and len(running) < max_workers:
+                item = queue.popleft()
+                node = node_of(item)
+                if per_node_running[node] >= per_node:
+                    deferred.append(item)
+                    continue
+                per_node_running[node] += 1
+                running[executor.submit(fn, item)] = (item, node)
+            deferred.extend(queue)
+            queue = deferred
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                item, node = running.pop(future)
+                per_node_running[node] -= 1
+                yield item, future
@@ -0,0 +1,45 @@
+"""Feature capabilities of Proxmox VE versions.
+
+Each PVE version is parsed once into a table of supported features so that actions can gate options with a
+dict lookup instead of re-reading and re-parsing ``/version`` on every call.
+"""
+
+from proximate_utils.version import LooseVersion
+
+# Minimum PVE version for each version limited feature
+MINIMUM_VERSION = {
+    "lxc": "4.0",
+    "ssh-public-keys": "4.2",
+    "tags": "6.1",
+    "timezone": "6.3",
+}
+
+
+class Capabilities:
+    def __init__(self, version):
+        """Build the feature table for a PVE version
+        :param version: str or dict - version string or the payload returned by the ``version`` endpoint
+        """
+        self.version: str = self.version_string(version)
+        self.pve_version: LooseVersion = LooseVersion(self.version)
+        self.features: dict = {
+            feature: self.pve_version >= LooseVersion(minimum) for feature, minimum in MINIMUM_VERSION.items()
+        }
+        self.vz_type: str = "lxc" if self.features["lxc"] else "openvz"
+
+    def __repr__(self):
+        return "Capabilities ('%s')" % self.version
+
+    @staticmethod
+    def version_string(version) -> str:
+        if isinstance(version, dict):
+            return str(version["version"])
+        return str(version)
+
+    @staticmethod
+    def minimum_version(feature):
+        return MINIMUM_VERSION.get(feature)
+
+    def supports(self, feature) -> bool:
+        """Features without a version limit are always supported"""
+        return self.features.get(feature, True)
@@ -0,0 +1,61 @@
+"""Single-flight coalescing of identical concurrent reads.
+
+``SingleFlight`` is a request layer (see ``session.install_layer``): while a GET for a url and query is in flight,
+every identical GET from another thread waits for it and receives the same response instead of sending its own
+request. proxmoxer parses the shared response body separately for each caller, so callers never share the
+returned objects. Requests are only coalesced while in flight, nothing is cached afterwards.
+"""
+
+import threading
+from concurrent.futures import Future
+
+
+def request_key(method, url, params=None) -> tuple:
+    """Identity of a request, query parameters in any order and ``None`` values (dropped on send) are equivalent"""
+    params = tuple(sorted((str(k), str(v)) for k, v in (params or {}).items() if v is not None))
+    return method.upper(), str(url), params
+
+
+class SingleFlight:
+    # only idempotent reads are shared
+    methods = ("GET",)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: dict = {}
+        # requests sent, and calls that were answered by another caller's request
+        self.requests = 0
+        self.coalesced = 0
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def __call__(self, request, method, url, **kwargs):
+        if method.upper() not in self.methods:
+            return request(method, url, **kwargs)
+
+        key = request_key(method, url, kwargs.get("params"))
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = Future()
+                self.requests += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return call.result()
+
+        try:
+            response = request(method, url, **kwargs)
+            # read the body here, so waiting threads do not race on the stream
+            response.content
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        call.set_result(response)
+        return response
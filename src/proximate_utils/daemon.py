@@ -0,0 +1,333 @@
+"""Local daemon serving ``Info``, ``Resources`` and ``Actions`` over a Unix socket.
+
+``ProximateDaemon`` keeps one ``ProximateUtils`` alive: the secrets store is unlocked, the session logged in and the
+resource snapshot and capabilities warm for as long as it runs. ``DaemonClient`` forwards method calls to it as
+newline delimited JSON, ``open_utils`` returns a client when a daemon is listening and a plain ``ProximateUtils``
+otherwise, so a command line tool is written once against ``.info``, ``.resources`` and ``.actions``.
+
+Only the standard library is imported here, a client does not pay for proxmoxer or pykeepass.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import inspect
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from proximate_utils.records import Record
+
+if TYPE_CHECKING:
+    from proximate_utils.main import ProximateUtils
+
+# read-only calls every component offers
+_READS = (
+    "get_nodes",
+    "get_node",
+    "get_cluster_health",
+    "get_vms",
+    "get_vm",
+    "get_pools",
+    "get_pool",
+    "get_storages",
+    "get_storage_content",
+)
+# components of ProximateUtils a client may call into and the methods it may call, anything taking callables or
+# returning generators (``watch``, ``iter_*``, ``bulk_lifecycle``) can not be served over JSON
+METHODS = {
+    "info": _READS
+    + (
+        "version",
+        "node_version",
+        "capabilities",
+        "invalidate_capabilities",
+        "package_versions",
+        "version_drift",
+        "get_nextvmid",
+        "get_vmid",
+        "api_task_ok",
+    ),
+    "resources": _READS,
+    "actions": _READS
+    + (
+        "is_template_container",
+        "create_instance",
+        "create_instances",
+        "select_guests",
+        "start_guests",
+        "stop_guests",
+        "shutdown_guests",
+        "migrate_guests",
+        "evacuate_node",
+    ),
+}
+TARGETS = tuple(METHODS)
+
+
+class DaemonError(Exception):
+    """An exception raised by the daemon while running a call, ``type`` is the name of the original exception"""
+
+    def __init__(self, type, message):
+        super().__init__("%s: %s" % (type, message))
+        self.type = type
+
+
+def default_socket_path() -> Path:
+    from proximate_utils.main import ProximateUtils
+
+    return ProximateUtils.socket_path
+
+
+def encode(value):
+    """JSON fallback for results, dataclasses and records become dicts and anything else unknown its string form"""
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if isinstance(value, Record):
+        return value.as_dict()
+    if isinstance(value, (set, frozenset, tuple)) or inspect.isgenerator(value):
+        return list(value)
+    return str(value)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write(self.server.owner.dispatch(line) + b"\n")
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ProximateDaemon:
+    def __init__(self, utils: ProximateUtils = None, path=None):
+        """
+        :param utils: ProximateUtils, optional - components to serve, created with defaults when omitted
+        :param path: Path, optional - socket location, ``ProximateUtils.socket_path`` when omitted
+        """
+        if utils is None:
+            from proximate_utils.main import ProximateUtils
+
+            utils = ProximateUtils()
+        self.utils = utils
+        self.path = Path(path) if path is not None else default_socket_path()
+        self.log: logging.Logger = logging.getLogger("ProximateDaemon")
+        self.requests = 0
+        self.started = None
+        self._server = None
+        self._thread = None
+
+    def warm_up(self):
+        """Log in and fill the resource snapshot and capabilities before the first call arrives"""
+        self.utils.snapshot.vms()
+        self.utils.info.capabilities()
+
+    def _call(self, target, method, args, kwargs):
+        if target == "daemon" and method == "ping":
+            return {"pid": os.getpid(), "uptime": time.monotonic() - self.started, "requests": self.requests}
+        if target not in TARGETS:
+            raise ValueError("Unknown target %s" % target)
+        if method not in METHODS[target]:
+            raise ValueError("%s.%s is not served by the daemon" % (target, method))
+        function = getattr(getattr(self.utils, target), method)
+        if inspect.isgeneratorfunction(function):
+            raise ValueError("%s.%s returns a generator" % (target, method))
+        result = function(*args, **kwargs)
+        if inspect.isgenerator(result):
+            # may never end, e.g. ``watch``, and the client can not iterate over the socket
+            result.close()
+            raise ValueError("%s.%s returns a generator" % (target, method))
+        return result
+
+    def dispatch(self, line: bytes) -> bytes:
+        """Run one encoded call
+        :param line: bytes - JSON object with ``target``, ``method`` and optionally ``args`` and ``kwargs``
+        :return: bytes - JSON object with either ``result`` or ``error`` (``type`` and ``message``)
+        """
+        self.requests += 1
+        try:
+            request = json.loads(line)
+            result = self._call(request["target"], request["method"], request.get("args", ()), request.get("kwargs", {}))
+            return json.dumps({"result": result}, default=encode).encode("utf-8")
+        except Exception as e:
+            self.log.error(msg="Call %s failed: %s" % (line[:200], e))
+            return json.dumps({"error": {"type": type(e).__name__, "message": str(e)}}).encode("utf-8")
+
+    def start(self, warm=True) -> "ProximateDaemon":
+        """Listen on the socket and serve calls on a background thread
+        :param warm: bool - log in and fill the caches before accepting calls
+        :raises RuntimeError: if another daemon is already listening on the socket
+        """
+        if warm:
+            self.warm_up()
+        if self.path.exists():
+            if DaemonClient(self.path).available():
+                raise RuntimeError("A daemon is already listening on %s" % self.path)
+            # left behind by a daemon that did not shut down cleanly
+            self.path.unlink()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # the socket is created by bind, never let it exist with the default permissions
+        umask = os.umask(0o177)
+        try:
+            self._server = _Server(str(self.path), _Handler)
+        finally:
+            os.umask(umask)
+        self._server.owner = self
+        self.started = time.monotonic()
+        self._thread = threading.Thread(target=self._server.serve_forever, name="ProximateDaemon", daemon=True)
+        self._thread.start()
+        self.log.info(msg="Listening on %s" % self.path)
+        return self
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server, self._thread = None, None
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def serve_forever(self, warm=True):
+        """Run in the foreground until interrupted"""
+        self.start(warm)
+        try:
+            self._thread.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _Target:
+    def __init__(self, client: "DaemonClient", name: str):
+        self._client = client
+        self._name = name
+
+    def __getattr__(self, method):
+        if method.startswith("_"):
+            raise AttributeError(method)
+
+        def call(*args, **kwargs):
+            return self._client.call(self._name, method, *args, **kwargs)
+
+        call.__name__ = method
+        return call
+
+
+class DaemonClient:
+    def __init__(self, path=None, timeout: float = 300.0):
+        """
+        :param path: Path, optional - socket location, ``ProximateUtils.socket_path`` when omitted
+        :param timeout: float - seconds to wait for a single call
+        """
+        self.path = Path(path) if path is not None else default_socket_path()
+        self.timeout = timeout
+        self._socket = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name in TARGETS:
+            return _Target(self, name)
+        raise AttributeError(name)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(str(self.path))
+        except OSError:
+            sock.close()
+            raise
+        self._socket, self._reader = sock, sock.makefile("rb")
+
+    def close(self):
+        with self._lock:
+            if self._socket is not None:
+                self._reader.close()
+                self._socket.close()
+                self._socket, self._reader = None, None
+
+    def available(self) -> bool:
+        """A daemon is listening on the socket"""
+        try:
+            self.ping()
+            return True
+        except (OSError, ValueError, DaemonError):
+            self.close()
+            return False
+
+    def ping(self) -> dict:
+        """pid, uptime and number of calls served by the daemon"""
+        return self.call("daemon", "ping")
+
+    def call(self, target, method, *args, **kwargs):
+        """Run ``target.method(*args, **kwargs)`` in the daemon
+        :return: the result as decoded JSON, dataclasses arrive as dicts
+        :raises DaemonError: if the call raised in the daemon
+        :raises OSError: if the daemon is not reachable
+        """
+        request = json.dumps({"target": target, "method": method, "args": args, "kwargs": kwargs}).encode("utf-8")
+        with self._lock:
+            if self._socket is None:
+                self._connect()
+            try:
+                self._socket.sendall(request + b"\n")
+                line = self._reader.readline()
+            except OSError:
+                self._socket.close()
+                self._socket, self._reader = None, None
+                raise
+            if not line:
+                self._socket.close()
+                self._socket, self._reader = None, None
+                raise ConnectionError("Daemon on %s closed the connection" % self.path)
+        response = json.loads(line)
+        if "error" in response:
+            raise DaemonError(response["error"]["type"], response["error"]["message"])
+        return response["result"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_utils(path=None, **kwargs):
+    """Use the daemon when it is running
+    :param path: Path, optional - socket location, ``ProximateUtils.socket_path`` when omitted
+    :param kwargs: passed to ``ProximateUtils`` when no daemon is listening
+    :return: DaemonClient or ProximateUtils - both offer ``info``, ``resources`` and ``actions``
+    """
+    client = DaemonClient(path)
+    if client.available():
+        return client
+    from proximate_utils.main import ProximateUtils
+
+    return ProximateUtils(**kwargs)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    ProximateDaemon().serve_forever()
@@ -0,0 +1,80 @@
+"""Package version drift across cluster nodes.
+
+Compares the installed package versions of all nodes in one pass. Every distinct version string is turned into a
+``version_key`` once, so a report over hundreds of packages and many nodes compares tuples instead of re-parsing
+version strings.
+"""
+
+from dataclasses import dataclass, field
+
+from proximate_utils.version import version_key
+
+
+def installed_versions(apt_versions) -> dict:
+    """Reduce a ``nodes/{node}/apt/versions`` payload to package name -> installed version
+    :param apt_versions: list of dicts - entries with ``Package``, ``Version`` and optionally ``OldVersion`` and
+        ``CurrentState``, packages that are not installed are skipped
+    """
+    versions = {}
+    for entry in apt_versions or ():
+        if entry.get("CurrentState", "Installed") != "Installed":
+            continue
+        # OldVersion is the installed version when an upgrade is pending, Version the candidate
+        version = entry.get("OldVersion") or entry.get("Version")
+        if entry.get("Package") and version:
+            versions[entry["Package"]] = version
+    return versions
+
+
+@dataclass
+class DriftReport:
+    # package -> node -> installed version, None if the package is missing on that node
+    matrix: dict = field(default_factory=dict)
+    # package -> newest version installed anywhere in the cluster
+    latest: dict = field(default_factory=dict)
+    nodes: list = field(default_factory=list)
+
+    @property
+    def lagging(self) -> dict:
+        """Packages that are older on some nodes, mapped to those nodes"""
+        lagging = {}
+        for package, versions in self.matrix.items():
+            newest = version_key(self.latest[package])
+            nodes = [node for node, v in versions.items() if v is not None and version_key(v) < newest]
+            if nodes:
+                lagging[package] = nodes
+        return lagging
+
+    @property
+    def drifted(self) -> dict:
+        """Matrix rows of the packages whose version differs between nodes"""
+        return {package: self.matrix[package] for package in self.lagging}
+
+    def __str__(self):
+        drifted = self.drifted
+        if not drifted:
+            return "No version drift across %d nodes" % len(self.nodes)
+        rows = [["package"] + self.nodes] + [
+            [package] + [versions.get(node) or "-" for node in self.nodes] for package, versions in sorted(drifted.items())
+        ]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows)
+
+
+def version_drift(versions_by_node, packages=None) -> DriftReport:
+    """Compare installed package versions between nodes
+    :param versions_by_node: dict - node -> package -> installed version, see ``installed_versions``
+    :param packages: iterable, optional - only report these packages
+    :return: DriftReport
+    """
+    nodes = sorted(versions_by_node)
+    names = set(packages) if packages is not None else set().union(*versions_by_node.values())
+    report = DriftReport(nodes=nodes)
+    for package in sorted(names):
+        row = {node: versions_by_node[node].get(package) for node in nodes}
+        installed = [v for v in row.values() if v is not None]
+        if not installed:
+            continue
+        report.matrix[package] = row
+        report.latest[package] = max(installed, key=version_key)
+    return report
@@ -0,0 +1,103 @@
+"""Queries across several Proxmox VE clusters.
+
+``Federation`` runs the same ``Info``/``Resources`` call against every member cluster concurrently, one thread per
+cluster, and merges the results. Records returned by a merged query carry the name of their cluster under
+``cluster``. A cluster that fails is logged and left out, the others still answer. Members are usually the
+per-cluster ``ProximateUtils`` of ``ProximateUtils.clusters``, which share one unlocked secrets store and keep one
+pooled session each.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from proximate_utils.records import as_dict
+
+# key of the cluster name in merged records
+CLUSTER = "cluster"
+
+
+def tag_records(cluster, records) -> list:
+    """Copies of ``records`` carrying the cluster name"""
+    return [dict(as_dict(record), **{CLUSTER: cluster}) for record in records or ()]
+
+
+class Federation:
+    def __init__(self, members: dict, max_workers=None):
+        """
+        :param members: dict - cluster name to an object offering ``info`` and ``resources``, e.g. ProximateUtils
+        :param max_workers: int, optional - clusters queried at once, all of them when omitted
+        """
+        self.members = dict(members)
+        self.max_workers = max_workers
+        self.log: logging.Logger = logging.getLogger("Federation")
+
+    @property
+    def names(self) -> list:
+        return sorted(self.members)
+
+    def fan_out(self, fn, clusters=None) -> dict:
+        """Call ``fn(name, member)`` for every cluster concurrently
+        :param clusters: iterable, optional - only these clusters
+        :return: dict - cluster name to result, clusters that raised are left out
+        """
+        names = [name for name in self.names if clusters is None or name in clusters]
+        if not names:
+            return {}
+        workers = max(1, min(self.max_workers or len(names), len(names)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Federation") as pool:
+            futures = {name: pool.submit(fn, name, self.members[name]) for name in names}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                self.log.error(msg="Query of cluster %s failed: %s" % (name, e))
+        return results
+
+    def call(self, target, method, *args, clusters=None, **kwargs) -> dict:
+        """Run ``member.<target>.<method>(*args, **kwargs)`` on every cluster
+        :param target: str - ``info`` or ``resources``
+        :return: dict - cluster name to result
+        """
+        return self.fan_out(lambda _, member: getattr(getattr(member, target), method)(*args, **kwargs), clusters)
+
+    def _merged(self, target, method, *args, **kwargs) -> list:
+        results = self.call(target, method, *args, **kwargs)
+        return [record for name in sorted(results) for record in tag_records(name, results[name])]
+
+    def get_nodes(self, clusters=None) -> list:
+        return self._merged("resources", "get_nodes", clusters=clusters)
+
+    def get_vms(self, clusters=None) -> list:
+        """Guests of every cluster, each with its ``cluster``"""
+        return self._merged("resources", "get_vms", clusters=clusters)
+
+    def get_vmid(self, name, clusters=None) -> dict:
+        """Vmid of the guest called ``name`` in every cluster that has one
+        :return: dict - cluster name to vmid
+        """
+        results = self.call("info", "get_vmid", name, ignore_missing=True, clusters=clusters)
+        return {cluster: vmid for cluster, vmid in results.items() if vmid is not None}
+
+    def get_nextvmid(self, clusters=None) -> dict:
+        """Next free vmid of every cluster
+        :return: dict - cluster name to vmid
+        """
+        results = self.call("info", "get_nextvmid", clusters=clusters)
+        return {cluster: int(vmid) for cluster, vmid in results.items() if vmid is not None}
+
+    def locate(self, guest, clusters=None) -> list:
+        """Where is a guest, in a single parallel round of snapshot lookups
+        :param guest: int or str - vmid or name
+        :return: list of dicts - matching guests with their ``cluster``, ``node`` and ``status``
+        """
+
+        def lookup(_, member):
+            snapshot = member.resources.snapshot
+            if isinstance(guest, int) or str(guest).isdigit():
+                vm = snapshot.by_vmid(int(guest))
+                return [vm] if vm is not None else []
+            return snapshot.by_name(guest)
+
+        results = self.fan_out(lookup, clusters)
+        return [record for name in sorted(results) for record in tag_records(name, results[name])]
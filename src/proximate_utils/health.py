@@ -0,0 +1,122 @@
+"""Cluster health summary.
+
+``Resources.get_cluster_health`` fetches status, storage usage and subscription of every node concurrently and
+merges them here into one ``ClusterHealth``. A node whose calls fail or time out is kept with the data that did
+arrive and its errors, so one hung node degrades the summary instead of blocking it.
+"""
+
+from dataclasses import dataclass, field
+
+
+@dataclass
+class NodeHealth:
+    node: str
+    status: str = "unknown"
+    cpu: float = None
+    cpus: int = None
+    loadavg: list = None
+    memory_used: int = None
+    memory_total: int = None
+    rootfs_used: int = None
+    rootfs_total: int = None
+    uptime: int = None
+    pve_version: str = None
+    kernel: str = None
+    subscription: str = None
+    storages: list = field(default_factory=list)
+    # part that could not be retrieved -> reason, e.g. {"status": "timed out after 5.0s"}
+    errors: dict = field(default_factory=dict)
+
+    @property
+    def online(self) -> bool:
+        return self.status == "online"
+
+    @property
+    def degraded(self) -> bool:
+        return not self.online or bool(self.errors)
+
+    @property
+    def memory_ratio(self) -> float:
+        return self.memory_used / self.memory_total if self.memory_used is not None and self.memory_total else None
+
+
+@dataclass
+class ClusterHealth:
+    nodes: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def online(self) -> list:
+        return [node for node in self.nodes if node.online]
+
+    @property
+    def degraded(self) -> list:
+        return [node for node in self.nodes if node.degraded]
+
+    @property
+    def memory_used(self) -> int:
+        return sum(node.memory_used or 0 for node in self.nodes)
+
+    @property
+    def memory_total(self) -> int:
+        return sum(node.memory_total or 0 for node in self.nodes)
+
+    @property
+    def storage(self) -> dict:
+        """Storage name -> (used, total) bytes, shared storages are counted once"""
+        usage = {}
+        for node in self.nodes:
+            for storage in node.storages:
+                if not storage.get("active", 1) or "total" not in storage:
+                    continue
+                name = storage["storage"] if storage.get("shared") else "%s/%s" % (node.node, storage["storage"])
+                usage[name] = (storage.get("used", 0), storage["total"])
+        return usage
+
+    def __str__(self):
+        return "%d/%d nodes online, %d degraded, memory %.1f/%.1f GiB (%.1fs)" % (
+            len(self.online),
+            len(self.nodes),
+            len(self.degraded),
+            self.memory_used / 2**30,
+            self.memory_total / 2**30,
+            self.elapsed,
+        )
+
+
+def node_health(entry, status=None, storages=None, subscription=None, errors=None) -> NodeHealth:
+    """Merge the payloads fetched for one node
+    :param entry: dict - the node's entry of ``nodes``
+    :param status: dict, optional - ``nodes/{node}/status``
+    :param storages: list, optional - ``nodes/{node}/storage``
+    :param subscription: dict, optional - ``nodes/{node}/subscription``
+    :param errors: dict, optional - part -> reason for every payload that is missing
+    """
+    health = NodeHealth(
+        node=entry["node"],
+        status=entry.get("status", "unknown"),
+        cpu=entry.get("cpu"),
+        cpus=entry.get("maxcpu"),
+        memory_used=entry.get("mem"),
+        memory_total=entry.get("maxmem"),
+        uptime=entry.get("uptime"),
+        errors=dict(errors or {}),
+    )
+    if status:
+        memory = status.get("memory") or {}
+        rootfs = status.get("rootfs") or {}
+        health.cpu = status.get("cpu", health.cpu)
+        health.cpus = (status.get("cpuinfo") or {}).get("cpus", health.cpus)
+        health.loadavg = [float(load) for load in status.get("loadavg") or ()] or None
+        health.memory_used = memory.get("used", health.memory_used)
+        health.memory_total = memory.get("total", health.memory_total)
+        health.rootfs_used = rootfs.get("used")
+        health.rootfs_total = rootfs.get("total")
+        health.uptime = status.get("uptime", health.uptime)
+        health.pve_version = status.get("pveversion")
+        health.kernel = status.get("kversion")
+    if storages:
+        health.storages = list(storages)
+    if subscription:
+        health.subscription = subscription.get("status")
+    return health
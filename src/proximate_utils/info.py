@@ -1,33 +1,89 @@
 """Info module for Proxmoxer API"""
 
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from proxmoxer import ProxmoxAPI
 
-from proximate_utils.resources import Resources
+from proximate_utils.breaker import CircuitOpenError
+from proximate_utils.capabilities import Capabilities
+from proximate_utils.drift import DriftReport, installed_versions, version_drift
+from proximate_utils.resources import Resources, logs_errors
+from proximate_utils.snapshot import ResourceSnapshot
 
 
 class Info(Resources):
-    def __init__(self, proxmox: ProxmoxAPI):
-        super().__init__(proxmox)
+    def __init__(self, proxmox: ProxmoxAPI, snapshot: ResourceSnapshot = None):
+        super().__init__(proxmox, snapshot)
+        self._capabilities: dict = {}
+        self._capabilities_lock = threading.Lock()
 
+    @logs_errors("Unable to retrieve Proxmox VE version: %(error)s")
     def version(self) -> str:
+        return self.proxmox.version.get()
+
+    @logs_errors("Unable to retrieve Proxmox VE version of node %(node)s: %(error)s")
+    def node_version(self, node) -> dict:
+        return self.proxmox.nodes(node).version.get()
+
+    def capabilities(self, node=None) -> Capabilities:
+        """Retrieve the feature capabilities of a node, probing its version only once per connection
+        :param node: str, optional - node name, the cluster wide ``version`` endpoint is used when omitted
+        :return: Capabilities - feature table, None if the version could not be retrieved
+        """
+        capabilities = self._capabilities.get(node)
+        if capabilities is not None:
+            return capabilities
+
+        with self._capabilities_lock:
+            if node not in self._capabilities:
+                version = self.version() if node is None else self.node_version(node)
+                if version is None:
+                    return None
+                self._capabilities[node] = Capabilities(version)
+            return self._capabilities[node]
+
+    def invalidate_capabilities(self, node=None):
+        """Forget probed capabilities, e.g. after a node has been upgraded"""
+        with self._capabilities_lock:
+            if node is None:
+                self._capabilities.clear()
+            else:
+                self._capabilities.pop(node, None)
+
+    @logs_errors("Unable to retrieve package versions of node %(node)s: %(error)s")
+    def package_versions(self, node) -> dict:
+        """Installed package versions of a node
+        :return: dict - package name to installed version, None if the versions could not be retrieved
+        """
+        return installed_versions(self.proxmox.nodes(node).apt.versions.get())
+
+    def _package_versions_or_none(self, node) -> dict:
         try:
-            return self.proxmox.version.get()
-        except Exception as e:
-            self.log.error(msg="Unable to retrieve Proxmox VE version: %s" % e)
+            return self.package_versions(node)
+        except CircuitOpenError as e:
+            self.log.error(msg="Skipping node %s: %s" % (node, e))
+
+    def version_drift(self, nodes=None, packages=None, max_workers=8) -> DriftReport:
+        """Compare the installed packages of all nodes, fetching every node's versions concurrently
+        :param nodes: iterable, optional - node names, all online nodes when omitted
+        :param packages: iterable, optional - only report these packages
+        :return: DriftReport - per package matrix of node versions, nodes that could not be queried are left out
+        """
+        if nodes is None:
+            nodes = [n["node"] for n in self.get_nodes() or () if n.get("status", "online") == "online"]
+        nodes = list(nodes)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(nodes)))) as pool:
+            versions = dict(zip(nodes, pool.map(self._package_versions_or_none, nodes)))
+        return version_drift({node: v for node, v in versions.items() if v is not None}, packages)
 
+    @logs_errors("Unable to retrieve next free vmid: %(error)s")
     def get_nextvmid(self):
-        try:
-            return self.proxmox.cluster.nextid.get()
-        except Exception as e:
-            self.log.error(msg="Unable to retrieve next free vmid: %s" % e)
+        return self.proxmox.cluster.nextid.get()
 
+    @logs_errors("Unable to retrieve list of VMs filtered by name %(name)s: %(error)s")
     def get_vmid(self, name, ignore_missing=False):
-        vms = []
-        try:
-            vms = [vm["vmid"] for vm in self.proxmox.cluster.resources.get(type="vm") if vm.get("name") == name]
-        except Exception as e:
-            vms = None
-            self.log.error(msg="Unable to retrieve list of VMs filtered by name %s: %s" % (name, e))
+        vms = [vm["vmid"] for vm in self.snapshot.by_name(name)]
         if not vms:
             if ignore_missing:
                 return None
@@ -37,9 +93,7 @@ class Info(Resources):
         else:
             return vms[0]
 
+    @logs_errors("Unable to retrieve API task ID from node %(node)s: %(error)s")
     def api_task_ok(self, node, taskid):
-        try:
-            status = self.proxmox.nodes(node).tasks(taskid).status.get()
-            return status["status"] == "stopped" and status["exitstatus"] == "OK"
-        except Exception as e:
-            self.log.error(msg="Unable to retrieve API task ID from node %s: %s" % (node, e))
+        status = self.proxmox.nodes(node).tasks(taskid).status.get()
+        return status["status"] == "stopped" and status["exitstatus"] == "OK"
@@ -0,0 +1,309 @@
+"""Persistent SQLite inventory of a Proxmox VE cluster.
+
+Keeps nodes, guests, pools, storages and storage content in a local database with the time each row last changed
+(``updated_at``) and the time each kind was last refreshed. ``refresh`` only re-reads the kinds older than
+``max_age`` and only rewrites rows whose payload changed, so unchanged rows keep their ``updated_at``, and
+read-only questions such as "which guests on node X use storage Y" are answered locally without touching the API.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from proximate_utils.records import as_dict
+from proximate_utils.resources import Resources, normalize_volume, storage_pairs
+
+KINDS = ("nodes", "guests", "pools", "storages", "storage_content")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    node TEXT PRIMARY KEY,
+    status TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS guests (
+    vmid INTEGER PRIMARY KEY,
+    name TEXT,
+    node TEXT,
+    pool TEXT,
+    type TEXT,
+    status TEXT,
+    template INTEGER,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS guests_node ON guests (node);
+CREATE INDEX IF NOT EXISTS guests_name ON guests (name);
+CREATE INDEX IF NOT EXISTS guests_pool ON guests (pool);
+CREATE TABLE IF NOT EXISTS pools (
+    poolid TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS storages (
+    storage TEXT PRIMARY KEY,
+    type TEXT,
+    content TEXT,
+    shared INTEGER,
+    nodes TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS storage_content (
+    node TEXT NOT NULL,
+    storage TEXT NOT NULL,
+    volid TEXT NOT NULL,
+    content TEXT,
+    format TEXT,
+    vmid INTEGER,
+    size INTEGER,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (node, storage, volid)
+);
+CREATE INDEX IF NOT EXISTS storage_content_vmid ON storage_content (vmid);
+CREATE INDEX IF NOT EXISTS storage_content_content ON storage_content (content);
+CREATE TABLE IF NOT EXISTS refreshes (
+    kind TEXT PRIMARY KEY,
+    refreshed_at REAL NOT NULL
+);
+"""
+
+
+class InventoryStore:
+    # seconds before a kind is read from the API again
+    max_age: float = 300.0
+    # concurrent storage content listings during a refresh
+    max_workers: int = 8
+
+    def __init__(self, path: Path, resources: Resources = None, max_age: float = max_age):
+        """
+        :param path: Path - sqlite database file, ``:memory:`` for a throwaway store
+        :param resources: Resources, optional - API access used by ``refresh``, queries work without it
+        """
+        self.path = path
+        self.resources = resources
+        self.max_age = max_age
+        self.log: logging.Logger = logging.getLogger("InventoryStore")
+        if str(path) != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def refreshed_at(self, kind) -> float:
+        with self._lock:
+            row = self._db.execute("SELECT refreshed_at FROM refreshes WHERE kind = ?", (kind,)).fetchone()
+        return row["refreshed_at"] if row else None
+
+    def stale(self, kind) -> bool:
+        refreshed_at = self.refreshed_at(kind)
+        return refreshed_at is None or time.time() - refreshed_at >= self.max_age
+
+    def refresh(self, kinds=KINDS, force=False) -> dict:
+        """Read stale kinds from the API and store them
+        :param kinds: iterable - any of nodes, guests, pools, storages and storage_content
+        :param force: bool - refresh even if the stored data is younger than ``max_age``
+        :return: dict - kind to the number of inserted or changed rows, for every kind that was refreshed
+        """
+        if self.resources is None:
+            raise ValueError("InventoryStore needs Resources to refresh")
+
+        changed = {}
+        for kind in kinds:
+            if kind not in KINDS:
+                raise ValueError("Unknown inventory kind %s" % kind)
+            if not force and not self.stale(kind):
+                continue
+            count = getattr(self, "_refresh_%s" % kind)()
+            if count is not None:
+                changed[kind] = count
+        return changed
+
+    def _replace(self, kind, table, key, rows, scope=None) -> int:
+        """Upsert ``rows`` and delete the rows of ``scope`` that were not seen
+        :param key: tuple - primary key columns
+        :param rows: list of dicts - column values, ``data`` holds the JSON payload
+        :param scope: dict, optional - column values limiting which existing rows may be deleted
+        :return: int - number of inserted, changed or deleted rows
+        """
+        now = time.time()
+        columns = list(rows[0]) + ["updated_at"] if rows else []
+        scope = scope or {}
+        where = " AND ".join("%s = ?" % column for column in scope) or "1"
+        with self._lock, self._db:
+            before = self._db.total_changes
+            if rows:
+                self._db.executemany(
+                    "INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (%s) DO UPDATE SET %s WHERE data != excluded.data"
+                    % (
+                        table,
+                        ", ".join(columns),
+                        ", ".join("?" for _ in columns),
+                        ", ".join(key),
+                        ", ".join("%s = excluded.%s" % (c, c) for c in columns if c not in key),
+                    ),
+                    [tuple(row[c] for c in columns[:-1]) + (now,) for row in rows],
+                )
+            changed = self._db.total_changes - before
+            seen = {tuple(row[c] for c in key) for row in rows}
+            existing = self._db.execute(
+                "SELECT %s FROM %s WHERE %s" % (", ".join(key), table, where), tuple(scope.values())
+            ).fetchall()
+            stale = [tuple(row) for row in existing if tuple(row) not in seen]
+            self._db.executemany(
+                "DELETE FROM %s WHERE %s" % (table, " AND ".join("%s = ?" % c for c in key)),
+                stale,
+            )
+            if kind is not None:
+                self._db.execute(
+                    "INSERT INTO refreshes (kind, refreshed_at) VALUES (?, ?) "
+                    "ON CONFLICT (kind) DO UPDATE SET refreshed_at = excluded.refreshed_at",
+                    (kind, now),
+                )
+        return changed + len(stale)
+
+    @staticmethod
+    def _json(data) -> str:
+        # records are mappings but not dicts
+        return json.dumps(as_dict(data), sort_keys=True)
+
+    def _refresh_nodes(self) -> int:
+        nodes = self.resources.get_nodes()
+        if nodes is None:
+            return None
+        rows = [{"node": n["node"], "status": n.get("status"), "data": self._json(n)} for n in nodes]
+        return self._replace("nodes", "nodes", ("node",), rows)
+
+    def _refresh_guests(self) -> int:
+        try:
+            vms = self.resources.snapshot.refresh()
+        except Exception as e:
+            self.log.error(msg="Unable to retrieve list of VMs: %s" % e)
+            return None
+        rows = [
+            {
+                "vmid": int(vm["vmid"]),
+                "name": vm.get("name"),
+                "node": vm.get("node"),
+                "pool": vm.get("pool"),
+                "type": vm.get("type"),
+                "status": vm.get("status"),
+                "template": int(vm.get("template") or 0),
+                "data": self._json(vm),
+            }
+            for vm in vms
+        ]
+        return self._replace("guests", "guests", ("vmid",), rows)
+
+    def _refresh_pools(self) -> int:
+        pools = self.resources.get_pools()
+        if pools is None:
+            return None
+        rows = [{"poolid": p["poolid"], "data": self._json(p)} for p in pools]
+        return self._replace("pools", "pools", ("poolid",), rows)
+
+    def _refresh_storages(self) -> int:
+        storages = self.resources.get_storages(None)
+        if storages is None:
+            return None
+        rows = [
+            {
+                "storage": s["storage"],
+                "type": s.get("type"),
+                "content": s.get("content"),
+                "shared": int(s.get("shared") or 0),
+                "nodes": s.get("nodes"),
+                "data": self._json(s),
+            }
+            for s in storages
+        ]
+        return self._replace("storages", "storages", ("storage",), rows)
+
+    def _refresh_storage_content(self) -> int:
+        # content listings are per node and storage, so make sure both are known first
+        for kind in ("nodes", "storages"):
+            if self.refreshed_at(kind) is None:
+                getattr(self, "_refresh_%s" % kind)()
+
+        changed = 0
+        pairs = storage_pairs(self.nodes(), self.storages())
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(pairs)))) as pool:
+            listings = list(pool.map(lambda pair: self.resources.get_storage_content(*pair), pairs))
+        for (node, storage), volumes in zip(pairs, listings):
+            if volumes is None:
+                continue
+            volumes = [normalize_volume(node, storage, v) for v in volumes]
+            rows = [
+                {
+                    "node": node,
+                    "storage": storage,
+                    "volid": v["volid"],
+                    "content": v["content"],
+                    "format": v["format"],
+                    "vmid": v["vmid"],
+                    "size": v["size"],
+                    "data": self._json(v),
+                }
+                for v in volumes
+            ]
+            scope = {"node": node, "storage": storage}
+            changed += self._replace(None, "storage_content", ("node", "storage", "volid"), rows, scope)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO refreshes (kind, refreshed_at) VALUES ('storage_content', ?) "
+                "ON CONFLICT (kind) DO UPDATE SET refreshed_at = excluded.refreshed_at",
+                (time.time(),),
+            )
+        return changed
+
+    def _query(self, sql, params=()) -> list:
+        with self._lock:
+            return [json.loads(row["data"]) for row in self._db.execute(sql, params)]
+
+    @staticmethod
+    def _where(**filters) -> tuple:
+        filters = {column: value for column, value in filters.items() if value is not None}
+        where = " AND ".join("%s = ?" % column for column in filters)
+        return (" WHERE " + where if where else ""), tuple(filters.values())
+
+    def nodes(self) -> list:
+        return self._query("SELECT data FROM nodes ORDER BY node")
+
+    def guest(self, vmid) -> dict:
+        guests = self._query("SELECT data FROM guests WHERE vmid = ?", (int(vmid),))
+        return guests[0] if guests else None
+
+    def guests(self, node=None, pool=None, name=None, status=None, type=None) -> list:
+        where, params = self._where(node=node, pool=pool, name=name, status=status, type=type)
+        return self._query("SELECT data FROM guests%s ORDER BY vmid" % where, params)
+
+    def pools(self) -> list:
+        return self._query("SELECT data FROM pools ORDER BY poolid")
+
+    def storages(self, type=None) -> list:
+        where, params = self._where(type=type)
+        return self._query("SELECT data FROM storages%s ORDER BY storage" % where, params)
+
+    def storage_content(self, node=None, storage=None, content=None, vmid=None) -> list:
+        where, params = self._where(node=node, storage=storage, content=content, vmid=vmid)
+        return self._query("SELECT data FROM storage_content%s ORDER BY node, storage, volid" % where, params)
+
+    def guests_using_storage(self, node, storage) -> list:
+        """Guests on ``node`` with volumes on ``storage`` (disks as well as backups)"""
+        return self._query(
+            "SELECT DISTINCT g.data FROM guests g JOIN storage_content c ON c.vmid = g.vmid "
+            "WHERE g.node = ? AND c.storage = ? AND c.node = ? ORDER BY g.vmid",
+            (node, storage, node),
+        )
@@ -0,0 +1,70 @@
+"""Selection and ordering of guests for bulk lifecycle operations.
+
+Guests are grouped the way PVE orders them on boot: ascending ``startup`` order, guests without an order last. Stop,
+shutdown and migrate run the groups in reverse. Guests within a group do not depend on each other and run in
+parallel, see ``Actions.bulk_lifecycle``.
+"""
+
+from proximate_utils.snapshot import split_tags
+
+START = "start"
+STOP = "stop"
+SHUTDOWN = "shutdown"
+MIGRATE = "migrate"
+
+# status a guest is left in by each operation, guests already in it are skipped
+TARGET_STATUS = {START: "running", STOP: "stopped", SHUTDOWN: "stopped"}
+
+
+def parse_startup(value) -> dict:
+    """Parse the ``startup`` option of a guest config
+    :param value: str - e.g. ``order=2,up=30,down=60``
+    :return: dict - order, up and down as ints, missing or malformed ones are left out
+    """
+    startup = {}
+    for item in str(value or "").split(","):
+        key, _, number = item.partition("=")
+        if key.strip() in ("order", "up", "down") and number.strip().isdigit():
+            startup[key.strip()] = int(number)
+    return startup
+
+
+def select_guests(vms, vmids=None, node=None, pool=None, tags=None, type=None) -> list:
+    """Guests matching every given criterion, templates are never selected
+    :param vms: list of dicts - ``cluster/resources`` guests
+    :param vmids: iterable, optional - only these vmids
+    :param tags: iterable or str, optional - guests carrying all of these tags
+    :param type: str, optional - only guests of this type, ``lxc`` or ``qemu``
+    :return: list of dicts
+    """
+    wanted = {int(vmid) for vmid in vmids} if vmids is not None else None
+    tags = split_tags(tags)
+    return [
+        vm
+        for vm in vms
+        if not vm.get("template")
+        and (wanted is None or int(vm["vmid"]) in wanted)
+        and (node is None or vm.get("node") == node)
+        and (pool is None or vm.get("pool") == pool)
+        and (type is None or vm.get("type") == type)
+        and tags <= split_tags(vm.get("tags"))
+    ]
+
+
+def startup_groups(vms, startups=None, reverse=False) -> list:
+    """Split guests into groups that run one after another
+    :param vms: list of dicts - guests to order
+    :param startups: dict, optional - vmid to parsed ``startup`` option, all guests form one group when omitted
+    :param reverse: bool - shutdown order, descending with unordered guests first
+    :return: list of lists of dicts
+    """
+    if not startups:
+        return [list(vms)] if vms else []
+    groups = {}
+    for vm in vms:
+        groups.setdefault(startups.get(int(vm["vmid"]), {}).get("order"), []).append(vm)
+    # PVE starts guests without an order after all ordered ones
+    keys = sorted(groups, key=lambda order: (order is None, order or 0))
+    if reverse:
+        keys.reverse()
+    return [groups[key] for key in keys]
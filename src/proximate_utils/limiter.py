@@ -0,0 +1,290 @@
+"""Client side rate limiting and adaptive concurrency for Proxmox VE API calls.
+
+``ApiLimiter`` is a request layer (see ``session.install_layer``) that admits every call through a cluster wide and a
+per-node scope. Each scope has an optional token bucket capping the request rate and an AIMD concurrency limit: the
+number of calls allowed in flight grows by one per window of fast, successful calls and shrinks multiplicatively when
+calls fail with an overload status or take longer than ``target_latency``. Queue depth and wait times of every scope
+are exposed through ``stats``.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from urllib import parse as urlparse
+
+# statuses that signal an overloaded pveproxy, other errors (e.g. 404, or 500 for application errors) say nothing
+# about load
+OVERLOAD_STATUS = (429, 502, 503, 504)
+
+
+def node_of(url) -> str:
+    """Node addressed by a request url, None for cluster wide endpoints"""
+    segments = [s for s in urlparse.urlsplit(str(url)).path.split("/api2/json", 1)[-1].split("/") if s]
+    return segments[1] if len(segments) > 1 and segments[0] == "nodes" else None
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float = None):
+        """
+        :param rate: float - tokens added per second
+        :param burst: float, optional - bucket size, defaults to one second worth of tokens
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, going into debt if the bucket is empty
+        :return: float - seconds to wait before the token may be used, reservations are served in order
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+
+class AimdLimit:
+    def __init__(self, initial=8, minimum=1, maximum=64, target_latency=1.0, backoff=0.7):
+        """
+        :param initial: int - calls allowed in flight at the start
+        :param target_latency: float - calls slower than this count as overload
+        :param backoff: float - factor the limit is multiplied with on overload
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.inflight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.acquired = 0
+        self.overloads = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._decreased_at = float("-inf")
+        self._condition = threading.Condition()
+        self._async_waiters = deque()
+
+    def _try_acquire(self) -> bool:
+        if self.inflight < max(self.minimum, int(self.limit)):
+            self.inflight += 1
+            self.acquired += 1
+            return True
+        return False
+
+    def _queued(self, delta):
+        self.waiting += delta
+        self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def _waited(self, seconds):
+        with self._condition:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def acquire(self, timeout=None):
+        """Wait for a free slot
+        :raises TimeoutError: if no slot became free within ``timeout`` seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            if self._try_acquire():
+                return
+            self._queued(1)
+            try:
+                while not self._try_acquire():
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("No free API slot within %ss" % timeout)
+                    self._condition.wait(remaining)
+            finally:
+                self._queued(-1)
+
+    async def acquire_async(self, timeout=None):
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            with self._condition:
+                if self._try_acquire():
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+                self._queued(1)
+            try:
+                remaining = None if deadline is None else max(0.0, deadline - loop.time())
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                raise TimeoutError("No free API slot within %ss" % timeout)
+            finally:
+                with self._condition:
+                    self._queued(-1)
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    def release(self, latency, overload=False):
+        """Free a slot and adapt the limit
+        :param latency: float - seconds the call took, None for a slot given back without a call, which leaves the
+            limit alone
+        :param overload: bool - the call failed in a way that indicates an overloaded node
+        """
+        wake = []
+        with self._condition:
+            self.inflight -= 1
+            if latency is not None and (overload or latency > self.target_latency):
+                self.overloads += 1
+                # calls started before the last decrease report the old overload, so back off once per window
+                now = time.monotonic()
+                if now - self._decreased_at >= self.target_latency:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._decreased_at = now
+            elif latency is not None:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            free = max(1, int(self.limit) - self.inflight)
+            self._condition.notify(free)
+            while self._async_waiters and len(wake) < free:
+                wake.append(self._async_waiters.popleft())
+        for loop, waiter in wake:
+            loop.call_soon_threadsafe(lambda w=waiter: w.done() or w.set_result(None))
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "limit": round(self.limit, 2),
+                "inflight": self.inflight,
+                "waiting": self.waiting,
+                "max_waiting": self.max_waiting,
+                "acquired": self.acquired,
+                "overloads": self.overloads,
+                "wait_total": self.wait_total,
+                "wait_max": self.wait_max,
+            }
+
+
+class ApiLimiter:
+    # scope name of the cluster wide limit in ``stats``
+    CLUSTER = "cluster"
+
+    def __init__(
+        self,
+        rate: float = None,
+        burst: float = None,
+        concurrency: int = 32,
+        max_concurrency: int = 128,
+        node_rate: float = None,
+        node_burst: float = None,
+        node_concurrency: int = 8,
+        node_max_concurrency: int = 32,
+        target_latency: float = 2.0,
+        timeout: float = None,
+    ):
+        """
+        :param rate: float, optional - cluster wide requests per second, unlimited when omitted
+        :param concurrency: int - initial cluster wide calls in flight, adapted up to ``max_concurrency``
+        :param node_rate: float, optional - requests per second per node, unlimited when omitted
+        :param node_concurrency: int - initial calls in flight per node, adapted up to ``node_max_concurrency``
+        :param target_latency: float - calls slower than this shrink the concurrency of their scopes
+        :param timeout: float, optional - longest wait for a slot before ``TimeoutError`` is raised
+        """
+        self.timeout = timeout
+        self.log: logging.Logger = logging.getLogger("ApiLimiter")
+        self._node_settings = (node_rate, node_burst, node_concurrency, node_max_concurrency, target_latency)
+        self._lock = threading.Lock()
+        self._buckets = {self.CLUSTER: TokenBucket(rate, burst) if rate else None}
+        self._limits = {self.CLUSTER: AimdLimit(concurrency, maximum=max_concurrency, target_latency=target_latency)}
+
+    def _scopes(self, url) -> list:
+        node = node_of(url)
+        if node is None:
+            return [self.CLUSTER]
+        if node not in self._limits:
+            rate, burst, concurrency, maximum, target_latency = self._node_settings
+            with self._lock:
+                if node not in self._limits:
+                    self._buckets[node] = TokenBucket(rate, burst) if rate else None
+                    self._limits[node] = AimdLimit(concurrency, maximum=maximum, target_latency=target_latency)
+        # node before cluster, a call waiting for its busy node must not hold a cluster wide slot
+        return [node, self.CLUSTER]
+
+    def _delay(self, scopes) -> float:
+        return max([self._buckets[s].reserve() for s in scopes if self._buckets[s] is not None] or [0.0])
+
+    def acquire(self, url) -> list:
+        """Wait until a call to ``url`` may be sent
+        :return: list - scopes to pass to ``release`` once the call has finished
+        """
+        start = time.monotonic()
+        scopes = self._scopes(url)
+        delay = self._delay(scopes)
+        if delay:
+            time.sleep(delay)
+        acquired = []
+        try:
+            for scope in scopes:
+                self._limits[scope].acquire(self._remaining(start))
+                acquired.append(scope)
+        except TimeoutError:
+            self.release(acquired, None)
+            raise
+        self._record_wait(scopes, time.monotonic() - start)
+        return scopes
+
+    async def acquire_async(self, url) -> list:
+        start = time.monotonic()
+        scopes = self._scopes(url)
+        delay = self._delay(scopes)
+        if delay:
+            await asyncio.sleep(delay)
+        acquired = []
+        try:
+            for scope in scopes:
+                await self._limits[scope].acquire_async(self._remaining(start))
+                acquired.append(scope)
+        except (TimeoutError, asyncio.CancelledError):
+            self.release(acquired, None)
+            raise
+        self._record_wait(scopes, time.monotonic() - start)
+        return scopes
+
+    def _remaining(self, start):
+        return None if self.timeout is None else max(0.0, self.timeout - (time.monotonic() - start))
+
+    def _record_wait(self, scopes, waited):
+        for scope in scopes:
+            self._limits[scope]._waited(waited)
+
+    def release(self, scopes, latency, overload=False):
+        for scope in scopes:
+            self._limits[scope].release(latency, overload)
+
+    def __call__(self, request, method, url, **kwargs):
+        scopes = self.acquire(url)
+        start = time.monotonic()
+        try:
+            response = request(method, url, **kwargs)
+        except Exception:
+            self.release(scopes, time.monotonic() - start, overload=True)
+            raise
+        latency = time.monotonic() - start
+        overload = response.status_code in OVERLOAD_STATUS
+        if overload or latency > self._limits[scopes[0]].target_latency:
+            status = response.status_code
+            self.log.debug(msg="Backing off %s, %s %s took %.3fs (%s)" % (scopes[0], method, url, latency, status))
+        self.release(scopes, latency, overload)
+        return response
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls currently waiting for a slot in any scope"""
+        return sum(limit.waiting for limit in list(self._limits.values()))
+
+    def stats(self) -> dict:
+        """Scope (``cluster`` or node name) to limit, inflight, waiting, max_waiting, acquired, overloads and the
+        total and longest wait in seconds
+        """
+        return {scope: limit.stats() for scope, limit in sorted(self._limits.items())}
@@ -1,33 +1,102 @@
-"""Main module for proximate_utils."""
+"""Main module for proximate_utils.
 
+Heavy dependencies (pykeepass, trapper_keeper, proxmoxer, xdg_base_dirs) are imported on first use and every
+component of ``ProximateUtils`` is created lazily, so a command only pays for the parts it touches.
+"""
+
+from __future__ import annotations
+
+from functools import cached_property
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from proxmoxer.core import ProxmoxAPI
+    from pykeepass.pykeepass import PyKeePass
+
+    from proximate_utils.actions import Actions
+    from proximate_utils.breaker import NodeBreaker
+    from proximate_utils.coalesce import SingleFlight
+    from proximate_utils.federation import Federation
+    from proximate_utils.info import Info
+    from proximate_utils.inventory import InventoryStore
+    from proximate_utils.limiter import ApiLimiter
+    from proximate_utils.metrics import ApiMetrics
+    from proximate_utils.records import ApiSecret
+    from proximate_utils.reconcile import Reconciler
+    from proximate_utils.resources import Resources
+    from proximate_utils.session import SessionConfig
+    from proximate_utils.snapshot import ResourceSnapshot
+    from proximate_utils.ticket_cache import TicketCache
+
+
+class XdgPath:
+    """Class attribute resolving a path below an xdg base directory on first access"""
 
-from pykeepass.entry import Entry
-from pykeepass.group import Group
-from pykeepass.pykeepass import PyKeePass, create_database
-from trapper_keeper.util.keegen import KeeAuth
-from xdg_base_dirs import xdg_config_home, xdg_state_home, xdg_data_home
-from proxmoxer.core import ProxmoxAPI
+    def __init__(self, base: str, path: str):
+        self.base = base
+        self.path = path
 
-from proximate_utils.actions import Actions
-from proximate_utils.info import Info
+    def __get__(self, instance, owner) -> Path:
+        import xdg_base_dirs
+
+        return getattr(xdg_base_dirs, "xdg_%s_home" % self.base)().joinpath(self.path)
+
+
+def _per_cluster(path: Path, name: str) -> Path:
+    """Location of a per-cluster copy of a file, e.g. ``proxmox-lab.sqlite`` for ``proxmox.sqlite``"""
+    return path.with_name("%s-%s%s" % (path.stem, name, path.suffix))
 
 
 class ProximateUtils:
-    db: Path = xdg_data_home().joinpath("proxmox/proxmox_secrets.kdbx")
-    # TODO: Make embedded kv db optional
-    # kv_db: Path = xdg_data_home().joinpath("proxmox/proxmox.sqlite")
-    token: Path = xdg_config_home().joinpath("proxmox/proxmox_secrets_token")
-    key: Path = xdg_state_home().joinpath("proxmox/proxmox_secrets_key")
+    db: Path = XdgPath("data", "proxmox/proxmox_secrets.kdbx")
+    kv_db: Path = XdgPath("data", "proxmox/proxmox.sqlite")
+    token: Path = XdgPath("config", "proxmox/proxmox_secrets_token")
+    key: Path = XdgPath("state", "proxmox/proxmox_secrets_key")
+    ticket_cache_path: Path = XdgPath("state", "proxmox/proxmox_ticket_cache")
+    socket_path: Path = XdgPath("state", "proxmox/proximate.sock")
     proj_id = "a1c4dc95-9801-4262-8b63-012f0460240b"
+    # ResourceSnapshot.ttl, SessionConfig and ApiMetrics defaults are used when unset
+    snapshot_ttl: float = None
+    session_config: SessionConfig = None
+    slow_call_threshold: float = None
+    # identical GETs from concurrent threads share one request
+    coalesce_reads: bool = True
+    # requests per second cluster wide and per node, unlimited when unset, concurrency adapts regardless
+    api_rate: float = None
+    node_api_rate: float = None
+    # calls to a node that keeps failing raise CircuitOpenError at once, failed GETs are retried
+    fail_fast: bool = True
+
+    @classmethod
+    def _get_api_secrets(cls, db: PyKeePass) -> ApiSecret:
+        from proximate_utils.records import ApiSecret
+
+        proj_group = db.find_groups(recursive=True, name=cls.proj_id, first=True)
+        return ApiSecret.from_entry([host for host in proj_group.entries if host.title == "proxmox_api"][0])
 
-    # TODO: Return data class as a detached record from Entry
     @classmethod
-    def _get_api_secrets(cls, db: PyKeePass) -> Entry:
-        proj_group: Group = db.find_groups(recursive=True, name=cls.proj_id, first=True)
-        return [host for host in proj_group.entries if host.title == "proxmox_api"][0]
+    def _get_cluster_secrets(cls, db: PyKeePass) -> dict:
+        """Every cluster in the project group, ``proxmox_api`` is the cluster ``default`` and ``proxmox_api:<name>``
+        the cluster ``<name>``
+        :return: dict - cluster name to ApiSecret
+        """
+        from proximate_utils.records import ApiSecret
+
+        proj_group = db.find_groups(recursive=True, name=cls.proj_id, first=True)
+        secrets = {}
+        for host in proj_group.entries:
+            if host.title == "proxmox_api":
+                secrets["default"] = ApiSecret.from_entry(host)
+            elif host.title and host.title.startswith("proxmox_api:"):
+                secrets[host.title.split(":", 1)[1]] = ApiSecret.from_entry(host)
+        return secrets
+
+    @staticmethod
+    def _open_store(db: Path, token: Path, key: Path) -> PyKeePass:
+        from pykeepass.pykeepass import PyKeePass, create_database
+        from trapper_keeper.util.keegen import KeeAuth
 
-    def __init__(self, db: Path = db, token: Path = token, key: Path = key):
         kee_auth: KeeAuth = KeeAuth()
         kee_auth.kp_key = key
         kee_auth.kp_token = token
@@ -41,19 +110,190 @@ class ProximateUtils:
             # DbUtils.create_tk_store(kp_token=kee_auth.kp_token[1], kp_key=kee_auth.kp_token[1], kp_fp=db, kv_fp=kv_db)
             create_database(filename=db, password=kee_auth.kp_token[1], keyfile=kee_auth.kp_key[0])
 
-        self.proximate_store: PyKeePass = PyKeePass(filename=db, password=token.read_text(encoding="utf-8"), keyfile=key)
-        self.proxmox_secrets: Entry = self._get_api_secrets(self.proximate_store)
-        self.proxmox: ProxmoxAPI = ProxmoxAPI(
-            str(self.proxmox_secrets.url).strip("https://"),
-            user=self.proxmox_secrets.username,
-            password=self.proxmox_secrets.password,
-            verify_ssl=True,
-        )
+        return PyKeePass(filename=db, password=token.read_text(encoding="utf-8"), keyfile=key)
+
+    def __init__(
+        self,
+        db: Path = None,
+        token: Path = None,
+        key: Path = None,
+        session_config: SessionConfig = None,
+        ticket_cache: bool = False,
+        kv_db: Path = None,
+    ):
+        """Nothing is opened or contacted here, each component is created on first access
+        :param ticket_cache: bool - reuse an encrypted auth ticket across processes, a warm start then skips
+            unlocking the secrets store and the login round-trip
+        :param kv_db: Path, optional - location of the local inventory database
+        """
+        self.db = Path(db) if db is not None else ProximateUtils.db
+        self.token = Path(token) if token is not None else ProximateUtils.token
+        self.key = Path(key) if key is not None else ProximateUtils.key
+        self.kv_db = Path(kv_db) if kv_db is not None else ProximateUtils.kv_db
+        if session_config is not None:
+            self.session_config = session_config
+        self.use_ticket_cache = ticket_cache
+
+    @cached_property
+    def proximate_store(self) -> PyKeePass:
+        return self._open_store(self.db, self.token, self.key)
+
+    @cached_property
+    def proxmox_secrets(self) -> ApiSecret:
+        return self._get_api_secrets(self.proximate_store)
+
+    @cached_property
+    def ticket_cache(self) -> TicketCache:
+        if not self.use_ticket_cache:
+            return None
+        from proximate_utils.ticket_cache import TicketCache
+
+        return TicketCache(self.ticket_cache_path, self.token, self.key)
+
+    @cached_property
+    def metrics(self) -> ApiMetrics:
+        """Per-endpoint statistics of every API call made through ``proxmox``"""
+        from proximate_utils.metrics import ApiMetrics
+
+        if self.slow_call_threshold is not None:
+            return ApiMetrics(slow_threshold=self.slow_call_threshold)
+        return ApiMetrics()
+
+    @cached_property
+    def limiter(self) -> ApiLimiter:
+        """Rate and adaptive concurrency limits applied to every API call, see ``stats`` for queue depth and waits"""
+        from proximate_utils.limiter import ApiLimiter
+
+        return ApiLimiter(rate=self.api_rate, node_rate=self.node_api_rate)
+
+    @cached_property
+    def breaker(self) -> NodeBreaker:
+        """Per-node circuit breakers and GET retries, see ``stats`` for the state of every node"""
+        if not self.fail_fast:
+            return None
+        from proximate_utils.breaker import NodeBreaker
+
+        return NodeBreaker()
+
+    @cached_property
+    def single_flight(self) -> SingleFlight:
+        if not self.coalesce_reads:
+            return None
+        from proximate_utils.coalesce import SingleFlight
+
+        return SingleFlight()
+
+    def connection_config(self) -> SessionConfig:
+        """Session settings of ``proxmox``, without adapter retries when the breaker retries failed GETs itself"""
+        import dataclasses
+
+        from proximate_utils.session import SessionConfig
+
+        config = self.session_config if self.session_config is not None else SessionConfig()
+        if self.breaker is not None:
+            # retried below the breaker, a call to a dead node would run into the timeout (1 + retries) times over
+            # before the breaker counts a single failure
+            config = dataclasses.replace(config, retries=0)
+        return config
+
+    @cached_property
+    def proxmox(self) -> ProxmoxAPI:
+        """One pooled session shared by Info, Actions and any threads using them"""
+        from proximate_utils.session import connect, install_layer
+
+        config = self.connection_config()
+
+        def login():
+            # the store is only unlocked when the server rejects the cached ticket
+            return self.proxmox_secrets.password
+
+        # a warm ticket cache skips unlocking the store and the login round-trip
+        proxmox = self.ticket_cache.connect(config=config, login=login) if self.ticket_cache is not None else None
+        if proxmox is None:
+            credentials = dict(user=self.proxmox_secrets.username, password=self.proxmox_secrets.password, verify_ssl=True)
+            if self.ticket_cache is not None:
+                proxmox = self.ticket_cache.connect(self.proxmox_secrets.url, config=config, **credentials)
+            else:
+                proxmox = connect(self.proxmox_secrets.url, config=config, **credentials)
+        # metrics innermost so latencies exclude the time spent waiting on the limiter
+        install_layer(proxmox, self.metrics)
+        install_layer(proxmox, self.limiter)
+        # retries take a fresh limiter slot, refused calls none at all
+        if self.breaker is not None:
+            install_layer(proxmox, self.breaker)
+        # outermost, so coalesced calls neither take a limiter slot nor count as requests
+        if self.single_flight is not None:
+            install_layer(proxmox, self.single_flight)
+        return proxmox
+
+    # TODO: load values from a csv or something into the secure store
+
+    @cached_property
+    def snapshot(self) -> ResourceSnapshot:
+        """Info and Actions share one snapshot so lookups are served from the same indexed fetch"""
+        from proximate_utils.snapshot import ResourceSnapshot
+
+        ttl = self.snapshot_ttl if self.snapshot_ttl is not None else ResourceSnapshot.ttl
+        return ResourceSnapshot(self.proxmox, ttl=ttl)
+
+    @cached_property
+    def info(self) -> Info:
+        from proximate_utils.info import Info
+
+        return Info(self.proxmox, self.snapshot)
+
+    @cached_property
+    def actions(self) -> Actions:
+        from proximate_utils.actions import Actions
+
+        return Actions(self.proxmox, self.info)
+
+    @cached_property
+    def resources(self) -> Resources:
+        from proximate_utils.resources import Resources
+
+        return Resources(self.proxmox, self.snapshot)
+
+    @cached_property
+    def clusters(self) -> dict:
+        """One ProximateUtils per cluster in the secrets store, all sharing this instance's unlocked store and settings
+        :return: dict - cluster name to ProximateUtils, the ``default`` cluster is this instance
+        """
+        clusters = {}
+        for name, secrets in self._get_cluster_secrets(self.proximate_store).items():
+            if name == "default":
+                clusters[name] = self
+                continue
+            member = ProximateUtils(
+                self.db, self.token, self.key, self.session_config, self.use_ticket_cache, kv_db=_per_cluster(self.kv_db, name)
+            )
+            for setting in ("snapshot_ttl", "slow_call_threshold", "coalesce_reads", "api_rate", "node_api_rate", "fail_fast"):
+                setattr(member, setting, getattr(self, setting))
+            member.ticket_cache_path = _per_cluster(self.ticket_cache_path, name)
+            member.proximate_store = self.proximate_store
+            member.proxmox_secrets = secrets
+            clusters[name] = member
+        return clusters
+
+    @cached_property
+    def federation(self) -> Federation:
+        """Concurrent queries across every cluster in the secrets store"""
+        from proximate_utils.federation import Federation
+
+        return Federation(self.clusters)
+
+    @cached_property
+    def reconciler(self) -> Reconciler:
+        from proximate_utils.reconcile import Reconciler
+
+        return Reconciler(self.actions)
 
-        # TODO: load values from a csv or something into the secure store
+    @cached_property
+    def inventory(self) -> InventoryStore:
+        """Local SQLite copy of the cluster inventory, nothing is read from the API until ``refresh`` is called"""
+        from proximate_utils.inventory import InventoryStore
 
-        self.info: Info = Info(self.proxmox)
-        self.actions: Actions = Actions(self.proxmox)
+        return InventoryStore(self.kv_db, self.resources)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,213 @@
+"""Per-endpoint instrumentation of Proxmox VE API calls.
+
+``ApiMetrics`` is a request layer (see ``session.install_layer``) that records call and error counts, a latency
+histogram and payload sizes for every endpoint. Endpoints are grouped by path template, e.g. all
+``/nodes/{node}/tasks/{upid}/status`` calls share one entry. Results can be queried in process or exported as JSON
+or in the Prometheus text format, and calls slower than ``slow_threshold`` are logged.
+"""
+
+import json
+import logging
+import threading
+import time
+from urllib import parse as urlparse
+
+# path segments followed by an identifier, mapped to the placeholder used in the endpoint template
+ID_SEGMENTS = {
+    "nodes": "{node}",
+    "storage": "{storage}",
+    "content": "{volume}",
+    "lxc": "{vmid}",
+    "qemu": "{vmid}",
+    "openvz": "{vmid}",
+    "tasks": "{upid}",
+    "pools": "{poolid}",
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def endpoint(url) -> str:
+    """Reduce a request url to its endpoint template
+    :param url: str - e.g. ``https://pve:8006/api2/json/nodes/node1/lxc/100/config``
+    :return: str - e.g. ``/nodes/{node}/lxc/{vmid}/config``
+    """
+    path = urlparse.urlsplit(str(url)).path
+    path = path.split("/api2/json", 1)[-1]
+    segments = [segment for segment in path.split("/") if segment]
+    for i in range(1, len(segments)):
+        # identifiers are replaced in place, so a node named e.g. "storage" is not mistaken for a collection
+        placeholder = ID_SEGMENTS.get(segments[i - 1])
+        if placeholder is not None:
+            segments[i] = placeholder
+    return "/" + "/".join(segments)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+            "sum": self.sum,
+            "count": self.count,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class EndpointStats:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram(buckets)
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency": self.latency.to_dict(),
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+        }
+
+
+class ApiMetrics:
+    slow_threshold: float = 1.0
+    prefix: str = "proximate_api"
+
+    def __init__(self, slow_threshold: float = slow_threshold, buckets=LATENCY_BUCKETS):
+        """
+        :param slow_threshold: float - calls taking at least this many seconds are logged, None to disable
+        """
+        self.slow_threshold = slow_threshold
+        self.buckets = tuple(buckets)
+        self.log: logging.Logger = logging.getLogger("ApiMetrics")
+        self._lock = threading.Lock()
+        self._stats: dict = {}
+
+    def __call__(self, request, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = request(method, url, **kwargs)
+        except Exception as e:
+            self.observe(method, url, time.perf_counter() - start, error=e, request_bytes=self._size(kwargs.get("data")))
+            raise
+        self.observe(
+            method,
+            url,
+            time.perf_counter() - start,
+            status=response.status_code,
+            request_bytes=self._size(kwargs.get("data")),
+            response_bytes=len(response.content or b""),
+        )
+        return response
+
+    @staticmethod
+    def _size(data) -> int:
+        if not data or not isinstance(data, dict):
+            return 0
+        return len(urlparse.urlencode(data, doseq=True))
+
+    def observe(self, method, url, elapsed, status=None, error=None, request_bytes=0, response_bytes=0):
+        """Record one API call
+        :param url: str - request url or path, reduced to its endpoint template
+        :param elapsed: float - seconds the call took
+        :param status: int, optional - HTTP status, 4xx and 5xx count as errors
+        :param error: Exception, optional - raised by the call, counts as error
+        """
+        key = (method.upper(), endpoint(url))
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = EndpointStats(self.buckets)
+            stats.calls += 1
+            if error is not None or (status is not None and status >= 400):
+                stats.errors += 1
+            stats.latency.observe(elapsed)
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+
+        if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+            self.log.warning(msg="Slow API call %s %s took %.3fs (status %s)" % (key[0], url, elapsed, status or error))
+
+    def stats(self, method=None, path=None) -> dict:
+        """Query recorded metrics
+        :param method: str, optional - only this HTTP method
+        :param path: str, optional - only this endpoint template or request path
+        :return: dict - ``"METHOD /endpoint"`` to a dict of calls, errors, latency and byte counts
+        """
+        path = endpoint(path) if path is not None else None
+        with self._lock:
+            return {
+                "%s %s" % key: stats.to_dict()
+                for key, stats in sorted(self._stats.items())
+                if (method is None or key[0] == method.upper()) and (path is None or key[1] == path)
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.stats(), **kwargs)
+
+    def to_prometheus(self) -> str:
+        """Export in the Prometheus text exposition format"""
+        p = self.prefix
+        lines = []
+        with self._lock:
+            items = sorted(self._stats.items())
+            for name, kind, help, value in (
+                ("calls_total", "counter", "API calls by endpoint", lambda s: s.calls),
+                ("errors_total", "counter", "Failed API calls by endpoint", lambda s: s.errors),
+                ("request_bytes_total", "counter", "Request payload bytes by endpoint", lambda s: s.request_bytes),
+                ("response_bytes_total", "counter", "Response payload bytes by endpoint", lambda s: s.response_bytes),
+            ):
+                lines.append("# HELP %s_%s %s" % (p, name, help))
+                lines.append("# TYPE %s_%s %s" % (p, name, kind))
+                for (method, path), stats in items:
+                    lines.append('%s_%s{method="%s",endpoint="%s"} %s' % (p, name, method, path, value(stats)))
+
+            lines.append("# HELP %s_latency_seconds API call latency by endpoint" % p)
+            lines.append("# TYPE %s_latency_seconds histogram" % p)
+            for (method, path), stats in items:
+                labels = 'method="%s",endpoint="%s"' % (method, path)
+                cumulative = 0
+                for bound, count in zip([repr(b) for b in stats.latency.buckets] + ["+Inf"], stats.latency.counts):
+                    cumulative += count
+                    lines.append('%s_latency_seconds_bucket{%s,le="%s"} %d' % (p, labels, bound, cumulative))
+                lines.append("%s_latency_seconds_sum{%s} %r" % (p, labels, stats.latency.sum))
+                lines.append("%s_latency_seconds_count{%s} %d" % (p, labels, stats.latency.count))
+        return "\n".join(lines) + "\n"
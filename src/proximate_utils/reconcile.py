@@ -0,0 +1,260 @@
+"""Declarative desired state for containers.
+
+``Reconciler.plan`` diffs a list of guest specs against a single ``cluster/resources`` read and returns the minimal
+ordered ``Plan`` of create, clone and config operations, ``Reconciler.apply`` runs it in parallel batches. Planning
+does not touch the API beyond that read: vmids are allocated from the snapshot, cores and memory are compared
+against it, and every managed guest carries a digest of its desired configuration as a tag, so options that
+``cluster/resources`` does not show (mounts, netif) are only re-applied when the spec changed. Only containers are
+managed, QEMU guests in the snapshot are never matched.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+
+from proximate_utils.actions import Actions
+from proximate_utils.bulk import BulkSummary, OperationResult, run_per_node
+from proximate_utils.snapshot import split_tags
+
+CREATE = "create"
+CLONE = "clone"
+CONFIG = "config"
+
+# spec keys mapped to cluster/resources fields and the factor turning the spec value into the resource value
+RESOURCE_FIELDS = {"cores": ("maxcpu", 1), "memory": ("maxmem", 1024 * 1024)}
+# spec keys only passed on when a guest is created
+CREATE_ONLY = ("ostemplate", "storage", "disk", "cpus", "swap", "password", "pubkey", "unprivileged", "ostype")
+# spec keys the clone endpoint accepts, everything else is set with a config update after cloning
+CLONE_KEYS = ("pool", "description", "storage")
+# tag carrying the digest of the desired configuration
+DIGEST_PREFIX = "rc-"
+
+
+def spec_digest(spec) -> str:
+    managed = {k: v for k, v in spec.items() if k not in ("node", "vmid", "clone", "clone_type") + CREATE_ONLY}
+    return DIGEST_PREFIX + hashlib.sha1(json.dumps(managed, sort_keys=True).encode("utf-8")).hexdigest()[:10]
+
+
+def config_parameters(spec) -> dict:
+    """API parameters of the configurable options of a spec"""
+    params = {}
+    for key in ("cores", "memory", "swap", "description", "onboot", "startup", "nameserver", "searchdomain"):
+        if spec.get(key) is not None:
+            params[key] = spec[key]
+    params.update(spec.get("mounts") or {})
+    params.update(spec.get("netif") or {})
+    return params
+
+
+@dataclass
+class Operation:
+    action: str
+    name: str
+    node: str
+    vmid: int
+    params: dict = field(default_factory=dict)
+
+    def __str__(self):
+        return "%s %s (%s on %s): %s" % (self.action, self.name, self.vmid, self.node, ", ".join(sorted(self.params)))
+
+
+@dataclass
+class Plan:
+    operations: list = field(default_factory=list)
+    unchanged: list = field(default_factory=list)
+    warnings: list = field(default_factory=list)
+
+    @property
+    def empty(self) -> bool:
+        return not self.operations
+
+    def by_action(self, action) -> list:
+        return [op for op in self.operations if op.action == action]
+
+    def __str__(self):
+        lines = [str(op) for op in self.operations] + ["warning: %s" % w for w in self.warnings]
+        lines.append(
+            "%d to create, %d to clone, %d to configure, %d unchanged"
+            % (len(self.by_action(CREATE)), len(self.by_action(CLONE)), len(self.by_action(CONFIG)), len(self.unchanged))
+        )
+        return "\n".join(lines)
+
+
+class Reconciler:
+    # seconds a create or clone task may take
+    timeout: float = 300.0
+
+    def __init__(self, actions: Actions):
+        self.actions = actions
+        self.log: logging.Logger = logging.getLogger("Reconciler")
+
+    @property
+    def digest_tags(self) -> bool:
+        # without tag support every config is re-applied, as there is nowhere to remember what was applied
+        capabilities = self.actions.info.capabilities()
+        return capabilities is None or capabilities.supports("tags")
+
+    def plan(self, specs, vms=None) -> Plan:
+        """Compute the operations turning the cluster into ``specs``
+        :param specs: iterable of dicts - one per guest with ``name`` and ``node`` and optionally ``vmid``, ``cores``,
+            ``memory``, ``swap``, ``tags``, ``mounts`` and ``netif`` (dicts of ``mpX``/``netX`` to value), ``pool``,
+            ``clone`` (vmid to clone from) or the ``create_instance`` options for a new guest (``ostemplate``,
+            ``storage``, ``disk``, ...). Guests that are not in specs are left alone.
+        :param vms: list, optional - ``cluster/resources`` guests to plan against, read once when omitted
+        :return: Plan
+        """
+        vms = list(vms) if vms is not None else self.actions.snapshot.refresh()
+        by_vmid = {int(vm["vmid"]): vm for vm in vms if "vmid" in vm}
+        by_name = {}
+        for vm in vms:
+            if vm.get("type", self.actions.VZ_TYPE) == self.actions.VZ_TYPE:
+                by_name.setdefault(vm.get("name"), []).append(vm)
+        used = set(by_vmid)
+        next_vmid = 100
+        digest_tags = self.digest_tags
+
+        plan = Plan()
+        for spec in specs:
+            spec = dict(spec)
+            name = spec["name"]
+            if spec.get("vmid") is not None:
+                current = by_vmid.get(int(spec["vmid"]))
+                if current is not None and current.get("type", self.actions.VZ_TYPE) != self.actions.VZ_TYPE:
+                    plan.warnings.append("%s: %s is a %s guest, skipped" % (name, spec["vmid"], current.get("type")))
+                    continue
+            else:
+                matches = by_name.get(name, [])
+                if len(matches) > 1:
+                    plan.warnings.append("%s matches several guests (%s), skipped" % (name, [m["vmid"] for m in matches]))
+                    continue
+                current = matches[0] if matches else None
+
+            digest = spec_digest(spec) if digest_tags else None
+            tags = split_tags(spec.get("tags")) | ({digest} if digest else set())
+
+            if current is None:
+                vmid = spec.get("vmid")
+                if vmid is None:
+                    while next_vmid in used:
+                        next_vmid += 1
+                    vmid = next_vmid
+                used.add(int(vmid))
+                plan.operations.extend(self._new_guest(spec, int(vmid), tags))
+                continue
+
+            vmid = int(current["vmid"])
+            if current.get("node") != spec["node"]:
+                warning = "%s (%d) is on %s instead of %s, not migrated" % (name, vmid, current.get("node"), spec["node"])
+                plan.warnings.append(warning)
+            params = self._changes(spec, current, tags, digest)
+            if params:
+                plan.operations.append(Operation(CONFIG, name, current.get("node"), vmid, params))
+            else:
+                plan.unchanged.append(name)
+
+        # creates and clones first, config updates of fresh clones depend on them
+        order = {CREATE: 0, CLONE: 0, CONFIG: 1}
+        plan.operations.sort(key=lambda op: order[op.action])
+        return plan
+
+    @staticmethod
+    def _new_guest(spec, vmid, tags) -> list:
+        name, node = spec["name"], spec["node"]
+        if spec.get("clone") is not None:
+            params = {k: spec[k] for k in CLONE_KEYS if spec.get(k) is not None}
+            params.update(clone=spec["clone"], clone_type=spec.get("clone_type", "opportunistic"), hostname=name)
+            config = config_parameters(spec)
+            if tags:
+                config["tags"] = ";".join(sorted(tags))
+            return [Operation(CLONE, name, node, vmid, params), Operation(CONFIG, name, node, vmid, config)]
+
+        params = {k: v for k, v in spec.items() if k not in ("name", "node", "vmid", "clone", "clone_type")}
+        params["hostname"] = name
+        if tags:
+            params["tags"] = sorted(tags)
+        return [Operation(CREATE, name, node, vmid, params)]
+
+    @staticmethod
+    def _changes(spec, current, tags, digest) -> dict:
+        """Config update for an existing guest, empty if it is up to date"""
+        # fields cluster/resources shows are always compared, a guest resized out of band is put back
+        params = {}
+        for key, (resource_field, factor) in RESOURCE_FIELDS.items():
+            if spec.get(key) is not None and current.get(resource_field) != int(spec[key]) * factor:
+                params[key] = spec[key]
+        current_tags = split_tags(current.get("tags"))
+        if digest is not None and digest in current_tags:
+            return params
+
+        # options cluster/resources does not show are always (re)applied when the digest does not match
+        desired = config_parameters(spec)
+        params.update({k: v for k, v in desired.items() if k not in RESOURCE_FIELDS})
+        # a changed digest always rewrites the tags, without one only declared tags are compared
+        if digest is not None or (spec.get("tags") is not None and tags != current_tags):
+            params["tags"] = ";".join(sorted(tags))
+        return params
+
+    def _run(self, operation) -> OperationResult:
+        start = time.monotonic()
+        try:
+            if operation.action == CONFIG:
+                proxmox_node = self.actions.proxmox.nodes(operation.node)
+                getattr(proxmox_node, self.actions.VZ_TYPE)(operation.vmid).config.put(**operation.params)
+                ok = True
+            else:
+                params = dict(operation.params)
+                ok = self.actions.create_instance(
+                    vmid=operation.vmid,
+                    node=operation.node,
+                    disk=params.pop("disk", None),
+                    storage=params.pop("storage", None),
+                    cpus=params.pop("cpus", None),
+                    memory=params.pop("memory", None),
+                    swap=params.pop("swap", None),
+                    timeout=self.timeout,
+                    clone=params.pop("clone", None),
+                    **params,
+                )
+            error = None if ok else "%s of %s failed, see log for details" % (operation.action, operation.name)
+        except Exception as e:
+            ok, error = False, str(e)
+        return OperationResult(operation.vmid, operation.node, ok, time.monotonic() - start, error)
+
+    def apply(self, plan: Plan, max_workers=8, per_node=2, callback=None) -> BulkSummary:
+        """Run a plan, creates and clones in parallel first, then config updates in parallel
+        :param callback: callable, optional - called with each OperationResult as it finishes
+        :return: BulkSummary - a config update of a guest whose clone failed is reported as failed without running
+        """
+        summary = BulkSummary()
+        start = time.monotonic()
+        failed = set()
+        for batch in ([op for op in plan.operations if op.action != CONFIG], plan.by_action(CONFIG)):
+            runnable = []
+            for op in batch:
+                if op.vmid in failed:
+                    result = OperationResult(op.vmid, op.node, False, 0.0, "skipped, %s could not be created" % op.name)
+                    summary.results.append(result)
+                    if callback is not None:
+                        callback(result)
+                else:
+                    runnable.append(op)
+            for _, future in run_per_node(runnable, self._run, lambda op: op.node, max_workers, per_node):
+                result = future.result()
+                if not result.ok:
+                    failed.add(result.vmid)
+                summary.results.append(result)
+                if callback is not None:
+                    callback(result)
+        if plan.operations:
+            self.actions.snapshot.invalidate()
+        summary.elapsed = time.monotonic() - start
+        self.log.info(msg="Applied plan: %s" % summary)
+        return summary
+
+    def reconcile(self, specs, max_workers=8, per_node=2) -> BulkSummary:
+        plan = self.plan(specs)
+        for warning in plan.warnings:
+            self.log.warning(msg=warning)
+        return self.apply(plan, max_workers, per_node)
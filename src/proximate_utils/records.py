@@ -0,0 +1,261 @@
+"""Compact, immutable records for cluster resources and API secrets.
+
+API payloads arrive as one dict per guest, node, storage or volume, and a long running process holding snapshots of
+tens of thousands of them pays for a hash table per record. The record types keep the fields PVE documents for each
+kind in one slotted tuple, anything else in a small ``extra`` dict that is usually empty, and intern low-cardinality
+strings such as node, status and type so every record shares one copy. Records read like the payload they replace
+(``vm["vmid"]``, ``vm.get("tags")``, ``dict(vm)``, ``vm == {...}``), code written against the raw dicts keeps
+working. Fields the payload did not carry read as None and are not keys. Records are not dicts though:
+``json.dumps`` needs ``as_dict`` (or ``daemon.encode`` as ``default``).
+"""
+
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from itertools import compress, repeat
+from operator import is_not
+
+
+class _Strings(dict):
+    # interned fields are low-cardinality, the cap only guards a long running process against a misdeclared one
+    limit = 65536
+
+    def __missing__(self, key):
+        if len(self) < self.limit:
+            self[key] = key
+        return key
+
+
+# one shared copy of every interned value
+_intern = _Strings().__getitem__
+
+
+def as_dict(payload) -> dict:
+    """Plain dict of a record or any other mapping"""
+    return payload.as_dict() if isinstance(payload, Record) else dict(payload)
+
+
+class Record(Mapping):
+    """Base of the record types, subclasses list their ``fields``
+
+    The values live in one tuple slot, interned fields first and the extra dict last, so building a record is two
+    ``map`` calls over the payload and a single slot store instead of a descriptor call per field. Attribute access
+    (``vm.vmid``) goes through generated properties. Reading a record stays slower than reading a dict: ``dict(vm)``
+    looks every key up through ``__getitem__`` and ``vm == {...}`` builds the dict first, so hot paths use
+    ``as_dict()``.
+    """
+
+    __slots__ = ("_values",)
+    fields: tuple = ()
+    # fields that are keys even when None
+    required: tuple = ()
+    # fields whose values are strings that repeat across records and are interned
+    interned: tuple = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._plain = tuple(name for name in cls.fields if name not in cls.interned)
+        cls._order = cls.interned + cls._plain
+        cls._index = {name: i for i, name in enumerate(cls._order)}
+        cls._field_set = frozenset(cls.fields)
+        cls._required_at = tuple(cls._index[name] for name in cls.required)
+        for i, name in enumerate(cls._order):
+            setattr(cls, name, property(lambda self, i=i: self._values[i], doc="``%s`` of the payload" % name))
+
+    def __new__(cls, **values):
+        return cls._build(values)
+
+    @classmethod
+    def _build(cls, payload):
+        get = payload.get
+        extra = None
+        if not cls._field_set.issuperset(payload.keys()):
+            extra = {key: value for key, value in payload.items() if key not in cls._field_set}
+        record = object.__new__(cls)
+        _set_values(record, (*map(_intern, map(get, cls.interned)), *map(get, cls._plain), extra))
+        return record
+
+    @classmethod
+    def from_payload(cls, payload):
+        """Record of a single API payload, a record of this type is returned as is"""
+        if type(payload) is cls:
+            return payload
+        return cls._build(payload)
+
+    @classmethod
+    def from_payloads(cls, payloads) -> list:
+        """Records of a list of API payloads, e.g. the answer of ``cluster/resources``"""
+        build = cls._build
+        return [payload if type(payload) is cls else build(payload) for payload in payloads or ()]
+
+    @property
+    def extra(self) -> dict:
+        """Payload fields without a slot"""
+        return dict(self._values[-1] or {})
+
+    def as_dict(self) -> dict:
+        """The record as the payload dict"""
+        values = self._values
+        record = dict(compress(zip(self._order, values), map(is_not, values, repeat(None, len(self._order)))))
+        for i in self._required_at:
+            if values[i] is None:
+                record[self._order[i]] = None
+        if values[-1]:
+            record.update(values[-1])
+        return record
+
+    def replace(self, **changes):
+        """Copy with some fields changed"""
+        return type(self)._build(dict(self.as_dict(), **changes))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is read-only" % type(self).__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError("%s is read-only" % type(self).__name__)
+
+    def __reduce__(self):
+        return type(self).from_payload, (self.as_dict(),)
+
+    def __getitem__(self, key):
+        i = self._index.get(key)
+        if i is None:
+            extra = self._values[-1]
+            if extra is None:
+                raise KeyError(key)
+            return extra[key]
+        value = self._values[i]
+        if value is None and i not in self._required_at:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        i = self._index.get(key)
+        if i is None:
+            extra = self._values[-1]
+            return default if extra is None else extra.get(key, default)
+        value = self._values[i]
+        return default if value is None and i not in self._required_at else value
+
+    def __contains__(self, key):
+        i = self._index.get(key)
+        if i is None:
+            extra = self._values[-1]
+            return extra is not None and key in extra
+        return self._values[i] is not None or i in self._required_at
+
+    def keys(self) -> list:
+        return list(self.as_dict())
+
+    def __iter__(self):
+        return iter(self.as_dict())
+
+    def __len__(self):
+        return len(self.as_dict())
+
+    def __eq__(self, other):
+        if type(other) is type(self):
+            return self._values == other._values
+        if isinstance(other, Record):
+            return self.as_dict() == other.as_dict()
+        if isinstance(other, Mapping):
+            return self.as_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join("%s=%r" % item for item in self.as_dict().items()))
+
+
+_set_values = Record._values.__set__
+
+
+class Guest(Record):
+    """A qemu or lxc guest of ``cluster/resources``"""
+
+    __slots__ = ()
+    fields = (
+        "vmid",
+        "name",
+        "node",
+        "type",
+        "status",
+        "pool",
+        "tags",
+        "template",
+        "hastate",
+        "lock",
+        "id",
+        "maxcpu",
+        "maxmem",
+        "maxdisk",
+        "cpu",
+        "mem",
+        "disk",
+        "uptime",
+        "netin",
+        "netout",
+        "diskread",
+        "diskwrite",
+    )
+    required = ("vmid",)
+    # tags are free-form, interning them would keep every tag string ever seen
+    interned = ("node", "type", "status", "pool", "hastate", "lock")
+
+
+class Node(Record):
+    """A node of ``nodes``"""
+
+    __slots__ = ()
+    fields = (
+        "node",
+        "status",
+        "type",
+        "id",
+        "level",
+        "cpu",
+        "maxcpu",
+        "mem",
+        "maxmem",
+        "disk",
+        "maxdisk",
+        "uptime",
+        "ssl_fingerprint",
+    )
+    required = ("node",)
+    interned = ("node", "status", "type", "level")
+
+
+class Storage(Record):
+    """A storage of ``storage``"""
+
+    __slots__ = ()
+    fields = ("storage", "type", "content", "shared", "nodes", "disable", "path", "pool", "server", "export", "digest")
+    required = ("storage",)
+    interned = ("type", "content", "nodes")
+
+
+class Volume(Record):
+    """A storage content listing entry together with the node and storage it was listed on"""
+
+    __slots__ = ()
+    fields = ("node", "storage", "volid", "content", "format", "size", "used", "vmid", "ctime", "notes", "protected")
+    required = fields
+    interned = ("node", "storage", "content", "format")
+
+
+@dataclass(frozen=True, slots=True)
+class ApiSecret:
+    """Credentials of a cluster, detached from the secrets store entry they were read from"""
+
+    title: str
+    url: str
+    username: str
+    password: str = field(default=None, repr=False)
+
+    @classmethod
+    def from_entry(cls, entry) -> "ApiSecret":
+        """
+        :param entry: pykeepass.entry.Entry - an entry of the project group
+        """
+        return cls(entry.title, entry.url, entry.username, entry.password)
@@ -3,66 +3,231 @@
 https://github.com/ansible-collections/community.general/blob/d2d7deb4ecb978dd21a68b4ebd372da891ee3029/plugins/module_utils/proxmox.py#L12
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from proxmoxer import ProxmoxAPI
+import functools
+import inspect
 import logging
+import time
+
+from proximate_utils.breaker import CircuitOpenError
+from proximate_utils.health import ClusterHealth, node_health
+from proximate_utils.records import Node, Storage, Volume
+from proximate_utils.watch import watch_resources
+from proximate_utils.snapshot import ResourceSnapshot
+
+# parts of the cluster health summary fetched for every node
+HEALTH_PARTS = ("status", "storage", "subscription")
+
+# fields every storage content record carries, missing ones are None
+VOLUME_FIELDS = Volume.fields
+
+
+def logs_errors(message):
+    """Log what the decorated method raises and return None instead
+    :param message: str - formatted with the arguments of the call by name and ``error``, e.g.
+        ``"Unable to retrieve pool %(poolid)s: %(error)s"``
+    ``CircuitOpenError`` is raised, callers tell an unreachable node from a missing resource by it
+    """
+
+    def decorate(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return method(self, *args, **kwargs)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                call = signature.bind(self, *args, **kwargs)
+                call.apply_defaults()
+                self.log.error(msg=message % dict(call.arguments, error=e))
+
+        return wrapper
+
+    return decorate
+
+
+def storage_pairs(nodes, storages, shared_once=False) -> list:
+    """Every (node, storage) pair whose content can be listed
+    :param nodes: list of dicts - from ``get_nodes``, nodes that are not online are skipped
+    :param storages: list of dicts - from ``get_storages``, disabled storages and nodes outside the ``nodes``
+        restriction of a storage are skipped
+    :param shared_once: bool - list shared storages on the first node only, their content is the same everywhere
+    :return: list of tuples - (node, storage)
+    """
+    online = sorted(n["node"] for n in nodes if n.get("status", "online") == "online")
+    pairs = []
+    for s in sorted(storages, key=lambda s: s["storage"]):
+        if s.get("disable"):
+            continue
+        allowed = [node for node in online if not s.get("nodes") or node in s["nodes"].split(",")]
+        if shared_once and s.get("shared"):
+            allowed = allowed[:1]
+        pairs.extend((node, s["storage"]) for node in allowed)
+    return pairs
+
+
+def normalize_volume(node, storage, volume) -> Volume:
+    """Content record with ``VOLUME_FIELDS`` always present and ``vmid`` as int"""
+    record = {field: volume.get(field) for field in VOLUME_FIELDS}
+    record.update(node=node, storage=storage)
+    if record["vmid"] is not None:
+        record["vmid"] = int(record["vmid"])
+    return Volume.from_payload(record)
 
 
 class Resources:
-    def __init__(self, proxmox: ProxmoxAPI):
+    def __init__(self, proxmox: ProxmoxAPI, snapshot: ResourceSnapshot = None):
         self.proxmox = proxmox
+        self.snapshot: ResourceSnapshot = snapshot if snapshot is not None else ResourceSnapshot(proxmox)
         self.log: logging.Logger = logging.getLogger("Resources")
 
+    @logs_errors("Unable to retrieve Proxmox VE nodes: %(error)s")
     def get_nodes(self):
-        try:
-            return [node for node in self.proxmox.nodes.get()]
-        except Exception as e:
-            self.log.error(msg="Unable to retrieve Proxmox VE nodes: %s" % e)
+        return Node.from_payloads(self.proxmox.nodes.get())
 
+    @logs_errors("Unable to retrieve Proxmox VE node: %(error)s")
     def get_node(self, node):
+        return Node.from_payload([n for n in self.proxmox.nodes.get() if n["node"] == node][0])
+
+    def get_cluster_health(self, timeout=5.0, max_workers=16) -> ClusterHealth:
+        """Status, load, memory, storage usage and subscription of every node, fetched concurrently
+        :param timeout: float - seconds the node calls may take altogether, a node that does not answer in time is
+            reported with the data that did arrive and an error for each missing part, calls still queued behind a
+            hung node included
+        :param max_workers: int - maximum number of concurrent calls, calls beyond it queue
+        :return: ClusterHealth - None if the node list could not be retrieved
+        """
+        start = time.monotonic()
+        nodes = self.get_nodes()
+        if nodes is None:
+            return None
+
+        calls = {
+            "status": lambda node: self.proxmox.nodes(node).status.get(),
+            "storage": lambda node: self.proxmox.nodes(node).storage.get(),
+            "subscription": lambda node: self.proxmox.nodes(node).subscription.get(),
+        }
+        deadline = time.monotonic() + timeout
+
+        def fetch(node, part):
+            # calls still queued at the deadline are not made, answers arriving after it are not used
+            if time.monotonic() >= deadline:
+                raise TimeoutError("timed out after %ss" % timeout)
+            result = calls[part](node)
+            if time.monotonic() >= deadline:
+                raise TimeoutError("timed out after %ss" % timeout)
+            return result
+
+        # offline nodes are not asked, their calls would only run into the timeout
+        online = [n["node"] for n in nodes if n.get("status", "online") == "online"]
+        pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(online) * len(calls))))
         try:
-            return [n for n in self.proxmox.nodes.get() if n["node"] == node][0]
-        except Exception as e:
-            self.log.error(msg="Unable to retrieve Proxmox VE node: %s" % e)
+            # one part of every node after another, a hung node holds as few workers as possible early on
+            futures = {(node, part): pool.submit(fetch, node, part) for part in HEALTH_PARTS for node in online}
+            wait(futures.values(), timeout=max(0.0, deadline - time.monotonic()))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        summary = ClusterHealth()
+        for entry in sorted(nodes, key=lambda n: n["node"]):
+            parts, errors = {}, {}
+            for part in HEALTH_PARTS:
+                future = futures.get((entry["node"], part))
+                if future is None:
+                    continue
+                if not future.done() or future.cancelled():
+                    errors[part] = "timed out after %ss" % timeout
+                elif future.exception() is not None:
+                    errors[part] = str(future.exception())
+                else:
+                    parts[part] = future.result()
+            if errors:
+                self.log.error(msg="Incomplete health of node %s: %s" % (entry["node"], errors))
+            summary.nodes.append(
+                node_health(entry, parts.get("status"), parts.get("storage"), parts.get("subscription"), errors)
+            )
+        summary.elapsed = time.monotonic() - start
+        return summary
 
     def get_vms(self) -> list:
-        return [vm for vm in self.proxmox.cluster.resources.get(type="vm")]
+        return self.snapshot.vms()
 
+    @logs_errors("Unable to retrieve list of VMs filtered by vmid %(vmid)s: %(error)s")
     def get_vm(self, vmid, ignore_missing=False):
-        global vms
-        try:
-            vms = [vm for vm in self.proxmox.cluster.resources.get(type="vm") if vm["vmid"] == int(vmid)]
-        except Exception as e:
-            vms = None
-            self.log.error(msg="Unable to retrieve list of VMs filtered by vmid %s: %s" % (vmid, e))
-        if vms:
-            return vms[0]
+        vm = self.snapshot.by_vmid(vmid)
+        if vm:
+            return vm
         else:
             if ignore_missing:
                 return None
             self.log.error(msg="VM with vmid %s does not exist in cluster" % vmid)
 
+    def watch(self, min_interval=1.0, max_interval=30.0, backoff=1.5, initial=False, stop=None):
+        """Yield ``ResourceEvent`` for guests that were added, removed, changed status, migrated or were reconfigured
+        since the previous poll, see ``watch_resources``. Every poll also refreshes the shared snapshot.
+        """
+        return watch_resources(self.snapshot.refresh, min_interval, max_interval, backoff, initial, stop)
+
+    @logs_errors("Unable to retrieve pools: %(error)s")
+    def get_pools(self):
+        return self.proxmox.pools.get()
+
+    @logs_errors("Unable to retrieve pool %(poolid)s information: %(error)s")
     def get_pool(self, poolid):
         """Retrieve pool information
         :param poolid: str - name of the pool
         :return: dict - pool information
         """
-        try:
-            return self.proxmox.pools(poolid).get()
-        except Exception as e:
-            self.log.error(msg="Unable to retrieve pool %s information: %s" % (poolid, e))
+        return self.proxmox.pools(poolid).get()
 
+    @logs_errors("Unable to retrieve storages information with type %(type)s: %(error)s")
     def get_storages(self, type):
         """Retrieve storages information
         :param type: str, optional - type of storages
-        :return: list of dicts - array of storages
+        :return: list of Storage - array of storages
         """
-        try:
-            return self.proxmox.storage.get(type=type)
-        except Exception as e:
-            self.log.error(msg="Unable to retrieve storages information with type %s: %s" % (type, e))
+        return Storage.from_payloads(self.proxmox.storage.get(type=type))
 
+    @logs_errors("Unable to list content on %(node)s, %(storage)s for %(content)s and %(vmid)s: %(error)s")
     def get_storage_content(self, node, storage, content=None, vmid=None):
+        return self.proxmox.nodes(node).storage(storage).content().get(content=content, vmid=vmid)
+
+    def iter_storage_content(self, content=None, vmid=None, shared_once=True, max_workers=8):
+        """Content of every storage on every node, listed concurrently
+        :param content: str or iterable, optional - only these content types (iso, vztmpl, backup, images, rootdir)
+        :param vmid: int, optional - only volumes owned by this guest
+        :param shared_once: bool - list shared storages on one node only
+        :param max_workers: int - maximum number of concurrent listings
+        :return: generator of Volume - normalized records (see ``VOLUME_FIELDS``) in the order the listings complete
+        """
+        nodes = self.get_nodes()
+        storages = self.get_storages(None)
+        if nodes is None or storages is None:
+            return
+        pairs = storage_pairs(nodes, storages, shared_once)
+        # a single content type and the vmid are filtered by the API, several types locally
+        types = None if content is None or isinstance(content, str) else set(content)
+        query = content if types is None else None
+
+        pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pairs))))
         try:
-            return self.proxmox.nodes(node).storage(storage).content().get(content=content, vmid=vmid)
-        except Exception as e:
-            self.log.error(msg="Unable to list content on %s, %s for %s and %s: %s" % (node, storage, content, vmid, e))
+            futures = {
+                pool.submit(self.get_storage_content, node, storage, query, vmid): (node, storage) for node, storage in pairs
+            }
+            for future in as_completed(futures):
+                node, storage = futures[future]
+                try:
+                    volumes = future.result()
+                except CircuitOpenError as e:
+                    # one unreachable node does not end the listing of the others
+                    self.log.error(msg="Skipping %s on %s: %s" % (storage, node, e))
+                    continue
+                for volume in volumes or ():
+                    if types is None or volume.get("content") in types:
+                        yield normalize_volume(node, storage, volume)
+        finally:
+            # a consumer that stops early does not wait for the remaining listings
+            pool.shutdown(wait=False, cancel_futures=True)
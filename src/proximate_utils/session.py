@@ -0,0 +1,104 @@
+"""HTTP session management for ProxmoxAPI connections.
+
+proxmoxer creates one ``requests`` session per ``ProxmoxAPI`` with default pooling. ``connect`` builds the API with
+an explicitly sized keep-alive connection pool, a retry policy for idempotent requests and split connect/read
+timeouts. The resulting ``ProxmoxAPI`` is meant to be created once and shared by ``Info``, ``Actions`` and any
+worker threads.
+"""
+
+import functools
+from dataclasses import dataclass
+from urllib import parse as urlparse
+
+from proxmoxer import ProxmoxAPI
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+@dataclass
+class SessionConfig:
+    # number of hosts to keep connection pools for
+    pool_connections: int = 4
+    # connections kept open per host, size this to the number of threads sharing the session
+    pool_maxsize: int = 16
+    # wait for a free connection instead of opening one that is thrown away afterwards
+    pool_block: bool = True
+    keep_alive: bool = True
+    # retries for idempotent requests on connection errors and the listed status codes
+    retries: int = 3
+    backoff_factor: float = 0.2
+    status_forcelist: tuple = (502, 503, 504)
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+
+    @property
+    def timeout(self) -> tuple:
+        return self.connect_timeout, self.read_timeout
+
+    def retry(self) -> Retry:
+        return Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.status_forcelist,
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False,
+        )
+
+    def adapter(self) -> HTTPAdapter:
+        return HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+            max_retries=self.retry(),
+        )
+
+
+def host_from_url(url) -> str:
+    """Reduce a url such as ``https://pve.example.com:8006/`` to the ``host:port`` proxmoxer expects"""
+    url = str(url).strip()
+    parsed = urlparse.urlsplit(url if "//" in url else "//" + url)
+    return parsed.netloc or parsed.path.rstrip("/")
+
+
+def configure_session(proxmox: ProxmoxAPI, config: SessionConfig):
+    """Apply pooling, retry and timeout settings to the session of an existing ``ProxmoxAPI``
+    :return: requests.Session - the configured session
+    """
+    session = proxmox._store["session"]
+    adapter = config.adapter()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Connection"] = "keep-alive" if config.keep_alive else "close"
+    # proxmoxer falls back to the timeout of its auth object for every request
+    if session.auth is not None:
+        session.auth.timeout = config.timeout
+    return session
+
+
+def install_layer(proxmox: ProxmoxAPI, layer):
+    """Wrap every request of a ``ProxmoxAPI`` session
+    :param layer: callable - called as ``layer(request, method, url, **kwargs)`` where ``request`` performs the
+        wrapped call, layers installed later run first
+    """
+    session = proxmox._store["session"]
+    session.request = functools.partial(layer, session.request)
+    return layer
+
+
+def connect(host, config: SessionConfig = None, layers=(), **kwargs) -> ProxmoxAPI:
+    """Create a ``ProxmoxAPI`` with a pooled, keep-alive session
+    :param host: str - host, ``host:port`` or url of the PVE API
+    :param config: SessionConfig, optional - pool settings, defaults are used when omitted
+    :param layers: iterable, optional - request layers, see ``install_layer``, the first one is outermost
+    :param kwargs: passed on to ``ProxmoxAPI`` (user, password, token_name, token_value, verify_ssl, ...)
+    """
+    config = config if config is not None else SessionConfig()
+    kwargs.setdefault("timeout", config.timeout)
+    proxmox = ProxmoxAPI(host_from_url(host), **kwargs)
+    configure_session(proxmox, config)
+    for layer in reversed(list(layers)):
+        install_layer(proxmox, layer)
+    return proxmox
@@ -0,0 +1,112 @@
+"""Cluster resource snapshot for the Proxmoxer API.
+
+Fetches ``cluster/resources`` once and serves guest lookups from hash indexes until the snapshot
+expires or is invalidated by a mutating call.
+"""
+
+import logging
+import threading
+import time
+
+from proxmoxer import ProxmoxAPI
+
+from proximate_utils.records import Guest
+
+
+def split_tags(tags) -> set:
+    """Tags of a guest, ``cluster/resources`` separates them with semicolons, the create call with commas"""
+    if not tags:
+        return set()
+    if isinstance(tags, str):
+        tags = tags.replace(",", ";").split(";")
+    return {tag.strip() for tag in tags if tag.strip()}
+
+
+class ResourceSnapshot:
+    """Indexed, TTL-bound view of the guests (``type=vm``) known to the cluster.
+
+    A single snapshot is meant to be shared by ``Resources``, ``Info`` and ``Actions`` so that
+    lookups by vmid, name, node or pool cost one request per ``ttl`` window instead of one per call.
+    """
+
+    ttl: float = 10.0
+
+    def __init__(self, proxmox: ProxmoxAPI, ttl: float = ttl):
+        self.proxmox = proxmox
+        self.ttl = ttl
+        self.log: logging.Logger = logging.getLogger("ResourceSnapshot")
+        self._lock = threading.RLock()
+        self._fetched_at = None
+        self._vms = []
+        self._by_vmid = {}
+        self._by_name = {}
+        self._by_node = {}
+        self._by_pool = {}
+
+    @property
+    def stale(self) -> bool:
+        return self._fetched_at is None or time.monotonic() - self._fetched_at >= self.ttl
+
+    def invalidate(self):
+        """Drop the current snapshot so the next lookup fetches cluster resources again."""
+        self._fetched_at = None
+
+    def refresh(self) -> list:
+        """Fetch cluster resources and rebuild all indexes
+        :return: list of Guest - guests in the cluster
+        """
+        with self._lock:
+            return self.load(self.proxmox.cluster.resources.get(type="vm"))
+
+    def load(self, vms) -> list:
+        """Rebuild all indexes from an already fetched ``cluster/resources`` payload"""
+        vms = Guest.from_payloads(vms)
+        by_vmid, by_name, by_node, by_pool = {}, {}, {}, {}
+        for vm in vms:
+            if "vmid" in vm:
+                by_vmid[int(vm["vmid"])] = vm
+            if vm.get("name") is not None:
+                by_name.setdefault(vm["name"], []).append(vm)
+            if vm.get("node") is not None:
+                by_node.setdefault(vm["node"], []).append(vm)
+            if vm.get("pool") is not None:
+                by_pool.setdefault(vm["pool"], []).append(vm)
+
+        with self._lock:
+            self._vms = vms
+            self._by_vmid, self._by_name, self._by_node, self._by_pool = by_vmid, by_name, by_node, by_pool
+            self._fetched_at = time.monotonic()
+        self.log.debug(msg="Indexed %d cluster resources" % len(vms))
+        return vms
+
+    def _ensure_fresh(self):
+        if not self.stale:
+            return
+        with self._lock:
+            # another thread may have refreshed while we waited on the lock
+            if self.stale:
+                self.refresh()
+
+    def vms(self) -> list:
+        self._ensure_fresh()
+        return list(self._vms)
+
+    def by_vmid(self, vmid):
+        """Look up a single guest
+        :param vmid: int or str - id of the guest
+        :return: Guest - None if it does not exist
+        """
+        self._ensure_fresh()
+        return self._by_vmid.get(int(vmid))
+
+    def by_name(self, name) -> list:
+        self._ensure_fresh()
+        return list(self._by_name.get(name, []))
+
+    def by_node(self, node) -> list:
+        self._ensure_fresh()
+        return list(self._by_node.get(node, []))
+
+    def by_pool(self, pool) -> list:
+        self._ensure_fresh()
+        return list(self._by_pool.get(pool, []))
@@ -0,0 +1,257 @@
+"""Task tracking for the Proxmoxer API.
+
+Instead of one status call per task, ``TaskWaiter`` polls each node's task list once per round for all
+tracked UPIDs and resolves a future for every task that has finished. ``TaskLogTail`` follows the log of a running
+task with ``start``/``limit`` offsets, so each poll only transfers the lines written since the previous one.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, wait
+
+from proxmoxer import ProxmoxAPI
+
+
+def parse_upid(upid) -> dict:
+    """Split a UPID into its fields
+    :param upid: str - e.g. ``UPID:node1:000A1B2C:0123ABCD:65A0B1C2:vzcreate:100:root@pam:``
+    :return: dict - node and starttime (epoch) of the task, empty if the UPID can not be parsed
+    """
+    parts = str(upid).split(":")
+    if len(parts) < 8 or parts[0] != "UPID":
+        return {}
+    try:
+        return {"node": parts[1], "starttime": int(parts[4], 16), "type": parts[5], "id": parts[6], "user": parts[7]}
+    except ValueError:
+        return {"node": parts[1]}
+
+
+def new_log_lines(entries, offset) -> list:
+    """Log entries (``n``, ``t``) past line ``offset``, PVE numbers lines from 1
+
+    PVE answers an empty log with a single ``no content`` line 1 instead of an empty list, that placeholder is no line.
+    """
+    entries = entries or ()
+    if len(entries) == 1 and int(entries[0].get("n", 0)) == 1 and entries[0].get("t") == "no content":
+        return []
+    return [entry for entry in entries if int(entry.get("n", 0)) > offset]
+
+
+class TaskLogTail:
+    """Incremental reader of a task log, iterate over it to receive new lines until the task has finished.
+
+    Created by ``TaskWaiter.tail``. Between polls the reader waits on the task's future, so it wakes up as soon as
+    the task ends, and backs off while the log stays quiet.
+    """
+
+    # lines requested per call, a reader that is far behind pages through the log
+    limit: int = 500
+
+    def __init__(self, waiter: "TaskWaiter", upid, node=None, timeout=None, start=0):
+        """
+        :param timeout: float, optional - seconds until iterating raises ``TimeoutError``
+        :param start: int - number of lines already read, e.g. to resume after a restart
+        """
+        self.waiter = waiter
+        self.upid = upid
+        self.node = node or parse_upid(upid).get("node")
+        if self.node is None:
+            raise ValueError("Unable to determine the node of task %s" % upid)
+        self.timeout = timeout
+        self.offset = start
+        self.last_line = None
+        # task status dict once iteration has finished
+        self.status = None
+
+    def read(self) -> list:
+        """Fetch the lines written since the previous read
+        :return: list of str - new lines, empty if nothing has been written
+        """
+        log = self.waiter.proxmox.nodes(self.node).tasks(self.upid).log
+        lines = []
+        while True:
+            entries = log.get(start=self.offset, limit=self.limit)
+            new = new_log_lines(entries, self.offset)
+            if new:
+                self.offset = int(new[-1]["n"])
+                lines.extend(entry.get("t", "") for entry in new)
+            if not new or len(entries) < self.limit:
+                break
+        if lines:
+            self.last_line = lines[-1]
+        return lines
+
+    def __iter__(self):
+        waiter = self.waiter
+        future = waiter.submit(self.upid, self.node)
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        interval = waiter.min_interval
+        while True:
+            # checked before reading, so the last read sees the complete log
+            finished = future.done()
+            try:
+                lines = self.read()
+            except Exception as e:
+                waiter.log.error(msg="Unable to read log of task %s: %s" % (self.upid, e))
+                lines = []
+            yield from lines
+            if finished:
+                self.status = future.result()
+                return
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                waiter.discard(self.upid)
+                raise TimeoutError("Task %s did not finish within %ss" % (self.upid, self.timeout))
+            interval = waiter.min_interval if lines else min(interval * waiter.backoff, waiter.max_interval)
+            wait([future], timeout=interval if remaining is None else min(interval, remaining))
+
+
+class TaskWaiter:
+    """Wait on many tasks at once from a single background thread.
+
+    Every polling round issues at most one ``nodes/{node}/tasks`` request per node with pending tasks.
+    The poll interval starts at ``min_interval`` and grows by ``backoff`` up to ``max_interval`` while
+    nothing changes, and drops back whenever a task is submitted.
+    """
+
+    min_interval: float = 0.1
+    max_interval: float = 2.0
+    backoff: float = 1.5
+    # number of task list entries requested per node and round
+    limit: int = 500
+
+    def __init__(
+        self,
+        proxmox: ProxmoxAPI,
+        min_interval: float = min_interval,
+        max_interval: float = max_interval,
+        backoff: float = backoff,
+    ):
+        self.proxmox = proxmox
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.log: logging.Logger = logging.getLogger("TaskWaiter")
+        self._pending: dict = {}
+        self._condition = threading.Condition()
+        self._interval = min_interval
+        self._thread = None
+
+    @staticmethod
+    def task_ok(status) -> bool:
+        return status is not None and status.get("status") == "stopped" and status.get("exitstatus") == "OK"
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def submit(self, upid, node=None, callback=None) -> Future:
+        """Track a task
+        :param upid: str - id of the task as returned by the API
+        :param node: str, optional - node running the task, parsed from the UPID when omitted
+        :param callback: callable, optional - called with the future once the task has finished
+        :return: Future - resolves to the task status dict (``status``, ``exitstatus``, ...)
+        """
+        node = node or parse_upid(upid).get("node")
+        if node is None:
+            raise ValueError("Unable to determine the node of task %s" % upid)
+
+        with self._condition:
+            entry = self._pending.get(upid)
+            if entry is None:
+                entry = {"node": node, "future": Future(), "starttime": parse_upid(upid).get("starttime")}
+                self._pending[upid] = entry
+            self._interval = self.min_interval
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="TaskWaiter", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+        if callback is not None:
+            entry["future"].add_done_callback(callback)
+        return entry["future"]
+
+    def wait(self, upid, node=None, timeout=None) -> bool:
+        """Block until a task has finished
+        :return: bool - True if the task finished successfully, False if it failed or timed out
+        """
+        try:
+            return self.task_ok(self.submit(upid, node).result(timeout=timeout))
+        except TimeoutError:
+            self.discard(upid)
+            return False
+
+    def tail(self, upid, node=None, timeout=None) -> TaskLogTail:
+        """Follow the log of a task
+        :return: TaskLogTail - iterate over it for new lines as they are written, ``status`` holds the task status
+            once the iteration has ended
+        """
+        return TaskLogTail(self, upid, node, timeout)
+
+    def discard(self, upid):
+        """Stop tracking a task without resolving its future"""
+        with self._condition:
+            entry = self._pending.pop(upid, None)
+        if entry is not None:
+            entry["future"].cancel()
+
+    def poll(self) -> int:
+        """Run a single polling round over every node with pending tasks
+        :return: int - number of tasks that finished in this round
+        """
+        with self._condition:
+            by_node = {}
+            for upid, entry in self._pending.items():
+                by_node.setdefault(entry["node"], {})[upid] = entry
+
+        finished = 0
+        for node, entries in by_node.items():
+            for upid, status in self._poll_node(node, entries).items():
+                with self._condition:
+                    entry = self._pending.pop(upid, None)
+                if entry is not None and entry["future"].set_running_or_notify_cancel():
+                    entry["future"].set_result(status)
+                    finished += 1
+        return finished
+
+    def _poll_node(self, node, entries) -> dict:
+        starttimes = [entry["starttime"] for entry in entries.values() if entry["starttime"] is not None]
+        since = min(starttimes) if len(starttimes) == len(entries) else None
+        try:
+            tasks = self.proxmox.nodes(node).tasks.get(source="all", since=since, limit=self.limit)
+        except Exception as e:
+            self.log.error(msg="Unable to retrieve task list from node %s: %s" % (node, e))
+            return {}
+
+        finished = {}
+        for task in tasks:
+            upid = task.get("upid")
+            if upid in entries and task.get("endtime") is not None:
+                finished[upid] = dict(task, status="stopped", exitstatus=task.get("status"))
+
+        # entries beyond the list limit need an individual status call
+        if len(tasks) >= self.limit:
+            for upid in entries.keys() - finished.keys() - {task.get("upid") for task in tasks}:
+                try:
+                    status = self.proxmox.nodes(node).tasks(upid).status.get()
+                except Exception as e:
+                    self.log.error(msg="Unable to retrieve API task ID from node %s: %s" % (node, e))
+                    continue
+                if status.get("status") == "stopped":
+                    finished[upid] = status
+        return finished
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._pending:
+                    self._thread = None
+                    return
+            if self.poll():
+                self._interval = self.min_interval
+            else:
+                self._interval = min(self._interval * self.backoff, self.max_interval)
+            with self._condition:
+                if self._pending:
+                    self._condition.wait(timeout=self._interval)
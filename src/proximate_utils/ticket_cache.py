@@ -0,0 +1,206 @@
+"""Cross-process cache for Proxmox VE auth tickets.
+
+Unlocking the KeePass store runs a deliberately slow KDF and a password login costs another round-trip. The ticket
+cache keeps the PVE auth ticket, its CSRF token and the connection details encrypted in the xdg state directory, so
+that a warm start can connect without touching the store or logging in again until the ticket nears expiry.
+
+The cache key is derived from the same token and key files that unlock the store, so the cache is no easier to
+read than the store itself. A cached ticket the server no longer accepts, e.g. after a restart or once revoked, is
+dropped from the cache and replaced by a password login, the password is only asked for then.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from Cryptodome.Cipher import AES
+from Cryptodome.Random import get_random_bytes
+from proxmoxer import ProxmoxAPI
+from proxmoxer.backends.https import AuthenticationError, ProxmoxHTTPAuth, ProxmoxHTTPAuthBase
+
+from proximate_utils.session import SessionConfig, configure_session, host_from_url
+
+
+class CachedTicketAuth(ProxmoxHTTPAuth):
+    """proxmoxer ticket auth that can start from a cached ticket and writes every new ticket back to the cache"""
+
+    def __init__(self, username, base_url, cache, ticket=None, password=None, login=None, **kwargs):
+        """
+        :param ticket: dict, optional - cache entry to start from, a login with ``password`` happens otherwise
+        :param login: callable, optional - returns the password when the ticket is rejected, without it a rejected
+            ticket is only dropped from the cache
+        """
+        ProxmoxHTTPAuthBase.__init__(self, **kwargs)
+        self.base_url = base_url
+        self.username = username
+        self.cache = cache
+        self.login = login
+        self.pve_auth_ticket = ""
+        self._lock = threading.Lock()
+
+        if ticket is not None:
+            self.pve_auth_ticket = ticket["ticket"]
+            self.csrf_prevention_token = ticket["csrf_token"]
+            self.issued = ticket["issued"]
+            # keep proxmoxer's renewal schedule relative to when the ticket was issued
+            self.birth_time = time.monotonic() - max(0.0, time.time() - self.issued)
+        else:
+            self._get_new_tokens(password=password)
+
+    def _get_new_tokens(self, password=None, otp=None, otptype=None):
+        super()._get_new_tokens(password=password, otp=otp, otptype=otptype)
+        self.issued = time.time()
+        self.cache.save(
+            {
+                "base_url": self.base_url,
+                "username": self.username,
+                "ticket": self.pve_auth_ticket,
+                "csrf_token": self.csrf_prevention_token,
+                "issued": self.issued,
+            }
+        )
+
+    def _login_again(self, rejected) -> bool:
+        """Replace the ticket ``rejected`` by a password login, unless another thread already did
+        :return: bool - a new ticket is in place
+        """
+        with self._lock:
+            if self.pve_auth_ticket != rejected:
+                return True
+            self.cache.clear()
+            if self.login is None:
+                return False
+            self.cache.log.warning(msg="Ticket of %s was rejected, logging in again" % self.username)
+            self._get_new_tokens(password=self.login())
+            return True
+
+    def __call__(self, req):
+        ticket = self.pve_auth_ticket
+        try:
+            req = super().__call__(req)
+        except AuthenticationError:
+            # renewing logs in with the ticket itself, which fails once the server has dropped it
+            if not self._login_again(ticket):
+                raise
+            req = self._with_ticket(super().__call__(req))
+        req.register_hook("response", functools.partial(self._retry_rejected, self.pve_auth_ticket))
+        return req
+
+    def _with_ticket(self, req):
+        # the cookie was set from the old ticket before auth ran
+        req.headers.pop("Cookie", None)
+        req.prepare_cookies(self.get_cookies())
+        if req.method != "GET":
+            req.headers["CSRFPreventionToken"] = self.csrf_prevention_token
+        return req
+
+    def _retry_rejected(self, ticket, response, **kwargs):
+        """Response hook sending a request that failed with 401 once more after logging in again"""
+        if response.status_code != 401 or not self._login_again(ticket):
+            return response
+        # read the body so the connection can be reused, like requests' digest auth does
+        response.content
+        response.close()
+        req = self._with_ticket(response.request.copy())
+        retried = response.connection.send(req, **kwargs)
+        retried.history.append(response)
+        retried.request = req
+        return retried
+
+
+class TicketCache:
+    # PVE tickets are valid for two hours, stop reusing them a little earlier
+    max_age: float = 7200 - 600
+
+    def __init__(self, path: Path, token: Path, key: Path, max_age: float = max_age):
+        """Encrypted ticket cache
+        :param path: Path - cache file, normally below the xdg state directory
+        :param token: Path - token file of the secrets store, used to derive the cache key
+        :param key: Path - key file of the secrets store, used to derive the cache key
+        """
+        self.path = Path(path)
+        self.token = Path(token)
+        self.key = Path(key)
+        self.max_age = max_age
+        self.log: logging.Logger = logging.getLogger("TicketCache")
+
+    def _cipher_key(self) -> bytes:
+        material = b"proximate_utils ticket cache\0" + self.token.read_bytes() + b"\0" + self.key.read_bytes()
+        return hashlib.sha256(material).digest()
+
+    def load(self) -> dict:
+        """Read the cached ticket
+        :return: dict - base_url, username, ticket, csrf_token and issued, None if missing, expired or unreadable
+        """
+        try:
+            blob = self.path.read_bytes()
+            nonce, tag, ciphertext = blob[:12], blob[12:28], blob[28:]
+            cipher = AES.new(self._cipher_key(), AES.MODE_GCM, nonce=nonce)
+            entry = json.loads(cipher.decrypt_and_verify(ciphertext, tag))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.log.warning(msg="Ignoring unreadable ticket cache %s: %s" % (self.path, e))
+            return None
+
+        if time.time() - entry["issued"] >= self.max_age:
+            return None
+        return entry
+
+    def save(self, entry: dict):
+        try:
+            cipher = AES.new(self._cipher_key(), AES.MODE_GCM, nonce=get_random_bytes(12))
+            ciphertext, tag = cipher.encrypt_and_digest(json.dumps(entry).encode("utf-8"))
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(cipher.nonce + tag + ciphertext)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            self.log.warning(msg="Unable to write ticket cache %s: %s" % (self.path, e))
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+    def connect(
+        self, host=None, user=None, password=None, config: SessionConfig = None, verify_ssl=True, login=None
+    ) -> ProxmoxAPI:
+        """Create a pooled ``ProxmoxAPI`` using the cached ticket, logging in with ``password`` when there is none
+        :param host: str, optional - host or url, only needed without a cached ticket
+        :param login: callable, optional - returns the password for a new login once the ticket is rejected,
+            ``password`` is used when omitted
+        :return: ProxmoxAPI - None if there is no cached ticket and no credentials were given
+        """
+        config = config if config is not None else SessionConfig()
+        entry = self.load()
+        if entry is None and password is None:
+            return None
+
+        if entry is not None:
+            host, user = host_from_url(entry["base_url"]), entry["username"]
+        else:
+            host = host_from_url(host)
+
+        # proxmoxer insists on credentials up front, the placeholder token auth is replaced right away
+        proxmox = ProxmoxAPI(host, user=user, token_name="cached", token_value="", verify_ssl=verify_ssl, timeout=config.timeout)
+        auth = CachedTicketAuth(
+            user,
+            proxmox._store["base_url"],
+            self,
+            ticket=entry,
+            password=password,
+            login=login if login is not None or password is None else (lambda: password),
+            verify_ssl=verify_ssl,
+            timeout=config.timeout,
+            service="PVE",
+        )
+        proxmox._backend.auth = auth
+        proxmox._store["session"].auth = auth
+        configure_session(proxmox, config)
+        return proxmox
@@ -29,6 +29,7 @@ Every version number class implements the following interface:
 
 from __future__ import annotations
 
+import functools
 import re
 
 try:
@@ -306,11 +307,6 @@ class LooseVersion(Version):
 
     component_re = re.compile(r"(\d+ | [a-z]+ | \.)", re.VERBOSE)
 
-    def __init__(self, vstring=None):
-        super().__init__(vstring)
-        if vstring:
-            self.parse(vstring)
-
     def parse(self, vstring):
         # I've given up on thinking I can reconstruct the version string
         # from the parsed tuple -- so I just store the string here for
@@ -331,9 +327,19 @@ class LooseVersion(Version):
     def __repr__(self):
         return "LooseVersion ('%s')" % str(self)
 
+    def __hash__(self):
+        return hash(tuple(self.version))
+
+    def __eq__(self, other):
+        # strings are parsed like in the ordering comparisons, the hash stays the one of the parsed version
+        c = self._cmp(other)
+        if c is NotImplemented:
+            return c
+        return c == 0
+
     def _cmp(self, other):
         if isinstance(other, str):
-            other = LooseVersion(other)
+            other = _loose_version(other)
         elif not isinstance(other, LooseVersion):
             return NotImplemented
 
@@ -346,3 +352,53 @@ class LooseVersion(Version):
 
 
 # end class LooseVersion
+
+
+@functools.lru_cache(maxsize=1024)
+def _loose_version(vstring) -> LooseVersion:
+    # strings compared against a LooseVersion are parsed once, not on every comparison
+    return LooseVersion(vstring)
+
+
+# Debian package versions such as "1:2.3.4-1+pve2~bpo12" are ordered the way dpkg orders them: by epoch, then upstream
+# version, then Debian revision (after the last "-"). Upstream and revision are compared with dpkg's verrevcmp, which
+# alternates runs of non-digits, compared character by character with "~" < end of run < letters < other characters,
+# and runs of digits, compared numerically. version_key turns that into a tuple, so keys compare without re-parsing.
+epoch_re = re.compile(r"^\s*(\d+):")
+verrev_re = re.compile(r"(\D*)(\d*)")
+# a missing run, also what ends every part so a shorter part compares by the run following it
+KEY_END = ((0,), 0)
+
+
+def _char_order(char) -> int:
+    if char == "~":
+        return -1
+    if char.isascii() and char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+
+def _verrev_key(part) -> tuple:
+    key = [
+        (tuple(_char_order(c) for c in text) + (0,), int(digits or 0))
+        for text, digits in verrev_re.findall(part)
+        if text or digits
+    ]
+    # "", "0" and "00" are the same to dpkg
+    if key and key[0] == KEY_END and len(key) == 1:
+        key = []
+    return tuple(key) + (KEY_END,)
+
+
+@functools.lru_cache(maxsize=16384)
+def version_key(vstring) -> tuple:
+    """Hashable, sortable key of a Debian package version string, parsed once per distinct string
+    :param vstring: str - e.g. ``8.1.4`` or ``1:2.3.4-1+pve2``
+    :return: tuple - compare keys instead of the strings, equal strings share one interned key
+    """
+    vstring = str(vstring).strip()
+    epoch = epoch_re.match(vstring)
+    if epoch:
+        vstring = vstring[epoch.end() :]
+    upstream, _, revision = vstring.rpartition("-") if "-" in vstring else (vstring, "", "")
+    return int(epoch.group(1)) if epoch else 0, _verrev_key(upstream), _verrev_key(revision)
@@ -0,0 +1,231 @@
+"""Warm pool of pre-cloned containers.
+
+``WarmPool`` keeps ``size`` stopped clones of a template ready on a node. ``acquire`` hands one out after a single
+config update (and optionally starts it), while a background thread clones replacements, so a caller waits for a
+config update instead of a clone. Clones of a template are linked clones unless a storage is given. Pool members
+are recognised by their hostname, so containers left over by an earlier process are adopted on ``start``. A handed
+out container always loses the pool hostname, so it is never adopted again.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from proximate_utils.actions import Actions
+
+
+class WarmPool:
+    prefix: str = "warm"
+    # hostname of a handed out container when the caller does not pick one, PVE's default for containers
+    default_hostname: str = "CT%d"
+    # seconds a clone may take
+    clone_timeout: float = 300.0
+    # seconds to wait after a failed clone before trying again
+    retry_interval: float = 10.0
+
+    def __init__(self, actions: Actions, template, node, size=2, storage=None, clone_type="opportunistic", pool=None):
+        """
+        :param actions: Actions - used for cloning, the pool shares its snapshot and task waiter
+        :param template: int - vmid of the container to clone, a template for linked clones
+        :param node: str - node the template and the clones live on
+        :param size: int - number of stopped clones kept ready
+        :param storage: str, optional - target storage, forces full clones
+        :param pool: str, optional - PVE pool the clones are added to
+        """
+        self.actions = actions
+        self.template = int(template)
+        self.node = node
+        self.size = size
+        self.storage = storage
+        self.clone_type = clone_type
+        self.pool = pool
+        self.log: logging.Logger = logging.getLogger("WarmPool")
+        self._ready = deque()
+        self._cloning = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = None
+
+    @property
+    def hostname_prefix(self) -> str:
+        return "%s-%d-" % (self.prefix, self.template)
+
+    @property
+    def ready(self) -> int:
+        return len(self._ready)
+
+    @property
+    def cloning(self) -> int:
+        return self._cloning
+
+    def adopt(self) -> list:
+        """Take over stopped pool members that already exist on the node, e.g. from an earlier process
+        :return: list - adopted vmids
+        """
+        try:
+            guests = self.actions.snapshot.by_node(self.node)
+        except Exception as e:
+            self.log.error(msg="Unable to list guests on node %s: %s" % (self.node, e))
+            return []
+        members = sorted(
+            int(guest["vmid"])
+            for guest in guests
+            if str(guest.get("name", "")).startswith(self.hostname_prefix)
+            and guest.get("status") == "stopped"
+            and not guest.get("template")
+        )
+        with self._condition:
+            adopted = [vmid for vmid in members if vmid not in self._ready]
+            self._ready.extend(adopted)
+            self._condition.notify_all()
+        return adopted
+
+    def start(self) -> "WarmPool":
+        """Adopt existing members and start refilling in the background"""
+        with self._condition:
+            if self._thread is not None:
+                return self
+            self._closed = False
+        self.adopt()
+        with self._condition:
+            self._thread = threading.Thread(target=self._run, name="WarmPool-%d" % self.template, daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        """Stop refilling, ready containers are kept for the next process to adopt"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=self.clone_timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and len(self._ready) + self._cloning >= self.size:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                self._cloning += 1
+            vmid = None
+            try:
+                vmid = self._clone()
+            except Exception as e:
+                # e.g. a vmid taken by another pool in the meantime, the next attempt allocates a new one
+                self.log.error(msg="Unable to refill warm pool of %d on node %s: %s" % (self.template, self.node, e))
+            finally:
+                with self._condition:
+                    self._cloning -= 1
+                    if vmid is not None:
+                        self._ready.append(vmid)
+                    self._condition.notify_all()
+            if vmid is None:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._closed, timeout=self.retry_interval)
+
+    def _clone(self) -> int:
+        vmid = self.actions.info.get_nextvmid()
+        if vmid is None:
+            return None
+        ok = self.actions.create_instance(
+            vmid=int(vmid),
+            node=self.node,
+            disk=None,
+            storage=self.storage,
+            cpus=None,
+            memory=None,
+            swap=None,
+            timeout=self.clone_timeout,
+            clone=self.template,
+            clone_type=self.clone_type,
+            hostname="%s%d" % (self.hostname_prefix, int(vmid)),
+            pool=self.pool,
+        )
+        if not ok:
+            self.log.error(msg="Unable to refill warm pool of %d on node %s" % (self.template, self.node))
+            return None
+        return int(vmid)
+
+    def acquire(self, config=None, start=False, timeout=None) -> int:
+        """Hand out a ready container
+        :param config: dict, optional - API parameters applied in one config update, e.g. hostname, cores, memory
+            or net0, the hostname defaults to ``default_hostname``
+        :param start: bool - start the container and wait until it is running
+        :param timeout: float, optional - seconds to wait for a clone when the pool is empty
+        :return: int - vmid of the container, which is no longer part of the pool, None on failure or timeout. A
+            container whose config update failed goes back into the pool, one that failed to start is destroyed.
+        """
+        if self._thread is None:
+            self.start()
+        with self._condition:
+            self._condition.notify_all()
+            if not self._condition.wait_for(lambda: self._ready or self._closed, timeout=timeout) or not self._ready:
+                self.log.error(msg="No warm container of %d became ready on node %s" % (self.template, self.node))
+                return None
+            vmid = self._ready.popleft()
+            # wake the refill thread
+            self._condition.notify_all()
+
+        proxmox_node = self.actions.proxmox.nodes(self.node)
+        guest = getattr(proxmox_node, self.actions.VZ_TYPE)(vmid)
+        # without the pool hostname the container is not adopted by the next process
+        config = dict(config or {})
+        config.setdefault("hostname", self.default_hostname % vmid)
+        try:
+            guest.config.put(**config)
+        except Exception as e:
+            self.log.error(msg="Unable to configure warm container %d: %s" % (vmid, e))
+            with self._condition:
+                self._ready.appendleft(vmid)
+                self._condition.notify_all()
+            return None
+        self.actions.snapshot.invalidate()
+
+        if start:
+            begin = time.monotonic()
+            try:
+                taskid = guest.status.start.post()
+                status = self.actions.task_waiter.submit(taskid, self.node).result(timeout=self.clone_timeout)
+            except Exception as e:
+                self.log.error(msg="Unable to start warm container %d: %s" % (vmid, e))
+                self._destroy(vmid)
+                return None
+            if not self.actions.task_waiter.task_ok(status):
+                self.log.error(msg="Starting warm container %d failed: %s" % (vmid, status.get("exitstatus")))
+                self._destroy(vmid)
+                return None
+            self.log.debug(msg="Started warm container %d in %.2fs" % (vmid, time.monotonic() - begin))
+        return vmid
+
+    def drain(self, timeout=None) -> list:
+        """Stop refilling and destroy every ready container
+        :return: list - vmids that were destroyed
+        """
+        self.close()
+        destroyed = []
+        while self._ready:
+            vmid = self._ready.popleft()
+            if self._destroy(vmid, timeout):
+                destroyed.append(vmid)
+        return destroyed
+
+    def _destroy(self, vmid, timeout=None) -> bool:
+        proxmox_node = self.actions.proxmox.nodes(self.node)
+        try:
+            taskid = getattr(proxmox_node, self.actions.VZ_TYPE)(vmid).delete()
+            status = self.actions.task_waiter.submit(taskid, self.node).result(timeout=timeout or self.clone_timeout)
+        except Exception as e:
+            self.log.error(msg="Unable to destroy warm container %d: %s" % (vmid, e))
+            return False
+        finally:
+            self.actions.snapshot.invalidate()
+        return self.actions.task_waiter.task_ok(status)
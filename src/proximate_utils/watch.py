@@ -0,0 +1,95 @@
+"""Change feed over cluster resources.
+
+``watch_resources`` polls ``cluster/resources`` and yields ``ResourceEvent`` deltas against the previous poll instead
+of the full list. The poll interval shrinks while the cluster is busy (events seen or guests locked by a running
+operation) and grows while nothing changes.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+ADDED = "added"
+REMOVED = "removed"
+STATUS = "status"
+MIGRATED = "migrated"
+CONFIG = "config"
+
+# resource fields describing the configuration of a guest, usage counters such as cpu, mem or netin are ignored
+CONFIG_FIELDS = ("name", "pool", "tags", "template", "maxcpu", "maxmem", "maxdisk", "hastate")
+
+
+@dataclass
+class ResourceEvent:
+    kind: str
+    vmid: int
+    node: str
+    old: dict = None
+    new: dict = None
+
+    @property
+    def changes(self) -> dict:
+        """Changed fields mapped to ``(old, new)`` for status, migrated and config events"""
+        if self.old is None or self.new is None:
+            return {}
+        fields = {STATUS: ("status",), MIGRATED: ("node",)}.get(self.kind, CONFIG_FIELDS)
+        return {f: (self.old.get(f), self.new.get(f)) for f in fields if self.old.get(f) != self.new.get(f)}
+
+
+def diff(old, new) -> list:
+    """Events turning one ``cluster/resources`` guest list into another
+    :param old: dict - vmid to resource of the previous poll
+    :param new: dict - vmid to resource of the current poll
+    :return: list of ResourceEvent - ordered by vmid, a guest can have several events
+    """
+    events = []
+    for vmid in sorted(old.keys() | new.keys()):
+        before, after = old.get(vmid), new.get(vmid)
+        if before is None:
+            events.append(ResourceEvent(ADDED, vmid, after.get("node"), None, after))
+        elif after is None:
+            events.append(ResourceEvent(REMOVED, vmid, before.get("node"), before, None))
+        else:
+            if before.get("node") != after.get("node"):
+                events.append(ResourceEvent(MIGRATED, vmid, after.get("node"), before, after))
+            if before.get("status") != after.get("status"):
+                events.append(ResourceEvent(STATUS, vmid, after.get("node"), before, after))
+            if any(before.get(f) != after.get(f) for f in CONFIG_FIELDS):
+                events.append(ResourceEvent(CONFIG, vmid, after.get("node"), before, after))
+    return events
+
+
+def watch_resources(fetch, min_interval=1.0, max_interval=30.0, backoff=1.5, initial=False, stop=None):
+    """Poll ``fetch`` and yield the changes between polls
+    :param fetch: callable - returns the current list of guest resources
+    :param min_interval: float - seconds between polls while the cluster is busy
+    :param max_interval: float - upper bound the interval grows to while nothing changes
+    :param backoff: float - factor the interval grows by after a quiet poll
+    :param initial: bool - report every guest of the first poll as added instead of only using it as baseline
+    :param stop: threading.Event, optional - ends the generator once set, it also ends when the consumer stops
+    :return: generator of ResourceEvent
+    """
+    log = logging.getLogger("ResourceWatch")
+    stop = stop if stop is not None else threading.Event()
+    last = None
+    interval = min_interval
+    while not stop.is_set():
+        started = time.monotonic()
+        try:
+            current = {int(vm["vmid"]): vm for vm in fetch() if "vmid" in vm}
+        except Exception as e:
+            log.error(msg="Unable to retrieve cluster resources: %s" % e)
+            current = None
+
+        busy = False
+        if current is not None:
+            events = diff(last if last is not None else {}, current) if last is not None or initial else []
+            last = current
+            # a lock means an operation such as a migration or backup is running and changes are coming
+            busy = bool(events) or any(vm.get("lock") for vm in current.values())
+            for event in events:
+                yield event
+
+        interval = min_interval if busy else min(interval * backoff, max_interval)
+        stop.wait(max(0.0, interval - (time.monotonic() - started)))
@@ -0,0 +1,532 @@
+"""Local fake of the Proxmox VE HTTP API.
+
+Implements the endpoints used by this package on top of an in-memory cluster of configurable size, latency and
+task duration, so that request and parse costs can be measured and tested offline::
+
+    with FakePVEServer(FakeCluster(nodes=12, guests=10000)) as server:
+        info = Info(server.connect())
+
+The server speaks plain HTTP, ``connect`` points a token authenticated ``ProxmoxAPI`` at it. It is a test helper
+and not part of the installed package, benchmarks import it from the source tree.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse as urlparse
+
+
+class FakeCluster:
+    """In-memory cluster state served by ``FakePVEServer``"""
+
+    def __init__(
+        self,
+        nodes=3,
+        guests=100,
+        pools=4,
+        storages=2,
+        content=20,
+        packages=50,
+        version="8.1.4",
+        latency=0.0,
+        task_duration=0.2,
+        task_log_lines=10,
+        seed=0,
+    ):
+        """
+        :param nodes: int - number of nodes
+        :param guests: int - number of containers spread over the nodes
+        :param storages: int - number of storages, every storage is available on every node
+        :param content: int - number of volumes per node and storage
+        :param packages: int - number of installed packages per node, the last node lags behind on some of them
+        :param latency: float - seconds added to every request
+        :param task_duration: float - seconds until a started task finishes
+        :param task_log_lines: int - number of log lines a task writes over its duration
+        """
+        rnd = random.Random(seed)
+        self.lock = threading.RLock()
+        self.version = version
+        self.latency = latency
+        # node -> seconds added to every request below nodes/{node}, e.g. to simulate a hung node
+        self.node_latency = {}
+        # nodes pveproxy can not reach, requests below nodes/{node} fail with ``down_status``, 595 like a rebooting
+        # node by default
+        self.down_nodes = set()
+        self.down_status = 595
+        self.task_duration = task_duration
+        self.task_log_lines = task_log_lines
+        self.requests = 0
+        self.nodes = ["node%d" % i for i in range(1, nodes + 1)]
+        self.pools = ["pool%d" % i for i in range(1, pools + 1)]
+        self.storages = ["storage%d" % i for i in range(1, storages + 1)]
+        self.guests = {}
+        self.configs = {}
+        for vmid in range(100, 100 + guests):
+            node = self.nodes[vmid % nodes]
+            self._add_guest(vmid, node, "ct%d" % vmid, pool=self.pools[vmid % pools] if pools else None)
+            self.guests[vmid]["status"] = rnd.choice(("running", "stopped"))
+        self.content = {}
+        for node in self.nodes:
+            for storage in self.storages:
+                volumes = []
+                for i in range(content):
+                    kind = ("iso", "vztmpl", "backup", "rootdir")[i % 4]
+                    vmid = 100 + rnd.randrange(guests) if guests and kind in ("backup", "rootdir") else None
+                    volume = {
+                        "volid": "%s:%s/%s-%d" % (storage, kind, node, i),
+                        "content": kind,
+                        "format": "raw" if kind == "rootdir" else "tgz",
+                        "size": rnd.randrange(1 << 20, 1 << 34),
+                        "ctime": 1700000000 + i,
+                    }
+                    if vmid is not None:
+                        volume["vmid"] = vmid
+                    volumes.append(volume)
+                self.content[(node, storage)] = volumes
+        base = {"pve-manager": version, "proxmox-ve": version, "lxc-pve": "5.0.2-4", "corosync": "3.1.7-pve3"}
+        for i in range(max(0, packages - len(base))):
+            major, minor, patch = rnd.randrange(1, 4), rnd.randrange(10), rnd.randrange(20)
+            base["package%03d" % i] = "%d.%d.%d-%d" % (major, minor, patch, 1 + rnd.randrange(3))
+        self.packages = {node: dict(base) for node in self.nodes}
+        if len(self.nodes) > 1:
+            lagging = self.packages[self.nodes[-1]]
+            for package in sorted(base)[:: max(1, len(base) // 5)]:
+                lagging[package] = lagging[package] + "~old"
+        self.tasks = {}
+        self._pid = 0x1000
+
+    def _add_guest(self, vmid, node, name, pool=None, template=0, type="lxc", **config):
+        self.guests[vmid] = {
+            "id": "%s/%d" % (type, vmid),
+            "vmid": vmid,
+            "name": name,
+            "node": node,
+            "type": type,
+            "status": "stopped",
+            "maxmem": int(config.get("memory", 512)) * 1024 * 1024,
+            "maxcpu": int(config.get("cores", 1)),
+            "template": template,
+        }
+        if pool is not None:
+            self.guests[vmid]["pool"] = pool
+        if config.get("tags"):
+            self.guests[vmid]["tags"] = config["tags"]
+        self.configs[vmid] = dict({"hostname": name, "memory": 512, "cores": 1}, **config)
+        if template:
+            self.configs[vmid]["template"] = 1
+
+    def start_task(self, node, type, id, on_finish=None, duration=None) -> str:
+        """Start a fake task that finishes after ``task_duration`` seconds"""
+        with self.lock:
+            self._pid += 1
+            starttime = int(time.time())
+            upid = "UPID:%s:%08X:%08X:%08X:%s:%s:root@pam:" % (node, self._pid, self._pid * 7, starttime, type, id)
+            self.tasks[upid] = {
+                "upid": upid,
+                "node": node,
+                "pid": self._pid,
+                "pstart": self._pid * 7,
+                "starttime": starttime,
+                "type": type,
+                "id": str(id),
+                "user": "root@pam",
+                "started": time.monotonic(),
+                "duration": self.task_duration if duration is None else duration,
+                "exitstatus": "OK",
+                "on_finish": on_finish,
+            }
+            return upid
+
+    def task(self, upid) -> dict:
+        with self.lock:
+            task = self.tasks[upid]
+            if "endtime" not in task and time.monotonic() - task["started"] >= task["duration"]:
+                task["endtime"] = task["starttime"] + int(task["duration"])
+                if task["on_finish"] is not None:
+                    task["on_finish"]()
+            return task
+
+    def task_log(self, upid) -> list:
+        task = self.task(upid)
+        progress = 1.0 if "endtime" in task else (time.monotonic() - task["started"]) / max(task["duration"], 1e-9)
+        lines = ["%s: progress %d%%" % (task["type"], 100 * i // self.task_log_lines) for i in range(self.task_log_lines)]
+        lines = lines[: int(len(lines) * progress)]
+        if "endtime" in task:
+            lines.append("TASK %s" % task["exitstatus"])
+        return [{"n": n, "t": line} for n, line in enumerate(lines, 1)]
+
+
+class FakePVEHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, without this keep-alive requests stall on delayed ACKs
+    disable_nagle_algorithm = True
+    routes = []
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def cluster(self) -> FakeCluster:
+        return self.server.cluster
+
+    def _dispatch(self, method):
+        cluster = self.cluster
+        with cluster.lock:
+            cluster.requests += 1
+        if cluster.latency:
+            time.sleep(cluster.latency)
+
+        url = urlparse.urlsplit(self.path)
+        params = {k: v[-1] for k, v in urlparse.parse_qs(url.query).items()}
+        if method in ("POST", "PUT"):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode("utf-8") if length else ""
+            params.update({k: v[-1] for k, v in urlparse.parse_qs(body).items()})
+
+        path = url.path.split("/api2/json", 1)[-1]
+        node = path.split("/")[2] if path.startswith("/nodes/") else None
+        if cluster.node_latency.get(node):
+            time.sleep(cluster.node_latency[node])
+        if node in cluster.down_nodes:
+            status, data = cluster.down_status, "Connection refused"
+        else:
+            for route_method, pattern, handler in self.routes:
+                match = pattern.fullmatch(path)
+                if route_method == method and match:
+                    try:
+                        status, data = handler(self, params, **match.groupdict())
+                    except KeyError as e:
+                        status, data = 404, "no such resource %s" % e
+                    break
+            else:
+                status, data = 501, "Method '%s %s' not implemented" % (method, path)
+
+        payload = json.dumps({"data": data} if status < 400 else {"data": None, "errors": data}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+
+def route(method, path):
+    pattern = re.compile(re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", path))
+
+    def register(handler):
+        FakePVEHandler.routes.append((method, pattern, handler))
+        return handler
+
+    return register
+
+
+@route("POST", "/access/ticket")
+def _ticket(handler, params):
+    return 200, {"ticket": "PVE:%s:FAKE" % params.get("username"), "CSRFPreventionToken": "FAKE", "username": params["username"]}
+
+
+@route("GET", "/version")
+def _version(handler, params):
+    return 200, {"version": handler.cluster.version, "release": handler.cluster.version.rsplit(".", 1)[0], "repoid": "fake"}
+
+
+@route("GET", "/nodes")
+def _nodes(handler, params):
+    return 200, [{"node": node, "status": "online", "type": "node", "maxcpu": 16} for node in handler.cluster.nodes]
+
+
+@route("GET", "/nodes/{node}/version")
+def _node_version(handler, params, node):
+    if node not in handler.cluster.nodes:
+        raise KeyError(node)
+    return _version(handler, params)
+
+
+@route("GET", "/nodes/{node}/status")
+def _node_status(handler, params, node):
+    cluster = handler.cluster
+    if node not in cluster.nodes:
+        raise KeyError(node)
+    with cluster.lock:
+        guests = [guest for guest in cluster.guests.values() if guest["node"] == node and guest["status"] == "running"]
+    used = sum(guest["maxmem"] for guest in guests)
+    return 200, {
+        "cpu": 0.01 * len(guests),
+        "cpuinfo": {"cpus": 16, "sockets": 1, "model": "Fake CPU"},
+        "loadavg": ["%.2f" % (0.1 * len(guests)), "0.50", "0.40"],
+        "memory": {"used": used, "total": 64 << 30, "free": (64 << 30) - used},
+        "rootfs": {"used": 8 << 30, "total": 100 << 30},
+        "uptime": 86400,
+        "pveversion": "pve-manager/%s/fake" % cluster.version,
+        "kversion": "Linux 6.5.11-7-pve",
+    }
+
+
+@route("GET", "/nodes/{node}/storage")
+def _node_storage(handler, params, node):
+    cluster = handler.cluster
+    if node not in cluster.nodes:
+        raise KeyError(node)
+    storages = []
+    for storage in cluster.storages:
+        used = sum(v["size"] for v in cluster.content[(node, storage)])
+        total = 1 << 40
+        storages.append({"storage": storage, "type": "dir", "active": 1, "used": used, "total": total, "avail": total - used})
+    return 200, storages
+
+
+@route("GET", "/nodes/{node}/subscription")
+def _node_subscription(handler, params, node):
+    if node not in handler.cluster.nodes:
+        raise KeyError(node)
+    return 200, {"status": "notfound", "message": "There is no subscription key"}
+
+
+@route("GET", "/nodes/{node}/apt/versions")
+def _apt_versions(handler, params, node):
+    packages = handler.cluster.packages[node]
+    return 200, [
+        {"Package": package, "Version": version, "CurrentState": "Installed"} for package, version in packages.items()
+    ]
+
+
+@route("GET", "/cluster/resources")
+def _resources(handler, params):
+    cluster = handler.cluster
+    with cluster.lock:
+        if params.get("type") not in (None, "vm"):
+            return 200, []
+        return 200, [dict(guest) for guest in cluster.guests.values()]
+
+
+@route("GET", "/cluster/nextid")
+def _nextid(handler, params):
+    with handler.cluster.lock:
+        return 200, max(handler.cluster.guests, default=99) + 1
+
+
+@route("GET", "/pools")
+def _pools(handler, params):
+    return 200, [{"poolid": pool} for pool in handler.cluster.pools]
+
+
+@route("GET", "/pools/{poolid}")
+def _pool(handler, params, poolid):
+    cluster = handler.cluster
+    if poolid not in cluster.pools:
+        raise KeyError(poolid)
+    with cluster.lock:
+        members = [dict(guest) for guest in cluster.guests.values() if guest.get("pool") == poolid]
+    return 200, {"poolid": poolid, "members": members}
+
+
+@route("GET", "/storage")
+def _storage(handler, params):
+    kind = params.get("type")
+    storages = [{"storage": storage, "type": "dir", "content": "iso,vztmpl,backup,rootdir"} for storage in handler.cluster.storages]
+    return 200, [storage for storage in storages if kind is None or storage["type"] == kind]
+
+
+@route("GET", "/nodes/{node}/storage/{storage}/content")
+def _storage_content(handler, params, node, storage):
+    volumes = handler.cluster.content[(node, storage)]
+    content, vmid = params.get("content"), params.get("vmid")
+    return 200, [
+        v for v in volumes if (content is None or v["content"] == content) and (vmid is None or str(v.get("vmid")) == vmid)
+    ]
+
+
+@route("POST", "/nodes/{node}/lxc")
+def _lxc_create(handler, params, node):
+    cluster = handler.cluster
+    vmid = int(params.pop("vmid"))
+    with cluster.lock:
+        if vmid in cluster.guests:
+            return 500, "CT %d already exists" % vmid
+        config = {k: v for k, v in params.items() if k not in ("pool", "template")}
+        cluster._add_guest(vmid, node, params.get("hostname", "CT%d" % vmid), pool=params.get("pool"), **config)
+    return 200, cluster.start_task(node, "vzcreate", vmid)
+
+
+@route("POST", "/nodes/{node}/lxc/{vmid}/clone")
+def _lxc_clone(handler, params, node, vmid):
+    cluster = handler.cluster
+    newid = int(params["newid"])
+    with cluster.lock:
+        source = cluster.configs[int(vmid)]
+        if newid in cluster.guests:
+            return 500, "CT %d already exists" % newid
+        config = {k: v for k, v in source.items() if k not in ("hostname", "template", "pool")}
+        cluster._add_guest(newid, params.get("target", node), params.get("hostname", "CT%d" % newid), params.get("pool"), **config)
+    # linked clones are fast, full clones copy the disk
+    duration = cluster.task_duration * (1 if params.get("full") in (None, "0") and source.get("template") else 5)
+    return 200, cluster.start_task(node, "vzclone", vmid, duration=duration)
+
+
+@route("GET", "/nodes/{node}/lxc/{vmid}/config")
+def _lxc_config(handler, params, node, vmid):
+    with handler.cluster.lock:
+        return 200, dict(handler.cluster.configs[int(vmid)])
+
+
+@route("PUT", "/nodes/{node}/lxc/{vmid}/config")
+def _lxc_set_config(handler, params, node, vmid):
+    cluster = handler.cluster
+    with cluster.lock:
+        config = cluster.configs[int(vmid)]
+        for key in params.pop("delete", "").split(","):
+            config.pop(key, None)
+        config.update(params)
+        guest = cluster.guests[int(vmid)]
+        guest["name"] = config.get("hostname", guest["name"])
+        guest["maxmem"] = int(config.get("memory", 512)) * 1024 * 1024
+        guest["maxcpu"] = int(config.get("cores", 1))
+        if "tags" in config:
+            guest["tags"] = config["tags"]
+    return 200, None
+
+
+@route("DELETE", "/nodes/{node}/lxc/{vmid}")
+def _lxc_destroy(handler, params, node, vmid):
+    cluster = handler.cluster
+    vmid = int(vmid)
+    if vmid not in cluster.guests:
+        raise KeyError(vmid)
+
+    def destroy():
+        cluster.guests.pop(vmid, None)
+        cluster.configs.pop(vmid, None)
+
+    return 200, cluster.start_task(node, "vzdestroy", vmid, on_finish=destroy)
+
+
+@route("POST", "/nodes/{node}/lxc/{vmid}/status/start")
+def _lxc_start(handler, params, node, vmid):
+    cluster = handler.cluster
+    guest = cluster.guests[int(vmid)]
+    return 200, cluster.start_task(node, "vzstart", vmid, on_finish=lambda: guest.update(status="running"))
+
+
+@route("POST", "/nodes/{node}/lxc/{vmid}/status/stop")
+def _lxc_stop(handler, params, node, vmid):
+    cluster = handler.cluster
+    guest = cluster.guests[int(vmid)]
+    return 200, cluster.start_task(node, "vzstop", vmid, on_finish=lambda: guest.update(status="stopped"))
+
+
+@route("POST", "/nodes/{node}/lxc/{vmid}/status/shutdown")
+def _lxc_shutdown(handler, params, node, vmid):
+    cluster = handler.cluster
+    guest = cluster.guests[int(vmid)]
+    return 200, cluster.start_task(node, "vzshutdown", vmid, on_finish=lambda: guest.update(status="stopped"))
+
+
+@route("POST", "/nodes/{node}/lxc/{vmid}/migrate")
+def _lxc_migrate(handler, params, node, vmid):
+    cluster = handler.cluster
+    guest = cluster.guests[int(vmid)]
+    target = params.get("target")
+    if target not in cluster.nodes or target == node:
+        return 400, {"target": "invalid target node %s" % target}
+    if guest["status"] == "running" and params.get("restart") not in ("1", "true"):
+        return 500, "lxc live migration is currently not implemented"
+    return 200, cluster.start_task(node, "vzmigrate", vmid, on_finish=lambda: guest.update(node=target))
+
+
+@route("GET", "/nodes/{node}/tasks")
+def _tasks(handler, params, node):
+    cluster = handler.cluster
+    since = int(params.get("since") or 0)
+    limit = int(params.get("limit") or 50)
+    with cluster.lock:
+        upids = [upid for upid, task in cluster.tasks.items() if task["node"] == node and task["starttime"] >= since]
+    tasks = []
+    for upid in reversed(upids[-limit:]):
+        task = cluster.task(upid)
+        entry = {k: task[k] for k in ("upid", "node", "pid", "pstart", "starttime", "type", "id", "user")}
+        if "endtime" in task:
+            entry.update(endtime=task["endtime"], status=task["exitstatus"])
+        tasks.append(entry)
+    return 200, tasks
+
+
+@route("GET", "/nodes/{node}/tasks/{upid}/status")
+def _task_status(handler, params, node, upid):
+    task = handler.cluster.task(upid)
+    status = {k: task[k] for k in ("upid", "node", "pid", "pstart", "starttime", "type", "id", "user")}
+    status["status"] = "stopped" if "endtime" in task else "running"
+    if "endtime" in task:
+        status["exitstatus"] = task["exitstatus"]
+    return 200, status
+
+
+@route("GET", "/nodes/{node}/tasks/{upid}/log")
+def _task_log(handler, params, node, upid):
+    lines = handler.cluster.task_log(upid)
+    start = int(params.get("start") or 0)
+    limit = int(params.get("limit") or 50)
+    # like PVE, an empty log is answered with a placeholder line
+    return 200, lines[start : start + limit] if lines else [{"n": 1, "t": "no content"}]
+
+
+class FakePVEServer:
+    def __init__(self, cluster: FakeCluster = None, host="127.0.0.1", port=0):
+        self.cluster = cluster if cluster is not None else FakeCluster()
+        self.httpd = ThreadingHTTPServer((host, port), FakePVEHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.cluster = self.cluster
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return "%s:%d" % self.httpd.server_address[:2]
+
+    @property
+    def base_url(self) -> str:
+        return "http://%s/api2/json" % self.host
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="FakePVEServer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def connect(self, config=None, layers=()):
+        """Create a pooled ``ProxmoxAPI`` talking to this server
+        :param config: SessionConfig, optional - pool settings
+        :param layers: iterable, optional - request layers, see ``session.install_layer``
+        """
+        from proximate_utils.session import connect
+
+        proxmox = connect(self.host, config=config, layers=layers, user="root@pam", token_name="fake", token_value="fake")
+        # proxmoxer only builds https urls, every resource derives its url from the root
+        proxmox._store["base_url"] = self.base_url
+        return proxmox
+
+    def async_connect(self, **kwargs):
+        from proximate_utils.aio import AsyncProxmoxAPI
+
+        return AsyncProxmoxAPI(user="root@pam", token_name="fake", token_value="fake", base_url=self.base_url, **kwargs)
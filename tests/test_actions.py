@@ -3,7 +3,8 @@ from unittest.mock import patch
 
 from mockito import when
 
-from proximate_utils.actions import Actions
+from proximate_utils.actions import Actions, clone_parameters
+from proximate_utils.capabilities import Capabilities
 
 
 class ActionsTest(unittest.TestCase):
@@ -14,6 +15,7 @@ class ActionsTest(unittest.TestCase):
     self.mock_proxmox = mock_proxmox
     self.mock_info = mock_info
     self.mock_info.version.return_value = '8.5'
+    self.mock_info.capabilities.side_effect = lambda node=None: Capabilities(self.mock_info.version.return_value)
     self.actions = Actions(self.mock_proxmox, self.mock_info)
 
   def test_is_template_container_lxc(self):
@@ -47,21 +49,22 @@ class ActionsTest(unittest.TestCase):
   def test_create_instance_lxc_success(self):
     self.actions.VZ_TYPE = 'lxc'
     self.mock_info.version.return_value = '6.5'
-    self.mock_info.api_task_ok.return_value = True
+    self.mock_proxmox.nodes.return_value.tasks.get.return_value = [{'upid': 100, 'endtime': 1, 'status': 'OK'}]
     mock_taskid = 100
-    self.mock_proxmox.nodes.return_value.lxc.return_value.create.return_value = mock_taskid
+    self.mock_proxmox.nodes.return_value.lxc.create.return_value = mock_taskid
     result = self.actions.create_instance(vmid=100, node='node1', disk='local-lvm:vm-100-disk-0', storage='local', cpus=2,
                                           memory=1024, swap=0, timeout=10, clone=None,
                                           netif={'name': 'eth0', 'ip': '192.168.1.100', 'hwaddr': '00:16:3e:22:44:55'},
                                           mounts={'mp': '/mnt/data', 'target': '/data', 'options': 'bind,create=dir'})
     self.assertTrue(result)
+    self.mock_info.snapshot.invalidate.assert_called()
 
   def test_create_instance_lxc_timeout(self):
     self.actions.VZ_TYPE = 'lxc'
     self.mock_info.version.return_value = '6.5'
-    self.mock_info.api_task_ok.return_value = False
+    self.mock_proxmox.nodes.return_value.tasks.get.return_value = [{'upid': 100}]
     mock_taskid = 100
-    self.mock_proxmox.nodes.return_value.lxc.return_value.create.return_value = mock_taskid
+    self.mock_proxmox.nodes.return_value.lxc.create.return_value = mock_taskid
     result = self.actions.create_instance(vmid=100, node='node1', disk='local-lvm:vm-100-disk-0', storage='local', cpus=2,
                                           memory=1024, swap=0, timeout=1, clone=None,
                                           netif={'name': 'eth0', 'ip': '192.168.1.100', 'hwaddr': '00:16:3e:22:44:55'},
@@ -81,9 +84,9 @@ class ActionsTest(unittest.TestCase):
   def test_create_instance_openvz_success(self):
     self.actions.VZ_TYPE = 'openvz'
     self.mock_info.version.return_value = '6.5'
-    self.mock_info.api_task_ok.return_value = True
+    self.mock_proxmox.nodes.return_value.tasks.get.return_value = [{'upid': 100, 'endtime': 1, 'status': 'OK'}]
     mock_taskid = 100
-    self.mock_proxmox.nodes.return_value.openvz.return_value.create.return_value = mock_taskid
+    self.mock_proxmox.nodes.return_value.openvz.create.return_value = mock_taskid
     result = self.actions.create_instance(vmid=100, node='node1', disk='local-lvm:vm-100-disk-0', storage='local', cpus=2,
                                           memory=1024, swap=0, timeout=10, clone=None)
     self.assertTrue(result)
@@ -91,9 +94,9 @@ class ActionsTest(unittest.TestCase):
   def test_create_instance_openvz_timeout(self):
     self.actions.VZ_TYPE = 'openvz'
     self.mock_info.version.return_value = '6.5'
-    self.mock_info.api_task_ok.return_value = False
+    self.mock_proxmox.nodes.return_value.tasks.get.return_value = [{'upid': 100}]
     mock_taskid = 100
-    self.mock_proxmox.nodes.return_value.openvz.return_value.create.return_value = mock_taskid
+    self.mock_proxmox.nodes.return_value.openvz.create.return_value = mock_taskid
     result = self.actions.create_instance(vmid=100, node='node1', disk='local-lvm:vm-100-disk-0', storage='local', cpus=2,
                                           memory=1024, swap=0, timeout=1, clone=None)
     self.assertFalse(result)
@@ -101,13 +104,40 @@ class ActionsTest(unittest.TestCase):
   def test_create_instance_clone_lxc_success(self):
     self.actions.VZ_TYPE = 'lxc'
     self.mock_info.version.return_value = '6.5'
-    self.mock_info.api_task_ok.return_value = True
+    self.mock_proxmox.nodes.return_value.tasks.get.return_value = [{'upid': 100, 'endtime': 1, 'status': 'OK'}]
     mock_taskid = 100
     self.mock_proxmox.nodes.return_value.lxc.return_value.clone.post.return_value = mock_taskid
     result = self.actions.create_instance(vmid=100, node='node1', disk='local-lvm:vm-100-disk-0', storage='local', cpus=2,
                                           memory=1024, swap=0, timeout=10, clone=101)
     self.assertTrue(result)
 
+  def test_create_instance_linked_clone(self):
+    self.mock_proxmox.nodes.return_value.tasks.get.return_value = [{'upid': 100, 'endtime': 1, 'status': 'OK'}]
+    self.mock_proxmox.nodes.return_value.lxc.return_value.config.get.return_value = {'template': 1}
+    self.mock_proxmox.nodes.return_value.lxc.return_value.clone.post.return_value = 100
+    result = self.actions.create_instance(vmid=100, node='node1', disk=None, storage=None, cpus=2, memory=1024, swap=0,
+                                          timeout=10, clone=9000, clone_type='linked', hostname='ci-1', memory_limit=1)
+    self.assertTrue(result)
+    self.mock_proxmox.nodes.return_value.lxc.return_value.clone.post.assert_called_once_with(
+      newid=100, full=0, hostname='ci-1')
+
+  def test_create_instance_linked_clone_of_container(self):
+    self.mock_proxmox.nodes.return_value.lxc.return_value.config.get.return_value = {}
+    result = self.actions.create_instance(vmid=100, node='node1', disk=None, storage='local', cpus=2, memory=1024,
+                                          swap=0, timeout=10, clone=101, clone_type='linked')
+    self.assertFalse(result)
+    self.mock_proxmox.nodes.return_value.lxc.return_value.clone.post.assert_not_called()
+
+  def test_clone_parameters(self):
+    self.assertEqual(clone_parameters(True, None, 'opportunistic', {}), {'full': 0})
+    self.assertEqual(
+      clone_parameters(True, 'local', 'opportunistic', {'pool': 'ci'}), {'full': 1, 'storage': 'local', 'pool': 'ci'})
+    self.assertEqual(clone_parameters(False, 'local', 'full', {'cpulimit': 2}), {'full': 1, 'storage': 'local'})
+    with self.assertRaises(ValueError):
+      clone_parameters(False, None, 'opportunistic', {})
+    with self.assertRaises(ValueError):
+      clone_parameters(True, None, 'shallow', {})
+
   def test_create_instance_clone_openvz_error(self):
     self.actions.VZ_TYPE = 'openvz'
     self.mock_info.version.return_value = '6.5'
@@ -118,13 +148,39 @@ class ActionsTest(unittest.TestCase):
   def test_create_instance_invalid_tag(self):
     self.actions.VZ_TYPE = 'lxc'
     self.mock_info.version.return_value = '6.5'
-    self.mock_info.api_task_ok.return_value = True
+    self.mock_proxmox.nodes.return_value.tasks.get.return_value = [{'upid': 100, 'endtime': 1, 'status': 'OK'}]
     mock_taskid = 100
-    self.mock_proxmox.nodes.return_value.lxc.return_value.create.return_value = mock_taskid
+    self.mock_proxmox.nodes.return_value.lxc.create.return_value = mock_taskid
     result = self.actions.create_instance(vmid=100, node='node1', disk='local-lvm:vm-100-disk-0', storage='local', cpus=2,
                                           memory=1024, swap=0, timeout=10, clone=None, tags=['invalid-$-tag'])
     self.assertFalse(result)
 
+  def test_create_instance_task_failed(self):
+    self.actions.VZ_TYPE = 'lxc'
+    self.mock_proxmox.nodes.return_value.tasks.get.return_value = [{'upid': 100, 'endtime': 1, 'status': 'unable to create'}]
+    self.mock_proxmox.nodes.return_value.lxc.create.return_value = 100
+    result = self.actions.create_instance(vmid=100, node='node1', disk='local-lvm:vm-100-disk-0', storage='local', cpus=2,
+                                          memory=1024, swap=0, timeout=10, clone=None)
+    self.assertFalse(result)
+
+  def test_create_instances(self):
+    self.actions.VZ_TYPE = 'lxc'
+    self.mock_proxmox.nodes.return_value.lxc.create.side_effect = lambda vmid, **kwargs: 'task-%d' % vmid
+    self.mock_proxmox.nodes.return_value.tasks.get.return_value = [
+      {'upid': 'task-%d' % vmid, 'endtime': 1, 'status': 'OK' if vmid != 102 else 'failed'} for vmid in range(100, 104)]
+    specs = [dict(vmid=vmid, node='node%d' % (vmid % 2), disk='local-lvm:8', storage='local', cpus=1, memory=512, swap=0,
+                  timeout=10, clone=None) for vmid in range(100, 104)]
+    streamed = []
+    summary = self.actions.create_instances(specs, max_workers=4, per_node=1, callback=streamed.append)
+    self.assertEqual(len(streamed), 4)
+    self.assertEqual(summary.succeeded, 3)
+    self.assertEqual([result.vmid for result in summary.results if not result.ok], [102])
+
+  def test_create_instances_invalid_spec(self):
+    summary = self.actions.create_instances([{'vmid': 100, 'node': 'node1'}])
+    self.assertEqual(summary.failed, 1)
+    self.assertIn('create_instance', summary.results[0].error)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,165 @@
+import asyncio
+import unittest
+
+try:
+  from aiohttp import web
+  from aiohttp.test_utils import TestServer
+except ImportError:
+  web = None
+
+from proximate_utils.aio import AsyncActions, AsyncInfo, AsyncProxmoxAPI, AsyncResources
+from proximate_utils.limiter import ApiLimiter
+
+UPID = 'UPID:node1:000A1B2C:0123ABCD:65A0B1C2:vzcreate:200:root@pam:'
+
+
+@unittest.skipIf(web is None, 'aiohttp is not installed')
+class AsyncClientTest(unittest.IsolatedAsyncioTestCase):
+  """Runs the async client against a local stand-in for the PVE API"""
+
+  async def asyncSetUp(self):
+    self.requests = []
+    self.created = {}
+
+    # defined here, the class body runs even when aiohttp is missing and the test is skipped
+    @web.middleware
+    async def record(request, handler):
+      self.requests.append((request.method, request.path, request.headers.get('CSRFPreventionToken')))
+      if request.path != '/api2/json/access/ticket' and 'PVEAuthCookie=ticket' not in request.headers.get('Cookie', ''):
+        return web.json_response({'data': None}, status=401)
+      return await handler(request)
+
+    app = web.Application(middlewares=[record])
+    app.router.add_post('/api2/json/access/ticket', self._ticket)
+    app.router.add_get('/api2/json/version', self._reply({'version': '8.1.4'}))
+    app.router.add_get('/api2/json/nodes', self._reply([{'node': 'node1'}, {'node': 'node2'}]))
+    app.router.add_get('/api2/json/nodes/{node}/version', self._reply({'version': '8.1.4'}))
+    app.router.add_get('/api2/json/cluster/nextid', self._reply(200))
+    app.router.add_get('/api2/json/cluster/resources', self._reply(
+      [{'vmid': 100, 'name': 'web', 'node': 'node1'}, {'vmid': 101, 'name': 'db', 'node': 'node2'}]))
+    app.router.add_post('/api2/json/nodes/{node}/lxc', self._create)
+    app.router.add_get('/api2/json/nodes/{node}/lxc/9000/config', self._reply({'hostname': 'tpl', 'template': 1}))
+    app.router.add_get('/api2/json/nodes/{node}/lxc/101/config', self._reply({'hostname': 'db'}))
+    app.router.add_post('/api2/json/nodes/{node}/lxc/{vmid}/clone', self._create)
+    app.router.add_get('/api2/json/nodes/{node}/tasks', self._tasks)
+    app.router.add_get('/api2/json/nodes/{node}/tasks/{upid}/log', self._task_log)
+    app.router.add_get('/api2/json/pools/{poolid}', self._reply(None, status=500))
+    app.router.add_get('/api2/json/storage', self._reply([{'storage': 'local'}, {'storage': 'nfs', 'shared': 1}]))
+    app.router.add_get('/api2/json/nodes/{node}/storage/{storage}/content', self._reply(
+      [{'volid': 'x:iso/a.iso', 'content': 'iso'}, {'volid': 'x:backup/b.tar', 'content': 'backup', 'vmid': 100}]))
+    self.server = TestServer(app)
+    await self.server.start_server()
+    base_url = str(self.server.make_url('/api2/json'))
+    self.proxmox = AsyncProxmoxAPI(user='root@pam', password='secret', base_url=base_url)
+    self.info = AsyncInfo(self.proxmox)
+    self.actions = AsyncActions(self.proxmox, self.info)
+
+  async def asyncTearDown(self):
+    await self.proxmox.close()
+    await self.server.close()
+
+  @staticmethod
+  def _data(data, status=200):
+    return web.json_response({'data': data}, status=status)
+
+  def _reply(self, data, status=200):
+    async def handler(request):
+      return self._data(data, status)
+    return handler
+
+  async def _ticket(self, request):
+    form = await request.post()
+    if form['password'] != 'secret':
+      return web.json_response({'data': None}, status=401)
+    return self._data({'ticket': 'ticket', 'CSRFPreventionToken': 'csrf'})
+
+  async def _create(self, request):
+    form = await request.post()
+    self.created = dict(form)
+    return self._data(UPID)
+
+  async def _tasks(self, request):
+    return self._data([{'upid': UPID, 'endtime': 1, 'status': 'OK'}])
+
+  async def test_resources(self):
+    resources = AsyncResources(self.proxmox)
+    self.assertEqual(await resources.get_nodes(), [{'node': 'node1'}, {'node': 'node2'}])
+    self.assertEqual(await resources.get_node('node2'), {'node': 'node2'})
+    self.assertEqual((await resources.get_vm(101))['name'], 'db')
+    self.assertIsNone(await resources.get_vm(102, ignore_missing=True))
+    self.assertIsNone(await resources.get_pool('missing'))
+    backups = [record async for record in resources.iter_storage_content(content=('backup',), max_workers=2)]
+    self.assertEqual(
+      sorted((r['node'], r['storage']) for r in backups), [('node1', 'local'), ('node1', 'nfs'), ('node2', 'local')])
+    self.assertEqual({r['vmid'] for r in backups}, {100})
+
+  async def test_coalesced_reads(self):
+    await self.proxmox.login()
+    resources = AsyncResources(self.proxmox)
+    results = await asyncio.gather(*(resources.get_nodes() for _ in range(5)), resources.get_pool('missing'))
+    self.assertEqual(results[:5], [[{'node': 'node1'}, {'node': 'node2'}]] * 5)
+    self.assertIsNot(results[0], results[1])
+    self.assertEqual([r[1] for r in self.requests].count('/api2/json/nodes'), 1)
+    self.assertEqual(self.proxmox.coalesced, 4)
+    await resources.get_nodes()
+    self.assertEqual([r[1] for r in self.requests].count('/api2/json/nodes'), 2)
+
+  async def test_limiter(self):
+    limiter = ApiLimiter(node_concurrency=1, node_max_concurrency=1)
+    proxmox = AsyncProxmoxAPI(user='root@pam', password='secret', base_url=self.proxmox._base_url, limiter=limiter)
+    try:
+      info = AsyncInfo(proxmox)
+      versions = await asyncio.gather(*(info.node_version('node1') for _ in range(3)), info.version())
+    finally:
+      await proxmox.close()
+    self.assertEqual([v['version'] for v in versions], ['8.1.4'] * 4)
+    stats = limiter.stats()
+    self.assertEqual(stats['node1']['acquired'], 1)
+    self.assertEqual(stats['cluster']['acquired'], 2)
+    self.assertEqual(stats['cluster']['inflight'], 0)
+
+  async def _task_log(self, request):
+    lines = [{'n': n, 't': text} for n, text in enumerate(['creating', 'extracting', 'TASK OK'], 1)]
+    start, limit = int(request.query['start']), int(request.query['limit'])
+    return self._data(lines[start:start + limit])
+
+  async def test_info(self):
+    self.assertEqual(await self.info.get_nextvmid(), 200)
+    self.assertEqual(await self.info.get_vmid('web'), 100)
+    self.assertTrue((await self.info.capabilities()).supports('tags'))
+    logins = [r for r in self.requests if r[1] == '/api2/json/access/ticket']
+    self.assertEqual(len(logins), 1)
+
+  async def test_create_instance(self):
+    result = await self.actions.create_instance(vmid=200, node='node1', disk='local-lvm:8', storage='local', cpus=2,
+                                                memory=1024, swap=0, timeout=5, clone=None, tags=['ci'], hostname='ci-200')
+    self.assertTrue(result)
+    self.assertEqual(self.created['tags'], 'ci')
+    self.assertEqual(self.created['vmid'], '200')
+    posts = [r for r in self.requests if r[1] == '/api2/json/nodes/node1/lxc']
+    self.assertEqual(posts[0][2], 'csrf')
+
+  async def test_create_progress(self):
+    lines = []
+    self.assertTrue(await self.actions.create_instance(vmid=200, node='node1', disk='local-lvm:8', storage='local', cpus=1,
+                                                       memory=512, swap=0, timeout=5, clone=None, progress=lines.append))
+    self.assertEqual(lines, ['creating', 'extracting', 'TASK OK'])
+
+  async def test_create_instance_clone(self):
+    # same clone parameters as the synchronous client
+    self.assertTrue(await self.actions.create_instance(vmid=200, node='node1', disk='local-lvm:8', storage=None, cpus=1,
+                                                       memory=512, swap=0, timeout=5, clone=9000, hostname='ci-200',
+                                                       pool='ci'))
+    self.assertEqual(self.created, {'newid': '200', 'full': '0', 'hostname': 'ci-200', 'pool': 'ci'})
+    self.assertTrue(await self.actions.create_instance(vmid=201, node='node1', disk='local-lvm:8', storage='local', cpus=1,
+                                                       memory=512, swap=0, timeout=5, clone=9000, clone_type='full'))
+    self.assertEqual(self.created, {'newid': '201', 'full': '1', 'storage': 'local'})
+    # a linked clone needs a template
+    self.created = {}
+    self.assertFalse(await self.actions.create_instance(vmid=202, node='node1', disk='local-lvm:8', storage=None, cpus=1,
+                                                        memory=512, swap=0, timeout=5, clone=101, clone_type='linked'))
+    self.assertEqual(self.created, {})
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,167 @@
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from proximate_utils.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, NodeBreaker
+from proximate_utils.info import Info
+from proximate_utils.main import ProximateUtils
+from proximate_utils.resources import Resources
+from proximate_utils.session import SessionConfig, install_layer
+
+from tests.fake_pve import FakeCluster, FakePVEServer
+
+URL = 'https://pve:8006/api2/json/nodes/node2/status'
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+  def test_open_and_probe(self):
+    breaker = CircuitBreaker('node2', failure_threshold=2, reset_timeout=0.05)
+    breaker.allow()
+    breaker.record(False)
+    breaker.record(True)
+    breaker.record(False)
+    self.assertEqual(breaker.state, CLOSED)
+    breaker.record(False)
+    self.assertEqual(breaker.state, OPEN)
+    with self.assertRaises(CircuitOpenError) as raised:
+      breaker.allow()
+    self.assertEqual(raised.exception.scope, 'node2')
+    self.assertGreater(raised.exception.retry_after, 0)
+
+    time.sleep(0.06)
+    breaker.allow()
+    self.assertEqual(breaker.state, HALF_OPEN)
+    # only one probe at a time
+    with self.assertRaises(CircuitOpenError):
+      breaker.allow()
+    breaker.record(False)
+    self.assertEqual(breaker.state, OPEN)
+
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.record(True)
+    self.assertEqual(breaker.state, CLOSED)
+    self.assertEqual(breaker.stats(), {'state': CLOSED, 'failures': 0, 'opened': 2, 'rejected': 2})
+
+
+class NodeBreakerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.layer = NodeBreaker(failure_threshold=3, reset_timeout=60, retries=2, backoff=0.001)
+
+  def test_retries_get(self):
+    request = MagicMock(side_effect=[MagicMock(status_code=595), ConnectionError('refused'), MagicMock(status_code=200)])
+    self.assertEqual(self.layer(request, 'GET', URL).status_code, 200)
+    self.assertEqual(request.call_count, 3)
+    self.assertEqual(self.layer.retried, 2)
+    self.assertEqual(self.layer.stats()['node2']['state'], CLOSED)
+
+  def test_does_not_retry_writes_or_client_errors(self):
+    request = MagicMock(return_value=MagicMock(status_code=503))
+    self.assertEqual(self.layer(request, 'POST', URL).status_code, 503)
+    request = MagicMock(return_value=MagicMock(status_code=404))
+    self.assertEqual(self.layer(request, 'GET', URL).status_code, 404)
+    self.assertEqual(self.layer.retried, 0)
+    self.assertEqual(self.layer.stats()['node2']['failures'], 0)
+
+  def test_application_errors_are_not_failures(self):
+    request = MagicMock(return_value=MagicMock(status_code=500))
+    url = 'https://pve:8006/api2/json/nodes/node1/lxc/999/config'
+    for _ in range(5):
+      self.assertEqual(self.layer(request, 'GET', url).status_code, 500)
+    self.assertEqual(request.call_count, 5)
+    self.assertEqual(self.layer.retried, 0)
+    self.assertEqual(self.layer.stats()['node1'], {'state': CLOSED, 'failures': 0, 'opened': 0, 'rejected': 0})
+
+  def test_opens_per_node(self):
+    request = MagicMock(side_effect=ConnectionError('timed out'))
+    with self.assertRaises(ConnectionError):
+      self.layer(request, 'GET', URL)
+    self.assertEqual(request.call_count, 3)
+    with self.assertRaises(CircuitOpenError):
+      self.layer(request, 'GET', URL)
+    self.assertEqual(request.call_count, 3)
+    # other nodes and cluster wide endpoints are not affected
+    ok = MagicMock(return_value=MagicMock(status_code=200))
+    self.layer(ok, 'GET', 'https://pve:8006/api2/json/nodes/node1/status')
+    self.layer(ok, 'GET', 'https://pve:8006/api2/json/cluster/resources')
+    self.assertEqual(set(self.layer.stats()), {'cluster', 'node1', 'node2'})
+
+  def test_delay_is_jittered_and_capped(self):
+    layer = NodeBreaker(backoff=1.0, max_backoff=3.0)
+    delays = [layer.delay(5) for _ in range(200)]
+    self.assertTrue(all(0 <= d <= 3.0 for d in delays))
+    self.assertGreater(len(set(delays)), 1)
+
+
+class FakeNodeOutageTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cluster = FakeCluster(nodes=3, guests=6, storages=1, content=4)
+    self.server = FakePVEServer(self.cluster).start()
+    self.breaker = NodeBreaker(failure_threshold=2, reset_timeout=0.2, retries=1, backoff=0.001)
+    proxmox = self.server.connect()
+    install_layer(proxmox, self.breaker)
+    self.resources = Resources(proxmox)
+    self.info = Info(proxmox)
+
+  def tearDown(self):
+    self.server.stop()
+
+  def test_outage_fails_fast_and_recovers(self):
+    self.cluster.down_nodes.add('node2')
+    # the failed call is logged and retried once, the second failure opens the circuit
+    self.assertIsNone(self.resources.get_storage_content('node2', 'storage1'))
+    requests = self.cluster.requests
+    with self.assertRaises(CircuitOpenError):
+      self.resources.get_storage_content('node2', 'storage1')
+    with self.assertRaises(CircuitOpenError):
+      self.info.node_version('node2')
+    self.assertEqual(self.cluster.requests, requests)
+
+    # aggregates carry on without the unreachable node
+    volumes = list(self.resources.iter_storage_content(shared_once=False))
+    self.assertEqual({volume['node'] for volume in volumes}, {'node1', 'node3'})
+    self.assertEqual(self.info.version_drift().nodes, ['node1', 'node3'])
+    health = self.resources.get_cluster_health()
+    self.assertEqual([node.node for node in health.degraded], ['node2'])
+
+    self.cluster.down_nodes.clear()
+    time.sleep(0.25)
+    self.assertEqual(len(self.resources.get_storage_content('node2', 'storage1')), 4)
+    self.assertEqual(self.breaker.stats()['node2']['state'], CLOSED)
+
+
+class AdapterRetriesTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cluster = FakeCluster(nodes=2, guests=2, storages=1, content=1)
+    self.cluster.down_nodes.add('node2')
+    # retried by urllib3 unless its retries are off
+    self.cluster.down_status = 503
+    self.server = FakePVEServer(self.cluster).start()
+
+  def tearDown(self):
+    self.server.stop()
+
+  def attempts(self, utils) -> int:
+    breaker = NodeBreaker(failure_threshold=10, retries=2, backoff=0.001)
+    resources = Resources(self.server.connect(config=utils.connection_config(), layers=[breaker]))
+    requests = self.cluster.requests
+    self.assertIsNone(resources.get_storage_content('node2', 'storage1'))
+    self.assertEqual(breaker.stats()['node2']['failures'], 3)
+    return self.cluster.requests - requests
+
+  def test_breaker_turns_adapter_retries_off(self):
+    utils = ProximateUtils(session_config=SessionConfig(backoff_factor=0))
+    # one attempt per breaker try, not (1 + 3) each
+    self.assertEqual(self.attempts(utils), 3)
+    self.assertEqual(utils.session_config.retries, 3)
+    utils = ProximateUtils(session_config=SessionConfig(backoff_factor=0))
+    utils.fail_fast = False
+    self.assertEqual(utils.connection_config().retries, 3)
+
+
+if __name__ == '__main__':
+  unittest.main()
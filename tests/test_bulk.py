@@ -0,0 +1,51 @@
+import threading
+import time
+import unittest
+from collections import Counter
+
+from proximate_utils.bulk import BulkSummary, OperationResult, run_per_node
+
+
+class RunPerNodeTest(unittest.TestCase):
+
+  def setUp(self):
+    self.lock = threading.Lock()
+    self.running = Counter()
+    self.peak = Counter()
+
+  def _work(self, item):
+    node = item['node']
+    with self.lock:
+      self.running[node] += 1
+      self.running['cluster'] += 1
+      self.peak[node] = max(self.peak[node], self.running[node])
+      self.peak['cluster'] = max(self.peak['cluster'], self.running['cluster'])
+    time.sleep(0.01)
+    with self.lock:
+      self.running[node] -= 1
+      self.running['cluster'] -= 1
+    return item['vmid']
+
+  def test_concurrency_caps(self):
+    items = [{'vmid': 100 + i, 'node': 'node%d' % (i % 3)} for i in range(30)]
+    results = [future.result() for _, future in run_per_node(items, self._work, lambda i: i['node'], max_workers=4, per_node=2)]
+    self.assertEqual(sorted(results), [item['vmid'] for item in items])
+    self.assertLessEqual(self.peak['cluster'], 4)
+    for node in ('node0', 'node1', 'node2'):
+      self.assertLessEqual(self.peak[node], 2)
+
+  def test_exceptions_are_returned(self):
+    def fail(item):
+      raise RuntimeError('boom')
+    (item, future), = list(run_per_node([{'node': 'node1'}], fail, lambda i: i['node']))
+    self.assertIsInstance(future.exception(), RuntimeError)
+
+  def test_summary(self):
+    summary = BulkSummary([OperationResult(100, 'node1', True, 1.0), OperationResult(101, 'node1', False, 1.0, 'err')], 30.0)
+    self.assertEqual(summary.succeeded, 1)
+    self.assertEqual(summary.failed, 1)
+    self.assertEqual(summary.throughput, 4.0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from unittest.mock import patch
+
+from proximate_utils.capabilities import Capabilities
+from proximate_utils.info import Info
+
+
+class CapabilitiesTest(unittest.TestCase):
+
+  def test_features(self):
+    capabilities = Capabilities('6.2')
+    self.assertTrue(capabilities.supports('tags'))
+    self.assertFalse(capabilities.supports('timezone'))
+    self.assertTrue(capabilities.supports('ssh-public-keys'))
+    self.assertTrue(capabilities.supports('hostname'))
+    self.assertEqual(capabilities.vz_type, 'lxc')
+
+  def test_openvz(self):
+    capabilities = Capabilities({'version': '3.4', 'release': '3.4'})
+    self.assertEqual(capabilities.version, '3.4')
+    self.assertEqual(capabilities.vz_type, 'openvz')
+
+
+class InfoCapabilitiesTest(unittest.TestCase):
+
+  @patch('proxmoxer.ProxmoxAPI')
+  def setUp(self, mock_proxmox):
+    self.mock_proxmox = mock_proxmox
+    self.info = Info(self.mock_proxmox)
+
+  def test_cluster_capabilities_cached(self):
+    self.mock_proxmox.version.get.return_value = {'version': '8.1.4'}
+    self.assertTrue(self.info.capabilities().supports('timezone'))
+    self.info.capabilities()
+    self.assertEqual(self.mock_proxmox.version.get.call_count, 1)
+
+  def test_node_capabilities(self):
+    self.mock_proxmox.nodes.return_value.version.get.return_value = {'version': '6.2'}
+    capabilities = self.info.capabilities('node1')
+    self.assertFalse(capabilities.supports('timezone'))
+    self.info.capabilities('node1')
+    self.mock_proxmox.nodes.assert_called_once_with('node1')
+
+  def test_capabilities_error_not_cached(self):
+    self.mock_proxmox.version.get.side_effect = Exception("Test Error")
+    self.assertIsNone(self.info.capabilities())
+    self.mock_proxmox.version.get.side_effect = None
+    self.mock_proxmox.version.get.return_value = {'version': '8.1'}
+    self.assertEqual(self.info.capabilities().version, '8.1')
+
+  def test_invalidate_capabilities(self):
+    self.mock_proxmox.version.get.return_value = {'version': '8.1'}
+    self.info.capabilities()
+    self.info.invalidate_capabilities()
+    self.info.capabilities()
+    self.assertEqual(self.mock_proxmox.version.get.call_count, 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,82 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+from proximate_utils.coalesce import SingleFlight, request_key
+from proximate_utils.resources import Resources
+
+from tests.fake_pve import FakeCluster, FakePVEServer
+
+
+class SingleFlightTest(unittest.TestCase):
+
+  def setUp(self):
+    self.layer = SingleFlight()
+    self.calls = []
+    self.release = threading.Event()
+
+  def request(self, method, url, **kwargs):
+    self.calls.append((method, url, kwargs))
+    self.release.wait(5)
+    if url.endswith('/fail'):
+      raise ConnectionError('unreachable')
+    return MagicMock(content=b'{"data": []}')
+
+  def burst(self, method, url, count=8, **kwargs):
+    with ThreadPoolExecutor(count) as pool:
+      futures = [pool.submit(self.layer, self.request, method, url, **kwargs) for _ in range(count)]
+      while self.layer.requests + self.layer.coalesced < count:
+        time.sleep(0.001)
+      self.release.set()
+      return futures
+
+  def test_request_key(self):
+    self.assertEqual(request_key('get', '/nodes', {'a': 1, 'b': None}), request_key('GET', '/nodes', {'a': '1'}))
+    self.assertNotEqual(request_key('GET', '/nodes', {'a': 1}), request_key('GET', '/nodes', {'a': 2}))
+
+  def test_coalesced(self):
+    futures = self.burst('GET', '/cluster/resources', params={'type': 'vm'})
+    responses = {id(future.result()) for future in futures}
+    self.assertEqual(len(self.calls), 1)
+    self.assertEqual(len(responses), 1)
+    self.assertEqual((self.layer.requests, self.layer.coalesced, self.layer.inflight), (1, 7, 0))
+
+  def test_errors_fan_out(self):
+    futures = self.burst('GET', '/fail', count=4)
+    for future in futures:
+      self.assertIsInstance(future.exception(), ConnectionError)
+    self.assertEqual(len(self.calls), 1)
+
+  def test_writes_not_coalesced(self):
+    self.release.set()
+    for _ in range(3):
+      self.layer(self.request, 'POST', '/nodes/node1/lxc', data={'vmid': 100})
+    self.assertEqual(len(self.calls), 3)
+    self.assertEqual(self.layer.requests, 0)
+
+  def test_sequential_not_cached(self):
+    self.release.set()
+    self.layer(self.request, 'GET', '/nodes')
+    self.layer(self.request, 'GET', '/nodes')
+    self.assertEqual(len(self.calls), 2)
+
+
+class SingleFlightServerTest(unittest.TestCase):
+
+  def test_burst_against_fake_api(self):
+    cluster = FakeCluster(nodes=2, guests=20, latency=0.05)
+    layer = SingleFlight()
+    with FakePVEServer(cluster) as server:
+      resources = Resources(server.connect(layers=(layer,)))
+      with ThreadPoolExecutor(10) as pool:
+        results = list(pool.map(lambda _: resources.get_nodes(), range(10)))
+    self.assertEqual(len({id(nodes) for nodes in results}), 10)
+    self.assertTrue(all(nodes == results[0] for nodes in results))
+    self.assertLess(layer.requests, 10)
+    self.assertEqual(layer.requests + layer.coalesced, 10)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,100 @@
+import os
+import shutil
+import socket
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+
+from proximate_utils.daemon import DaemonClient, DaemonError, ProximateDaemon, open_utils
+from proximate_utils.main import ProximateUtils
+
+from tests.fake_pve import FakeCluster, FakePVEServer
+
+
+class ProximateDaemonTest(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.cluster = FakeCluster(nodes=2, guests=10, task_duration=0.02)
+    cls.server = FakePVEServer(cls.cluster).start()
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.stop()
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = Path(self.dir) / 'proximate.sock'
+    self.utils = ProximateUtils(kv_db=Path(self.dir) / 'kv.sqlite')
+    self.utils.proxmox = self.server.connect()
+    self.daemon = ProximateDaemon(self.utils, self.path).start()
+    self.client = DaemonClient(self.path, timeout=5)
+
+  def tearDown(self):
+    self.client.close()
+    self.daemon.stop()
+    shutil.rmtree(self.dir)
+
+  def test_calls(self):
+    self.assertEqual(self.client.info.version()['version'], '8.1.4')
+    self.assertEqual(self.client.resources.get_vm(105)['name'], 'ct105')
+    self.assertEqual(self.client.info.get_vmid('ct103'), 103)
+    self.assertEqual(self.client.actions.get_vm(vmid=104)['vmid'], 104)
+    # dataclasses arrive as plain JSON
+    health = self.client.resources.get_cluster_health()
+    self.assertEqual([node['node'] for node in health['nodes']], ['node1', 'node2'])
+    self.assertIsInstance(self.client.resources.get_storage_content('node1', 'storage1', content='iso'), list)
+    self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+  def test_warm_caches(self):
+    self.client.info.get_vmid('ct101')
+    requests = self.cluster.requests
+    for vmid in range(100, 110):
+      self.assertEqual(self.client.resources.get_vm(vmid)['vmid'], vmid)
+    self.assertEqual(self.cluster.requests, requests)
+    self.assertGreaterEqual(self.client.ping()['requests'], 11)
+
+  def test_errors(self):
+    with self.assertRaises(DaemonError) as raised:
+      self.client.info.missing()
+    self.assertEqual(raised.exception.type, 'ValueError')
+    with self.assertRaises(DaemonError):
+      self.client.call('info', '_capabilities_lock')
+    with self.assertRaises(DaemonError):
+      self.client.call('proximate_store', 'find_groups')
+    # only allowlisted methods, generators would hold a daemon thread forever
+    for method in ('watch', 'iter_storage_content', 'bulk_lifecycle'):
+      with self.assertRaises(DaemonError) as raised:
+        self.client.call('actions', method)
+      self.assertIn('not served', str(raised.exception))
+    self.utils.resources.get_pools = lambda: (pool for pool in ())
+    with self.assertRaises(DaemonError) as raised:
+      self.client.resources.get_pools()
+    self.assertIn('generator', str(raised.exception))
+    with self.assertRaises(DaemonError) as raised:
+      self.client.info.get_vmid()
+    self.assertEqual(raised.exception.type, 'TypeError')
+    # the connection survives failed calls
+    self.assertEqual(self.client.info.get_vmid('ct103'), 103)
+
+  def test_open_utils(self):
+    self.assertIsInstance(open_utils(self.path), DaemonClient)
+    self.assertIsInstance(open_utils(Path(self.dir) / 'other.sock'), ProximateUtils)
+    with self.assertRaises(RuntimeError):
+      ProximateDaemon(self.utils, self.path).start(warm=False)
+
+  def test_stale_socket(self):
+    self.daemon.stop()
+    self.assertFalse(self.path.exists())
+    # a socket file nobody listens on, as left by a killed daemon
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(self.path))
+    stale.close()
+    self.assertFalse(self.client.available())
+    self.daemon.start(warm=False)
+    self.assertTrue(self.client.available())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from proximate_utils.drift import installed_versions, version_drift
+
+
+class DriftTest(unittest.TestCase):
+
+  def test_installed_versions(self):
+    apt_versions = [
+      {'Package': 'pve-manager', 'Version': '8.1.4', 'CurrentState': 'Installed'},
+      {'Package': 'proxmox-ve', 'Version': '8.1.0', 'OldVersion': '8.0.2', 'CurrentState': 'Installed'},
+      {'Package': 'ceph', 'Version': '18.2.0', 'CurrentState': 'NotInstalled'},
+    ]
+    self.assertEqual(installed_versions(apt_versions), {'pve-manager': '8.1.4', 'proxmox-ve': '8.0.2'})
+    self.assertEqual(installed_versions(None), {})
+
+  def test_version_drift(self):
+    report = version_drift({
+      'node1': {'pve-manager': '8.1.4', 'corosync': '3.1.7-pve3', 'zfs': '2.2.2'},
+      'node2': {'pve-manager': '8.1.10', 'corosync': '3.1.7-pve3'},
+      'node3': {'pve-manager': '8.1.4~rc1', 'corosync': '3.1.7-pve3', 'zfs': '2.2.2'},
+    })
+    self.assertEqual(report.latest['pve-manager'], '8.1.10')
+    self.assertEqual(report.lagging, {'pve-manager': ['node1', 'node3']})
+    self.assertIsNone(report.matrix['zfs']['node2'])
+    self.assertEqual(list(report.drifted), ['pve-manager'])
+    lines = str(report).splitlines()
+    self.assertEqual(lines[0].split(), ['package', 'node1', 'node2', 'node3'])
+    self.assertEqual(lines[1].split(), ['pve-manager', '8.1.4', '8.1.10', '8.1.4~rc1'])
+
+  def test_packages_filter(self):
+    report = version_drift({'node1': {'a': '1.0', 'b': '2.0'}, 'node2': {'a': '1.1', 'b': '2.0'}}, packages=['b'])
+    self.assertEqual(list(report.matrix), ['b'])
+    self.assertEqual(str(report), 'No version drift across 2 nodes')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+
+from proximate_utils.actions import Actions
+from proximate_utils.info import Info
+from proximate_utils.resources import Resources
+
+from tests.fake_pve import FakeCluster, FakePVEServer
+
+
+class FakePVEServerTest(unittest.TestCase):
+  """Runs Resources, Info and Actions through proxmoxer against the fake API"""
+
+  @classmethod
+  def setUpClass(cls):
+    cls.cluster = FakeCluster(nodes=3, guests=30, pools=2, storages=2, content=8, task_duration=0.05)
+    cls.server = FakePVEServer(cls.cluster).start()
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.stop()
+
+  def setUp(self):
+    self.proxmox = self.server.connect()
+    self.info = Info(self.proxmox)
+    self.actions = Actions(self.proxmox, self.info)
+
+  def test_resources(self):
+    resources = Resources(self.proxmox)
+    self.assertEqual([node['node'] for node in resources.get_nodes()], ['node1', 'node2', 'node3'])
+    self.assertEqual(resources.get_node('node2')['node'], 'node2')
+    self.assertEqual(resources.get_vm(105)['name'], 'ct105')
+    self.assertIsNone(resources.get_vm(99, ignore_missing=True))
+    self.assertEqual(len(resources.get_pool('pool1')['members']), 15)
+    self.assertIsNone(resources.get_pool('missing'))
+    self.assertEqual(len(resources.get_storages(None)), 2)
+    self.assertEqual(len(resources.get_storage_content('node1', 'storage1', content='iso')), 2)
+    isos = list(resources.iter_storage_content(content='iso', max_workers=4))
+    self.assertEqual(len(isos), 3 * 2 * 2)
+    self.assertEqual({record['content'] for record in isos}, {'iso'})
+
+  def test_cluster_health(self):
+    resources = Resources(self.proxmox)
+    summary = resources.get_cluster_health(timeout=2.0)
+    self.assertEqual([node.node for node in summary.nodes], ['node1', 'node2', 'node3'])
+    self.assertEqual(summary.degraded, [])
+    self.assertEqual(summary.nodes[0].pve_version, 'pve-manager/8.1.4/fake')
+    self.assertEqual(len(summary.storage), 3 * 2)
+
+    self.cluster.node_latency['node2'] = 1.0
+    try:
+      summary = resources.get_cluster_health(timeout=0.3)
+    finally:
+      self.cluster.node_latency.clear()
+    self.assertLess(summary.elapsed, 0.9)
+    self.assertEqual([node.node for node in summary.degraded], ['node2'])
+    self.assertEqual(set(summary.nodes[1].errors), {'status', 'storage', 'subscription'})
+    self.assertEqual(summary.nodes[1].memory_total, None)
+    self.assertIsNotNone(summary.nodes[2].memory_total)
+
+  def test_cluster_health_more_nodes_than_workers(self):
+    cluster = FakeCluster(nodes=6, guests=0)
+    cluster.node_latency['node1'] = 1.0
+    with FakePVEServer(cluster) as server:
+      resources = Resources(server.connect())
+      summary = resources.get_cluster_health(timeout=0.3, max_workers=4)
+      self.assertLess(summary.elapsed, 0.9)
+      self.assertEqual([node.node for node in summary.degraded], ['node1'])
+      self.assertEqual(set(summary.nodes[0].errors), {'status', 'storage', 'subscription'})
+      self.assertTrue(all(node.memory_total is not None for node in summary.nodes[1:]))
+
+      # hung nodes hold every worker, the calls queued behind them are reported once the timeout has passed
+      cluster.node_latency['node2'] = 1.0
+      summary = resources.get_cluster_health(timeout=0.3, max_workers=2)
+    self.assertLess(summary.elapsed, 0.9)
+    self.assertEqual(len(summary.degraded), 6)
+    self.assertEqual(summary.nodes[5].errors['status'], 'timed out after 0.3s')
+
+  def test_info(self):
+    self.assertEqual(self.info.version()['version'], '8.1.4')
+    self.assertEqual(self.info.get_vmid('ct110'), 110)
+    self.assertTrue(self.info.capabilities('node1').supports('timezone'))
+    report = self.info.version_drift(max_workers=3)
+    self.assertEqual(report.nodes, ['node1', 'node2', 'node3'])
+    self.assertEqual(len(report.matrix), 50)
+    self.assertEqual({nodes[0] for nodes in report.lagging.values()}, {'node3'})
+    self.assertGreaterEqual(self.info.get_nextvmid(), 130)
+
+  def test_create_and_clone(self):
+    vmid = self.info.get_nextvmid()
+    self.assertTrue(self.actions.create_instance(vmid=vmid, node='node1', disk='storage1:8', storage='storage1', cpus=1,
+                                                 memory=256, swap=0, timeout=5, clone=None, hostname='fresh', tags=['ci']))
+    self.assertEqual(self.info.get_vmid('fresh'), vmid)
+    self.assertFalse(self.actions.is_template_container('node1', vmid))
+    # a container that is not a template can only be copied in full, onto a given storage
+    self.assertFalse(self.actions.create_instance(vmid=vmid + 1, node='node1', disk=None, storage=None, cpus=1, memory=256,
+                                                  swap=0, timeout=5, clone=vmid))
+    self.assertTrue(self.actions.create_instance(vmid=vmid + 1, node='node1', disk=None, storage='storage1', cpus=1,
+                                                 memory=256, swap=0, timeout=5, clone=vmid, hostname='copy'))
+    self.assertEqual(self.actions.get_vm(vmid + 1)['node'], 'node1')
+    self.assertEqual(self.actions.get_vm(vmid + 1)['name'], 'copy')
+
+  def test_create_progress(self):
+    self.cluster.task_log_lines = 20
+    lines = []
+    vmid = self.info.get_nextvmid()
+    try:
+      self.assertTrue(self.actions.create_instance(vmid=vmid, node='node2', disk='storage1:8', storage='storage1', cpus=1,
+                                                   memory=256, swap=0, timeout=5, clone=None, progress=lines.append))
+    finally:
+      self.cluster.task_log_lines = 10
+    self.assertEqual(lines[-1], 'TASK OK')
+    self.assertEqual(len(lines), 21)
+    self.assertEqual(len(set(lines)), len(lines))
+
+  def test_create_timeout_logs_last_line(self):
+    self.cluster.task_duration = 5
+    vmid = self.info.get_nextvmid()
+    try:
+      with self.assertLogs('Resources', level='ERROR') as logs:
+        self.assertFalse(self.actions.create_instance(vmid=vmid, node='node3', disk='storage1:8', storage='storage1',
+                                                      cpus=1, memory=256, swap=0, timeout=1.0, clone=None))
+    finally:
+      self.cluster.task_duration = 0.05
+    self.assertRegex(logs.output[-1], r'before timeout: vzcreate: progress \d+%$')
+
+  def test_task_log(self):
+    upid = self.cluster.start_task('node2', 'vzdump', 101, duration=0)
+    self.assertTrue(self.info.api_task_ok('node2', upid))
+    log = self.proxmox.nodes('node2').tasks(upid).log.get(start=0, limit=100)
+    self.assertEqual(log[-1]['t'], 'TASK OK')
+
+
+if __name__ == '__main__':
+  unittest.main()
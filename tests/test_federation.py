@@ -0,0 +1,107 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from proximate_utils.federation import Federation, tag_records
+from proximate_utils.main import ProximateUtils
+
+from tests.fake_pve import FakeCluster, FakePVEServer
+
+
+class FederationTest(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.clusters = {name: FakeCluster(nodes=2, guests=guests, latency=0.05) for name, guests in
+                    (('lab', 4), ('prod', 8), ('dr', 2))}
+    cls.clusters['prod']._add_guest(500, 'node1', 'gateway')
+    cls.clusters['dr']._add_guest(900, 'node2', 'gateway')
+    cls.servers = {name: FakePVEServer(cluster).start() for name, cluster in cls.clusters.items()}
+
+  @classmethod
+  def tearDownClass(cls):
+    for server in cls.servers.values():
+      server.stop()
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.members = {}
+    for name, server in self.servers.items():
+      member = ProximateUtils(kv_db=Path(self.dir) / ('%s.sqlite' % name))
+      member.proxmox = server.connect()
+      self.members[name] = member
+    self.federation = Federation(self.members)
+
+  def test_tag_records(self):
+    records = [{'vmid': 100}]
+    self.assertEqual(tag_records('lab', records), [{'vmid': 100, 'cluster': 'lab'}])
+    self.assertEqual(records, [{'vmid': 100}])
+    self.assertEqual(tag_records('lab', None), [])
+
+  def test_merged_queries(self):
+    vms = self.federation.get_vms()
+    self.assertEqual(len(vms), 4 + 9 + 3)
+    self.assertEqual({vm['cluster'] for vm in vms}, {'lab', 'prod', 'dr'})
+    self.assertEqual(len(self.federation.get_nodes(clusters=['lab'])), 2)
+    self.assertEqual(self.federation.get_vmid('gateway'), {'prod': 500, 'dr': 900})
+    self.assertEqual(self.federation.get_nextvmid(), {'lab': 104, 'prod': 501, 'dr': 901})
+    self.assertEqual(self.federation.call('info', 'version', clusters=['dr'])['dr']['version'], '8.1.4')
+
+  def test_locate_is_one_parallel_round(self):
+    for member in self.members.values():
+      member.snapshot.invalidate()
+    requests = {name: cluster.requests for name, cluster in self.clusters.items()}
+    start = time.monotonic()
+    found = self.federation.locate('gateway')
+    elapsed = time.monotonic() - start
+    self.assertEqual([(vm['cluster'], vm['vmid'], vm['node']) for vm in found], [('dr', 900, 'node2'), ('prod', 500, 'node1')])
+    self.assertEqual({name: cluster.requests - requests[name] for name, cluster in self.clusters.items()},
+                     {'lab': 1, 'prod': 1, 'dr': 1})
+    self.assertLess(elapsed, 3 * 0.05)
+    self.assertEqual([vm['cluster'] for vm in self.federation.locate(101)], ['dr', 'lab', 'prod'])
+    self.assertEqual(self.federation.locate('missing'), [])
+
+  def test_failed_cluster_is_left_out(self):
+    broken = MagicMock()
+    broken.resources.get_vms.side_effect = ConnectionError('unreachable')
+    federation = Federation(dict(self.members, broken=broken), max_workers=2)
+    with self.assertLogs('Federation', level='ERROR'):
+      vms = federation.get_vms()
+    self.assertNotIn('broken', {vm['cluster'] for vm in vms})
+    self.assertEqual(len(vms), 16)
+
+
+class ProximateUtilsClustersTest(unittest.TestCase):
+
+  def entry(self, title, url):
+    return MagicMock(title=title, url=url, username='root@pam', password='secret')
+
+  @patch('proximate_utils.session.connect')
+  @patch.object(ProximateUtils, '_open_store')
+  def test_clusters_share_one_store(self, mock_open_store, mock_connect):
+    group = MagicMock(entries=[self.entry('proxmox_api', 'https://pve1:8006'), self.entry('proxmox_api:lab', 'https://lab:8006'),
+                               self.entry('other', 'https://x'), self.entry('proxmox_api:dr', 'https://dr:8006')])
+    mock_open_store.return_value.find_groups.return_value = group
+    mock_connect.side_effect = lambda url, **kwargs: MagicMock(name=url)
+
+    utils = ProximateUtils(kv_db='/tmp/proxmox.sqlite')
+    utils.api_rate = 5.0
+    clusters = utils.clusters
+    self.assertEqual(sorted(clusters), ['default', 'dr', 'lab'])
+    self.assertIs(clusters['default'], utils)
+    self.assertEqual(clusters['lab'].proxmox_secrets.url, 'https://lab:8006')
+    self.assertEqual(clusters['lab'].kv_db, Path('/tmp/proxmox-lab.sqlite'))
+    self.assertEqual(clusters['dr'].api_rate, 5.0)
+    self.assertTrue(str(clusters['dr'].ticket_cache_path).endswith('proxmox_ticket_cache-dr'))
+
+    self.assertEqual(utils.federation.names, ['default', 'dr', 'lab'])
+    utils.federation.call('info', 'version')
+    mock_open_store.assert_called_once()
+    self.assertEqual(sorted(call.args[0] for call in mock_connect.call_args_list),
+                     ['https://dr:8006', 'https://lab:8006', 'https://pve1:8006'])
+
+
+if __name__ == '__main__':
+  unittest.main()
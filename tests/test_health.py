@@ -0,0 +1,43 @@
+import unittest
+
+from proximate_utils.health import ClusterHealth, node_health
+
+
+class HealthTest(unittest.TestCase):
+
+  def test_node_health(self):
+    entry = {'node': 'node1', 'status': 'online', 'cpu': 0.5, 'maxcpu': 8, 'mem': 1, 'maxmem': 4}
+    status = {
+      'cpu': 0.25,
+      'cpuinfo': {'cpus': 16},
+      'loadavg': ['1.50', '1.00', '0.50'],
+      'memory': {'used': 2, 'total': 8},
+      'pveversion': 'pve-manager/8.1.4/fake',
+    }
+    health = node_health(entry, status, [{'storage': 'local', 'used': 1, 'total': 2}], {'status': 'active'})
+    self.assertEqual((health.cpu, health.cpus, health.loadavg), (0.25, 16, [1.5, 1.0, 0.5]))
+    self.assertEqual(health.memory_ratio, 0.25)
+    self.assertEqual(health.subscription, 'active')
+    self.assertFalse(health.degraded)
+
+  def test_partial_node_health(self):
+    health = node_health({'node': 'node2', 'status': 'online', 'mem': 1, 'maxmem': 4}, errors={'status': 'timed out'})
+    self.assertEqual(health.memory_ratio, 0.25)
+    self.assertIsNone(health.pve_version)
+    self.assertTrue(health.degraded)
+
+  def test_cluster_storage(self):
+    summary = ClusterHealth(nodes=[
+      node_health({'node': 'node1', 'status': 'online'}, storages=[
+        {'storage': 'local', 'used': 1, 'total': 10}, {'storage': 'nfs', 'shared': 1, 'used': 5, 'total': 50}]),
+      node_health({'node': 'node2', 'status': 'offline'}, storages=[
+        {'storage': 'local', 'used': 2, 'total': 10}, {'storage': 'nfs', 'shared': 1, 'used': 5, 'total': 50},
+        {'storage': 'usb', 'active': 0}]),
+    ])
+    self.assertEqual(summary.storage, {'node1/local': (1, 10), 'nfs': (5, 50), 'node2/local': (2, 10)})
+    self.assertEqual([node.node for node in summary.degraded], ['node2'])
+    self.assertIn('1/2 nodes online', str(summary))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from proximate_utils.info import Info
 
@@ -57,6 +57,21 @@ class InfoTest(unittest.TestCase):
     vmid = self.info.get_vmid('testvm')
     self.assertIsNone(vmid)
 
+  def test_version_drift(self):
+    versions = {
+      'node1': [{'Package': 'pve-manager', 'Version': '8.1.4'}],
+      'node2': [{'Package': 'pve-manager', 'Version': '8.0.3'}],
+    }
+    self.mock_proxmox.nodes.get.return_value = [{'node': 'node1'}, {'node': 'node2'}, {'node': 'node3', 'status': 'offline'}]
+    self.mock_proxmox.nodes.side_effect = lambda node: MagicMock(**{'apt.versions.get.return_value': versions[node]})
+    report = self.info.version_drift()
+    self.assertEqual(report.nodes, ['node1', 'node2'])
+    self.assertEqual(report.lagging, {'pve-manager': ['node2']})
+
+  def test_package_versions_error(self):
+    self.mock_proxmox.nodes.return_value.apt.versions.get.side_effect = Exception("Test Error")
+    self.assertIsNone(self.info.package_versions('node1'))
+
 
 if __name__ == '__main__':
   unittest.main()
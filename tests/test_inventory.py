@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+
+from proximate_utils.inventory import KINDS, InventoryStore
+from proximate_utils.resources import Resources
+
+from tests.fake_pve import FakeCluster, FakePVEServer
+
+
+class InventoryStoreTest(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.cluster = FakeCluster(nodes=3, guests=30, pools=2, storages=2, content=8)
+    cls.server = FakePVEServer(cls.cluster).start()
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.stop()
+
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.tmp.name, 'proxmox', 'proxmox.sqlite')
+    self.resources = Resources(self.server.connect())
+    self.inventory = InventoryStore(self.path, self.resources)
+
+  def tearDown(self):
+    self.inventory.close()
+    self.tmp.cleanup()
+
+  def test_refresh_and_query(self):
+    changed = self.inventory.refresh()
+    self.assertEqual(set(changed), set(KINDS))
+    self.assertEqual(changed['guests'], 30)
+    self.assertEqual([node['node'] for node in self.inventory.nodes()], ['node1', 'node2', 'node3'])
+    self.assertEqual(self.inventory.guest(105)['name'], 'ct105')
+    self.assertIsNone(self.inventory.guest(99))
+    self.assertEqual(len(self.inventory.guests(node='node1')), 10)
+    self.assertEqual(len(self.inventory.guests(pool='pool1')), 15)
+    self.assertEqual([pool['poolid'] for pool in self.inventory.pools()], ['pool1', 'pool2'])
+    self.assertEqual(len(self.inventory.storages()), 2)
+    self.assertEqual(len(self.inventory.storage_content()), 3 * 2 * 8)
+    self.assertEqual(len(self.inventory.storage_content(node='node1', storage='storage1', content='iso')), 2)
+
+  def test_guests_using_storage(self):
+    self.inventory.refresh()
+    vmids = {v['vmid'] for v in self.cluster.content[('node2', 'storage1')] if 'vmid' in v}
+    expected = sorted(vmid for vmid in vmids if self.cluster.guests[vmid]['node'] == 'node2')
+    guests = self.inventory.guests_using_storage('node2', 'storage1')
+    self.assertEqual([guest['vmid'] for guest in guests], expected)
+
+  def test_refresh_is_incremental(self):
+    self.inventory.refresh()
+    requests = self.cluster.requests
+    self.assertEqual(self.inventory.refresh(), {})
+    self.assertEqual(self.cluster.requests, requests)
+
+    changed = self.inventory.refresh(kinds=('guests',), force=True)
+    self.assertEqual(changed, {'guests': 0})
+
+    with self.cluster.lock:
+      self.cluster.guests[100]['status'] = 'migrating'
+      guest = self.cluster.guests.pop(101)
+    try:
+      changed = self.inventory.refresh(kinds=('guests',), force=True)
+    finally:
+      with self.cluster.lock:
+        self.cluster.guests[101] = guest
+    self.assertEqual(changed, {'guests': 2})
+    self.assertEqual(self.inventory.guest(100)['status'], 'migrating')
+    self.assertIsNone(self.inventory.guest(101))
+
+  def test_persistent(self):
+    self.inventory.refresh(kinds=('nodes',))
+    self.inventory.close()
+    self.inventory = InventoryStore(self.path)
+    self.assertEqual(len(self.inventory.nodes()), 3)
+    self.assertFalse(self.inventory.stale('nodes'))
+    self.assertTrue(self.inventory.stale('guests'))
+    with self.assertRaises(ValueError):
+      self.inventory.refresh()
+
+  def test_failed_refresh_keeps_data(self):
+    self.inventory.refresh(kinds=('pools',))
+    self.resources.proxmox = None
+    self.assertEqual(self.inventory.refresh(kinds=('pools',), force=True), {})
+    self.assertEqual(len(self.inventory.pools()), 2)
+
+  def test_unknown_kind(self):
+    with self.assertRaises(ValueError):
+      self.inventory.refresh(kinds=('disks',))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+
+from proximate_utils.actions import Actions
+from proximate_utils.info import Info
+from proximate_utils.lifecycle import parse_startup, select_guests, startup_groups
+
+from tests.fake_pve import FakeCluster, FakePVEServer
+
+VMS = [
+  {'vmid': 100, 'node': 'node1', 'pool': 'web', 'tags': 'prod;edge'},
+  {'vmid': 101, 'node': 'node1', 'pool': 'db', 'tags': 'prod'},
+  {'vmid': 102, 'node': 'node2', 'pool': 'web'},
+  {'vmid': 103, 'node': 'node2', 'template': 1},
+]
+
+
+class LifecycleHelpersTest(unittest.TestCase):
+
+  def test_parse_startup(self):
+    self.assertEqual(parse_startup('order=2,up=30,down=60'), {'order': 2, 'up': 30, 'down': 60})
+    self.assertEqual(parse_startup('up=x,order=1'), {'order': 1})
+    self.assertEqual(parse_startup(None), {})
+
+  def test_select_guests(self):
+    self.assertEqual([vm['vmid'] for vm in select_guests(VMS)], [100, 101, 102])
+    self.assertEqual([vm['vmid'] for vm in select_guests(VMS, node='node2')], [102])
+    self.assertEqual([vm['vmid'] for vm in select_guests(VMS, tags=['prod'])], [100, 101])
+    self.assertEqual([vm['vmid'] for vm in select_guests(VMS, tags='prod,edge', pool='web')], [100])
+    self.assertEqual([vm['vmid'] for vm in select_guests(VMS, vmids=['101', 103])], [101])
+    vms = VMS + [{'vmid': 200, 'node': 'node1', 'type': 'qemu'}]
+    self.assertEqual([vm['vmid'] for vm in select_guests(vms, node='node1', type='qemu')], [200])
+
+  def test_startup_groups(self):
+    startups = {100: {'order': 2}, 101: {'order': 1}, 102: {}}
+    order = lambda groups: [[vm['vmid'] for vm in group] for group in groups]
+    self.assertEqual(order(startup_groups(VMS[:3], startups)), [[101], [100], [102]])
+    self.assertEqual(order(startup_groups(VMS[:3], startups, reverse=True)), [[102], [100], [101]])
+    self.assertEqual(order(startup_groups(VMS[:3])), [[100, 101, 102]])
+    self.assertEqual(startup_groups([]), [])
+
+
+class BulkLifecycleTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cluster = FakeCluster(nodes=3, guests=12, task_duration=0.02)
+    for vmid, guest in self.cluster.guests.items():
+      guest['status'] = 'stopped'
+      guest['tags'] = 'app' if vmid % 2 else 'infra'
+    self.cluster.configs[101]['startup'] = 'order=1,down=30'
+    self.cluster.configs[103]['startup'] = 'order=2'
+    # a VM next to the containers, lifecycle calls only go to container endpoints and report it as failed
+    self.cluster._add_guest(800, 'node1', 'vm800', type='qemu')
+    self.server = FakePVEServer(self.cluster).start()
+    proxmox = self.server.connect()
+    self.actions = Actions(proxmox, Info(proxmox))
+    self.actions.task_waiter.min_interval = 0.01
+
+  def tearDown(self):
+    self.server.stop()
+
+  def tasks(self, type):
+    return {int(task['id']): task for task in self.cluster.tasks.values() if task['type'] == type}
+
+  def test_start_and_shutdown_in_order(self):
+    progress = []
+    summary = self.actions.start_guests(tags=['app'], callback=progress.append, per_node=2)
+    self.assertEqual((summary.succeeded, summary.failed), (6, 0))
+    self.assertEqual(len(progress), 6)
+    started = self.tasks('vzstart')
+    self.assertEqual(set(started), {101, 103, 105, 107, 109, 111})
+    self.assertLess(started[101]['started'], started[103]['started'])
+    self.assertTrue(all(started[103]['started'] < started[vmid]['started'] for vmid in (105, 107, 109, 111)))
+    self.assertEqual({self.cluster.guests[vmid]['status'] for vmid in started}, {'running'})
+
+    # running guests are skipped
+    self.assertEqual(len(self.actions.start_guests(vmids=[101, 102]).results), 1)
+
+    summary = self.actions.shutdown_guests(tags=['app'])
+    self.assertEqual(summary.succeeded, 6)
+    stopped = self.tasks('vzshutdown')
+    self.assertLess(stopped[103]['started'], stopped[101]['started'])
+    self.assertTrue(all(stopped[vmid]['started'] < stopped[103]['started'] for vmid in (105, 107, 109, 111)))
+
+  def test_failure_skips_later_groups(self):
+    # 101 vanishes after the snapshot was taken, starting it fails
+    self.actions.snapshot.refresh()
+    self.cluster.guests.pop(101)
+    summary = self.actions.start_guests(vmids=[101, 103, 104])
+    self.assertEqual(summary.failed, 3)
+    self.assertNotIn(103, self.tasks('vzstart'))
+    self.assertTrue(summary.results[-1].error.startswith('skipped'))
+
+  def test_evacuate_node(self):
+    for vmid in (100, 103):
+      self.cluster.guests[vmid]['status'] = 'running'
+    on_node1 = sorted(vm['vmid'] for vm in self.actions.select_guests(node='node1') if vm['type'] == 'lxc')
+    summary = self.actions.evacuate_node('node1', 'node2', per_node=3)
+    self.assertEqual(summary.succeeded, len(on_node1))
+    self.assertEqual({self.cluster.guests[vmid]['node'] for vmid in on_node1}, {'node2'})
+    # the VM is left on the node, and the drain says so
+    self.assertEqual([vm['vmid'] for vm in self.actions.select_guests(node='node1')], [800])
+    self.assertEqual(summary.failed, 1)
+    self.assertEqual((summary.results[0].vmid, summary.results[0].error), (800, 'qemu guests are not supported'))
+    self.assertEqual(self.cluster.guests[800]['node'], 'node1')
+    self.assertNotIn(800, self.tasks('vzmigrate'))
+
+    # running containers can not be moved without a restart
+    self.cluster.guests[100]['status'] = 'running'
+    summary = self.actions.migrate_guests('node3', vmids=[100], restart=False)
+    self.assertEqual(summary.failed, 1)
+    self.assertIn('live migration', summary.results[0].error)
+
+
+if __name__ == '__main__':
+  unittest.main()
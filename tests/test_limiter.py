@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+from proximate_utils.limiter import AimdLimit, ApiLimiter, TokenBucket, node_of
+
+
+class TokenBucketTest(unittest.TestCase):
+
+  def test_reserve(self):
+    bucket = TokenBucket(rate=10, burst=2)
+    self.assertEqual(bucket.reserve(), 0.0)
+    self.assertEqual(bucket.reserve(), 0.0)
+    self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+    self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+
+
+class AimdLimitTest(unittest.TestCase):
+
+  def test_additive_increase_multiplicative_decrease(self):
+    limit = AimdLimit(initial=2, minimum=1, maximum=3, target_latency=0.5, backoff=0.5)
+    limit.acquire()
+    limit.acquire()
+    with self.assertRaises(TimeoutError):
+      limit.acquire(timeout=0.01)
+    limit.release(0.01)
+    self.assertEqual(limit.limit, 2.5)
+    limit.release(0.01)
+    limit.acquire()
+    limit.release(1.0)
+    self.assertAlmostEqual(limit.limit, 1.45)
+    # a second slow call in the same window does not back off again
+    limit.acquire()
+    limit.release(0.0, overload=True)
+    self.assertAlmostEqual(limit.limit, 1.45)
+    stats = limit.stats()
+    self.assertEqual((stats['inflight'], stats['acquired'], stats['overloads'], stats['max_waiting']), (0, 4, 2, 1))
+
+  def test_acquire_async(self):
+    limit = AimdLimit(initial=1, maximum=1)
+
+    async def run():
+      await limit.acquire_async()
+      waiter = asyncio.ensure_future(limit.acquire_async())
+      await asyncio.sleep(0.01)
+      self.assertEqual(limit.waiting, 1)
+      limit.release(0.0)
+      await asyncio.wait_for(waiter, 1)
+      with self.assertRaises(TimeoutError):
+        await limit.acquire_async(timeout=0.01)
+
+    asyncio.run(run())
+    self.assertEqual((limit.inflight, limit.waiting), (1, 0))
+
+
+class ApiLimiterTest(unittest.TestCase):
+
+  def setUp(self):
+    self.active = {}
+    self.peak = {}
+    self.lock = threading.Lock()
+
+  def request(self, method, url, status=200, duration=0.02, **kwargs):
+    node = node_of(url)
+    with self.lock:
+      self.active[node] = self.active.get(node, 0) + 1
+      self.peak[node] = max(self.peak.get(node, 0), self.active[node])
+    time.sleep(duration)
+    with self.lock:
+      self.active[node] -= 1
+    return MagicMock(status_code=status)
+
+  def test_node_of(self):
+    self.assertEqual(node_of('https://pve:8006/api2/json/nodes/node1/lxc/100/config'), 'node1')
+    self.assertIsNone(node_of('https://pve:8006/api2/json/nodes'))
+    self.assertIsNone(node_of('https://pve:8006/api2/json/cluster/resources'))
+
+  def test_per_node_concurrency(self):
+    limiter = ApiLimiter(concurrency=3, max_concurrency=3, node_concurrency=2, node_max_concurrency=2)
+    urls = ['https://pve/api2/json/nodes/node%d/status' % (i % 2 + 1) for i in range(12)]
+    with ThreadPoolExecutor(12) as pool:
+      list(pool.map(lambda url: limiter(self.request, 'GET', url), urls))
+    self.assertLessEqual(max(self.peak.values()), 2)
+    stats = limiter.stats()
+    self.assertEqual(set(stats), {'cluster', 'node1', 'node2'})
+    self.assertEqual(stats['cluster']['acquired'], 12)
+    self.assertGreater(stats['node1']['max_waiting'], 0)
+    self.assertGreater(stats['cluster']['wait_max'], 0)
+    self.assertEqual(limiter.queue_depth, 0)
+
+  def test_overload_backs_off(self):
+    limiter = ApiLimiter(node_concurrency=8)
+    limiter(self.request, 'GET', 'https://pve/api2/json/nodes/node1/status', status=503)
+    self.assertLess(limiter.stats()['node1']['limit'], 8)
+    self.assertEqual(limiter.stats()['node1']['overloads'], 1)
+    self.assertEqual(limiter.stats()['cluster']['overloads'], 1)
+    # application errors are not overload
+    limiter(self.request, 'GET', 'https://pve/api2/json/nodes/node3/lxc/999/config', status=500)
+    self.assertEqual(limiter.stats()['node3']['overloads'], 0)
+
+    def broken(method, url, **kwargs):
+      raise ConnectionError('unreachable')
+
+    with self.assertRaises(ConnectionError):
+      limiter(broken, 'GET', 'https://pve/api2/json/nodes/node2/status')
+    self.assertEqual(limiter.stats()['node2']['inflight'], 0)
+
+  def test_rate(self):
+    limiter = ApiLimiter(rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+      limiter(self.request, 'GET', 'https://pve/api2/json/version', duration=0)
+    self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+  def test_timeout(self):
+    limiter = ApiLimiter(concurrency=1, max_concurrency=1, timeout=0.01)
+    scopes = limiter.acquire('https://pve/api2/json/nodes/node1/status')
+    with self.assertRaises(TimeoutError):
+      limiter.acquire('https://pve/api2/json/nodes/node2/status')
+    # the node slot taken before the cluster wide wait timed out is given back without counting as a call
+    self.assertEqual(limiter.stats()['node2']['inflight'], 0)
+    self.assertEqual(limiter.stats()['node2']['limit'], 8)
+    limiter.release(scopes, 0.0)
+
+
+if __name__ == '__main__':
+  unittest.main()
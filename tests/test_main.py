@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import proximate_utils
+from proximate_utils.main import ProximateUtils
+
+HEAVY_MODULES = ('pykeepass', 'trapper_keeper', 'proxmoxer', 'requests', 'xdg_base_dirs', 'Cryptodome')
+
+
+class ProximateUtilsTest(unittest.TestCase):
+
+  def test_import_is_light(self):
+    src = str(Path(proximate_utils.__file__).parents[1])
+    env = dict(os.environ, PYTHONPATH=src)
+    code = 'import sys, proximate_utils.main; print(",".join(m for m in %r if m in sys.modules))' % (HEAVY_MODULES,)
+    output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True).stdout
+    self.assertEqual(output.strip(), '')
+
+  def test_default_paths(self):
+    self.assertTrue(str(ProximateUtils.db).endswith('proxmox/proxmox_secrets.kdbx'))
+    utils = ProximateUtils(db='/tmp/other.kdbx')
+    self.assertEqual(utils.db, Path('/tmp/other.kdbx'))
+    self.assertEqual(utils.key, ProximateUtils.key)
+    self.assertTrue(str(utils.kv_db).endswith('proxmox/proxmox.sqlite'))
+
+  @patch('proximate_utils.session.connect')
+  @patch.object(ProximateUtils, '_get_api_secrets')
+  @patch.object(ProximateUtils, '_open_store')
+  def test_lazy_components(self, mock_open_store, mock_get_api_secrets, mock_connect):
+    mock_get_api_secrets.return_value = MagicMock(url='https://pve:8006', username='root@pam', password='secret')
+    mock_connect.return_value.cluster.nextid.get.return_value = 200
+    utils = ProximateUtils()
+    mock_open_store.assert_not_called()
+
+    self.assertEqual(utils.info.get_nextvmid(), 200)
+    mock_open_store.assert_called_once()
+    mock_connect.assert_called_once()
+    self.assertEqual(mock_connect.call_args.args, ('https://pve:8006',))
+    self.assertNotIn('actions', utils.__dict__)
+    self.assertIs(utils.info.proxmox, utils.proxmox)
+    self.assertIsNotNone(utils.single_flight)
+
+
+if __name__ == '__main__':
+  unittest.main()
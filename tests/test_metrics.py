@@ -0,0 +1,70 @@
+import json
+import unittest
+from unittest.mock import MagicMock
+
+from proximate_utils.info import Info
+from proximate_utils.metrics import ApiMetrics, endpoint
+
+from tests.fake_pve import FakeCluster, FakePVEServer
+
+
+class ApiMetricsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.metrics = ApiMetrics(slow_threshold=None, buckets=(0.1, 1.0))
+
+  def test_endpoint(self):
+    self.assertEqual(endpoint('https://pve:8006/api2/json/nodes/node1/lxc/100/config'), '/nodes/{node}/lxc/{vmid}/config')
+    self.assertEqual(endpoint('/api2/json/nodes/node1/tasks/UPID:node1:1:2:3:vzcreate:100:root@pam:/status'),
+                     '/nodes/{node}/tasks/{upid}/status')
+    self.assertEqual(endpoint('/nodes/storage/storage/local/content'), '/nodes/{node}/storage/{storage}/content')
+    self.assertEqual(endpoint('/cluster/resources'), '/cluster/resources')
+
+  def test_observe_and_query(self):
+    self.metrics.observe('GET', '/api2/json/nodes/node1/status', 0.05, status=200, response_bytes=100)
+    self.metrics.observe('get', '/api2/json/nodes/node2/status', 0.5, status=500, response_bytes=10)
+    self.metrics.observe('POST', '/api2/json/nodes/node1/lxc', 2.0, error=Exception('boom'), request_bytes=42)
+    stats = self.metrics.stats(path='/nodes/node9/status')
+    self.assertEqual(list(stats), ['GET /nodes/{node}/status'])
+    self.assertEqual(stats['GET /nodes/{node}/status']['calls'], 2)
+    self.assertEqual(stats['GET /nodes/{node}/status']['errors'], 1)
+    self.assertEqual(stats['GET /nodes/{node}/status']['response_bytes'], 110)
+    self.assertEqual(stats['GET /nodes/{node}/status']['latency']['buckets'], {'0.1': 1, '1.0': 1, '+Inf': 0})
+    self.assertEqual(self.metrics.stats(method='POST')['POST /nodes/{node}/lxc']['request_bytes'], 42)
+    self.assertEqual(json.loads(self.metrics.to_json())['POST /nodes/{node}/lxc']['errors'], 1)
+
+  def test_prometheus(self):
+    self.metrics.observe('GET', '/cluster/resources', 0.05, status=200)
+    self.metrics.observe('GET', '/cluster/resources', 0.5, status=200)
+    text = self.metrics.to_prometheus()
+    self.assertIn('proximate_api_calls_total{method="GET",endpoint="/cluster/resources"} 2', text)
+    self.assertIn('proximate_api_latency_seconds_bucket{method="GET",endpoint="/cluster/resources",le="0.1"} 1', text)
+    self.assertIn('proximate_api_latency_seconds_bucket{method="GET",endpoint="/cluster/resources",le="+Inf"} 2', text)
+    self.assertIn('# TYPE proximate_api_latency_seconds histogram', text)
+
+  def test_slow_call_log(self):
+    metrics = ApiMetrics(slow_threshold=0.25)
+    with self.assertLogs('ApiMetrics', level='WARNING') as logs:
+      metrics.observe('GET', '/version', 0.3, status=200)
+    self.assertIn('/version', logs.output[0])
+
+  def test_layer_records_errors(self):
+    request = MagicMock(side_effect=ConnectionError('down'))
+    with self.assertRaises(ConnectionError):
+      self.metrics(request, 'GET', 'https://pve/api2/json/version', params={})
+    self.assertEqual(self.metrics.stats()['GET /version']['errors'], 1)
+
+  def test_layer_on_session(self):
+    with FakePVEServer(FakeCluster(nodes=2, guests=5)) as server:
+      info = Info(server.connect(layers=[self.metrics]))
+      info.get_nodes()
+      info.get_vm(101)
+      info.get_pool('missing')
+    stats = self.metrics.stats()
+    self.assertEqual(stats['GET /nodes']['calls'], 1)
+    self.assertGreater(stats['GET /cluster/resources']['response_bytes'], 0)
+    self.assertEqual(stats['GET /pools/{poolid}']['errors'], 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
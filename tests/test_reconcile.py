@@ -0,0 +1,123 @@
+import unittest
+
+from proximate_utils.actions import Actions
+from proximate_utils.info import Info
+from proximate_utils.reconcile import CLONE, CONFIG, CREATE, Reconciler, spec_digest, split_tags
+
+from tests.fake_pve import FakeCluster, FakePVEServer
+
+
+class ReconcilerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cluster = FakeCluster(nodes=2, guests=6, task_duration=0.02)
+    self.cluster._add_guest(9000, 'node1', 'debian-template', template=1)
+    self.server = FakePVEServer(self.cluster).start()
+    proxmox = self.server.connect()
+    self.reconciler = Reconciler(Actions(proxmox, Info(proxmox)))
+
+  def tearDown(self):
+    self.server.stop()
+
+  def test_plan_offline(self):
+    vms = [
+      {'vmid': 100, 'name': 'web', 'node': 'node1', 'maxcpu': 2, 'maxmem': 512 * 1024 * 1024},
+      {'vmid': 101, 'name': 'db', 'node': 'node2', 'maxcpu': 1, 'maxmem': 512 * 1024 * 1024},
+      {'vmid': 102, 'name': 'dup', 'node': 'node1'},
+      {'vmid': 103, 'name': 'dup', 'node': 'node2'},
+    ]
+    db = {'name': 'db', 'node': 'node2', 'cores': 1}
+    vms[1]['tags'] = 'prod;' + spec_digest(db)
+    specs = [
+      {'name': 'web', 'node': 'node1', 'cores': 4, 'memory': 512, 'netif': {'net0': 'name=eth0,bridge=vmbr0'}},
+      db,
+      {'name': 'dup', 'node': 'node1'},
+      {'name': 'cache', 'node': 'node2', 'clone': 9000, 'memory': 1024, 'tags': ['ci']},
+      {'name': 'new', 'node': 'node1', 'ostemplate': 'local:vztmpl/debian.tar.zst', 'storage': 'local', 'cores': 2},
+    ]
+    requests = self.cluster.requests
+    plan = self.reconciler.plan(specs, vms)
+    self.assertEqual(self.cluster.requests, requests)
+
+    self.assertEqual([op.action for op in plan.operations], [CLONE, CREATE, CONFIG, CONFIG])
+    self.assertEqual(plan.unchanged, ['db'])
+    self.assertEqual(len(plan.warnings), 1)
+    clone, create, web, cache = plan.operations
+    # vmids are allocated from the snapshot
+    self.assertEqual((clone.vmid, create.vmid), (104, 105))
+    self.assertEqual(clone.params['clone'], 9000)
+    self.assertEqual(cache.vmid, 104)
+    self.assertEqual(cache.params['memory'], 1024)
+    self.assertIn('ci', split_tags(cache.params['tags']))
+    self.assertEqual(create.params['hostname'], 'new')
+    # memory matches, cores and the netif the snapshot does not show are sent
+    self.assertEqual(set(web.params), {'cores', 'net0', 'tags'})
+    self.assertTrue(str(plan).endswith('1 to create, 1 to clone, 2 to configure, 1 unchanged'))
+
+  def test_drift_and_vms(self):
+    db = {'name': 'db', 'node': 'node2', 'cores': 4, 'netif': {'net0': 'name=eth0,bridge=vmbr0'}}
+    vms = [
+      # resized out of band, the digest tag is still in place
+      {'vmid': 101, 'name': 'db', 'node': 'node2', 'type': 'lxc', 'maxcpu': 1, 'tags': spec_digest(db)},
+      {'vmid': 102, 'name': 'web', 'node': 'node1', 'type': 'qemu'},
+    ]
+    specs = [db, {'name': 'web', 'node': 'node1', 'cores': 2}, {'name': 'x', 'node': 'node1', 'vmid': 102}]
+    plan = self.reconciler.plan(specs, vms)
+    config, create = plan.operations[1], plan.operations[0]
+    # only the resource field is restored, the options behind the digest are not re-applied
+    self.assertEqual((config.vmid, config.params), (101, {'cores': 4}))
+    # a VM of the same name is not a match
+    self.assertEqual((create.action, create.name, create.vmid), (CREATE, 'web', 100))
+    self.assertEqual(plan.warnings, ['x: 102 is a qemu guest, skipped'])
+
+  def test_apply_and_converge(self):
+    specs = [
+      {'name': 'ct101', 'node': 'node2', 'cores': 2, 'memory': 1024, 'tags': ['db']},
+      {'name': 'cache', 'node': 'node1', 'clone': 9000, 'cores': 2, 'mounts': {'mp0': 'storage1:8,mp=/data'}},
+      {'name': 'fresh', 'node': 'node2', 'ostemplate': 'storage1:vztmpl/debian.tar.zst', 'storage': 'storage1',
+       'disk': 'storage1:8', 'memory': 256},
+    ]
+    summary = self.reconciler.reconcile(specs)
+    self.assertEqual((summary.succeeded, summary.failed), (4, 0))
+
+    cache = next(vmid for vmid, guest in self.cluster.guests.items() if guest['name'] == 'cache')
+    self.assertEqual(self.cluster.configs[cache]['mp0'], 'storage1:8,mp=/data')
+    self.assertEqual(self.cluster.guests[cache]['maxcpu'], 2)
+    self.assertEqual(self.cluster.guests[101]['maxmem'], 1024 * 1024 * 1024)
+
+    requests = self.cluster.requests
+    plan = self.reconciler.plan(specs)
+    self.assertTrue(plan.empty, str(plan))
+    self.assertEqual(self.cluster.requests, requests + 1)
+
+    specs[1]['mounts'] = {'mp0': 'storage1:16,mp=/data'}
+    plan = self.reconciler.plan(specs)
+    self.assertEqual([(op.action, op.vmid) for op in plan.operations], [(CONFIG, cache)])
+    self.assertEqual(plan.operations[0].params['mp0'], 'storage1:16,mp=/data')
+
+  def test_failed_clone_skips_config(self):
+    plan = self.reconciler.plan([{'name': 'broken', 'node': 'node1', 'clone': 100, 'cores': 2}])
+    summary = self.reconciler.apply(plan)
+    # 100 is not a template and no storage is given
+    self.assertEqual(summary.failed, 2)
+    self.assertTrue(summary.results[-1].error.startswith('skipped'))
+
+  def test_noop_is_a_single_read(self):
+    cluster = FakeCluster(nodes=3, guests=500, task_duration=0.01)
+    with FakePVEServer(cluster) as server:
+      proxmox = server.connect()
+      reconciler = Reconciler(Actions(proxmox, Info(proxmox)))
+      specs = [{'name': 'ct%d' % vmid, 'node': guest['node'], 'cores': 1, 'memory': 512, 'tags': ['fleet']}
+               for vmid, guest in cluster.guests.items()]
+      summary = reconciler.reconcile(specs, max_workers=16, per_node=8)
+      self.assertEqual((summary.succeeded, summary.failed), (500, 0))
+
+      requests = cluster.requests
+      plan = reconciler.plan(specs)
+      self.assertEqual(len(plan.unchanged), 500)
+      self.assertTrue(plan.empty)
+      self.assertEqual(cluster.requests, requests + 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
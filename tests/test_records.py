@@ -0,0 +1,108 @@
+import copy
+import json
+import pickle
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+from proximate_utils.daemon import encode
+from proximate_utils import records
+from proximate_utils.main import ProximateUtils
+from proximate_utils.records import ApiSecret, Guest, Node, Volume
+from proximate_utils.resources import normalize_volume
+from proximate_utils.snapshot import ResourceSnapshot
+
+VM = {'vmid': 100, 'name': 'web', 'node': 'node1', 'type': 'lxc', 'status': 'running', 'maxmem': 536870912, 'cpu': 0.01,
+      'maxcpu': 2, 'disk': 0, 'maxdisk': 8589934592, 'mem': 1024, 'uptime': 60, 'netin': 1, 'netout': 2, 'diskread': 3,
+      'diskwrite': 4, 'id': 'lxc/100', 'template': 0, 'tags': 'prod'}
+
+
+class RecordTest(unittest.TestCase):
+
+  def test_reads_like_the_payload(self):
+    vm = Guest.from_payload(dict(VM, vgpu='none'))
+    self.assertEqual(vm['vmid'], 100)
+    self.assertEqual(vm.name, 'web')
+    self.assertIsNone(vm.pool)
+    self.assertIsNone(vm.get('pool'))
+    self.assertEqual(vm.get('pool', 'none'), 'none')
+    self.assertNotIn('pool', vm)
+    self.assertRaises(KeyError, lambda: vm['pool'])
+    self.assertEqual(vm['vgpu'], 'none')
+    self.assertEqual(vm.extra, {'vgpu': 'none'})
+    self.assertEqual(vm, dict(VM, vgpu='none'))
+    self.assertEqual(dict(vm), dict(VM, vgpu='none'))
+    self.assertEqual(json.loads(json.dumps(vm, default=encode)), dict(VM, vgpu='none'))
+    self.assertEqual(dict(vm.replace(status='stopped'))['status'], 'stopped')
+    self.assertEqual(vm.as_dict(), dict(vm))
+    self.assertEqual(Guest(**VM), Guest.from_payload(VM))
+
+  def test_immutable(self):
+    vm = Guest(vmid=100, name='web')
+    with self.assertRaises(AttributeError):
+      vm.name = 'db'
+    with self.assertRaises(TypeError):
+      vm['name'] = 'db'
+    with self.assertRaises(AttributeError):
+      vm.uptime_seconds = 1
+
+  def test_copy_and_pickle(self):
+    vm = Guest.from_payload(dict(VM, vgpu='none'))
+    self.assertEqual(pickle.loads(pickle.dumps(vm)), vm)
+    self.assertEqual(copy.deepcopy(vm), vm)
+    self.assertIsInstance(copy.deepcopy(vm), Guest)
+
+  def test_bulk_constructor(self):
+    payloads = [dict(VM, vmid=vmid, node='node%d' % (vmid % 3), status=''.join(['run', 'ning'])) for vmid in range(100)]
+    vms = Guest.from_payloads(payloads)
+    self.assertEqual([vm.vmid for vm in vms], list(range(100)))
+    # low-cardinality strings are shared between records
+    self.assertIs(vms[0].status, vms[1].status)
+    self.assertNotIn('tags', Guest.interned)
+    self.assertIs(Guest.from_payloads(vms)[5], vms[5])
+    self.assertEqual(Node.from_payloads(None), [])
+
+  def test_intern_table_is_bounded(self):
+    strings = records._intern.__self__
+    with patch.object(type(strings), 'limit', len(strings)):
+      vm = Guest.from_payload(dict(VM, node='node-unseen'))
+    self.assertEqual(vm.node, 'node-unseen')
+    self.assertNotIn('node-unseen', strings)
+
+  def test_smaller_than_a_dict(self):
+    payload = json.loads(json.dumps(VM))
+    vm = Guest.from_payload(payload)
+    self.assertLess((sys.getsizeof(vm) + sys.getsizeof(vm._values)) * 3, sys.getsizeof(payload) * 2)
+
+  def test_volume_fields_always_present(self):
+    volume = normalize_volume('node1', 'local', {'volid': 'local:backup/a.tar', 'content': 'backup', 'vmid': '100'})
+    self.assertIsInstance(volume, Volume)
+    self.assertEqual(volume['vmid'], 100)
+    self.assertIn('notes', volume)
+    self.assertIsNone(volume['notes'])
+    self.assertEqual(len(volume), len(Volume.fields))
+
+  def test_snapshot_holds_records(self):
+    proxmox = MagicMock()
+    proxmox.cluster.resources.get.return_value = [VM]
+    snapshot = ResourceSnapshot(proxmox)
+    self.assertIsInstance(snapshot.by_vmid(100), Guest)
+    self.assertEqual(snapshot.by_name('web'), [VM])
+
+
+class ApiSecretTest(unittest.TestCase):
+
+  def test_detached_from_entry(self):
+    entry = MagicMock(title='proxmox_api', url='https://pve:8006', username='root@pam', password='secret')
+    db = MagicMock()
+    db.find_groups.return_value.entries = [MagicMock(title='other'), entry]
+    secrets = ProximateUtils._get_api_secrets(db)
+    self.assertEqual(secrets, ApiSecret('proxmox_api', 'https://pve:8006', 'root@pam', 'secret'))
+    self.assertNotIn('secret', repr(secrets))
+    with self.assertRaises(AttributeError):
+      secrets.password = 'other'
+    self.assertFalse(hasattr(secrets, '__dict__'))
+
+
+if __name__ == '__main__':
+  unittest.main()
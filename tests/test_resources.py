@@ -1,7 +1,7 @@
 import unittest
 from unittest.mock import patch
 
-from proximate_utils.resources import Resources
+from proximate_utils.resources import Resources, storage_pairs
 
 
 class ResourcesTest(unittest.TestCase):
@@ -22,6 +22,20 @@ class ResourcesTest(unittest.TestCase):
     nodes = self.resources.get_nodes()
     self.assertIsNone(nodes)
 
+  def test_get_cluster_health(self):
+    self.mock_proxmox.nodes.get.return_value = [{'node': 'node1'}, {'node': 'node2', 'status': 'offline'}]
+    self.mock_proxmox.nodes.return_value.status.get.return_value = {'memory': {'used': 1, 'total': 2}}
+    self.mock_proxmox.nodes.return_value.subscription.get.side_effect = Exception("Test Error")
+    summary = self.resources.get_cluster_health()
+    self.assertEqual(summary.nodes[0].memory_ratio, 0.5)
+    self.assertEqual(summary.nodes[0].errors, {'subscription': 'Test Error'})
+    self.assertEqual(summary.nodes[1].errors, {})
+    self.assertEqual(len(summary.degraded), 2)
+
+  def test_get_cluster_health_error(self):
+    self.mock_proxmox.nodes.get.side_effect = Exception("Test Error")
+    self.assertIsNone(self.resources.get_cluster_health())
+
   def test_get_node(self):
     mock_nodes = [{'node': 'node1'}, {'node': 'node2'}]
     self.mock_proxmox.nodes.get.return_value = mock_nodes
@@ -62,6 +76,17 @@ class ResourcesTest(unittest.TestCase):
     vm = self.resources.get_vm(100)
     self.assertIsNone(vm)
 
+  def test_get_pools(self):
+    mock_pools = [{'poolid': 'pool1'}]
+    self.mock_proxmox.pools.get.return_value = mock_pools
+    pools = self.resources.get_pools()
+    self.assertEqual(pools, mock_pools)
+
+  def test_get_pools_error(self):
+    self.mock_proxmox.pools.get.side_effect = Exception("Test Error")
+    pools = self.resources.get_pools()
+    self.assertIsNone(pools)
+
   def test_get_pool(self):
     mock_pool = {'poolid': 'pool1'}
     self.mock_proxmox.pools.return_value.get.return_value = mock_pool
@@ -95,6 +120,38 @@ class ResourcesTest(unittest.TestCase):
     content = self.resources.get_storage_content('node1', 'storage1', 'content1', 100)
     self.assertIsNone(content)
 
+  def test_storage_pairs(self):
+    nodes = [
+      {'node': 'node1', 'status': 'online'}, {'node': 'node2', 'status': 'online'}, {'node': 'node3', 'status': 'offline'}]
+    storages = [
+      {'storage': 'local'},
+      {'storage': 'nfs', 'shared': 1},
+      {'storage': 'zfs', 'nodes': 'node2,node3'},
+      {'storage': 'old', 'disable': 1},
+    ]
+    self.assertEqual(
+      storage_pairs(nodes, storages),
+      [('node1', 'local'), ('node2', 'local'), ('node1', 'nfs'), ('node2', 'nfs'), ('node2', 'zfs')])
+    self.assertIn(('node1', 'nfs'), storage_pairs(nodes, storages, shared_once=True))
+    self.assertNotIn(('node2', 'nfs'), storage_pairs(nodes, storages, shared_once=True))
+
+  def test_iter_storage_content(self):
+    self.mock_proxmox.nodes.get.return_value = [{'node': 'node1'}, {'node': 'node2'}]
+    self.mock_proxmox.storage.get.return_value = [{'storage': 'local'}]
+    self.mock_proxmox.nodes.return_value.storage.return_value.content.return_value.get.return_value = [
+      {'volid': 'local:iso/a.iso', 'content': 'iso'},
+      {'volid': 'local:backup/b.tar', 'content': 'backup', 'vmid': '100'},
+    ]
+    records = list(self.resources.iter_storage_content(content=('backup', 'vztmpl')))
+    self.assertEqual(sorted(record['node'] for record in records), ['node1', 'node2'])
+    self.assertEqual(records[0]['vmid'], 100)
+    self.assertEqual(records[0]['storage'], 'local')
+    self.assertIsNone(records[0]['format'])
+
+  def test_iter_storage_content_error(self):
+    self.mock_proxmox.nodes.get.side_effect = Exception("Test Error")
+    self.assertEqual(list(self.resources.iter_storage_content()), [])
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from proximate_utils.session import SessionConfig, connect, host_from_url
+
+
+class SessionTest(unittest.TestCase):
+
+  def test_host_from_url(self):
+    self.assertEqual(host_from_url('https://pve.example.com:8006/'), 'pve.example.com:8006')
+    self.assertEqual(host_from_url('https://pve.example.com'), 'pve.example.com')
+    self.assertEqual(host_from_url('pve.example.com:8006'), 'pve.example.com:8006')
+    self.assertEqual(host_from_url('shpve'), 'shpve')
+
+  def test_connect_configures_pool(self):
+    config = SessionConfig(pool_maxsize=32, retries=5, connect_timeout=2, read_timeout=60)
+    proxmox = connect('https://pve.example.com:8006', config=config, user='root@pam', token_name='ci', token_value='x')
+    session = proxmox._store['session']
+    adapter = session.get_adapter('https://pve.example.com:8006/api2/json')
+    self.assertEqual(adapter._pool_maxsize, 32)
+    self.assertTrue(adapter._pool_block)
+    self.assertEqual(adapter.max_retries.total, 5)
+    self.assertNotIn('POST', adapter.max_retries.allowed_methods)
+    self.assertEqual(session.headers['Connection'], 'keep-alive')
+    self.assertEqual(session.auth.timeout, (2, 60))
+    self.assertEqual(proxmox._store['base_url'], 'https://pve.example.com:8006/api2/json')
+
+  def test_connect_without_keep_alive(self):
+    proxmox = connect('pve', config=SessionConfig(keep_alive=False), user='root@pam', token_name='ci', token_value='x')
+    self.assertEqual(proxmox._store['session'].headers['Connection'], 'close')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import patch
+
+from proximate_utils.info import Info
+from proximate_utils.resources import Resources
+from proximate_utils.snapshot import ResourceSnapshot
+
+
+class ResourceSnapshotTest(unittest.TestCase):
+
+  @patch('proxmoxer.ProxmoxAPI')
+  def setUp(self, mock_proxmox):
+    self.mock_proxmox = mock_proxmox
+    self.mock_proxmox.cluster.resources.get.return_value = [
+      {'vmid': 100, 'name': 'web', 'node': 'node1', 'pool': 'prod'},
+      {'vmid': 101, 'name': 'db', 'node': 'node1'},
+      {'vmid': 102, 'name': 'web', 'node': 'node2', 'pool': 'prod'},
+    ]
+    self.snapshot = ResourceSnapshot(self.mock_proxmox, ttl=60)
+
+  def test_indexes(self):
+    self.assertEqual(self.snapshot.by_vmid('101')['name'], 'db')
+    self.assertIsNone(self.snapshot.by_vmid(999))
+    self.assertEqual([vm['vmid'] for vm in self.snapshot.by_name('web')], [100, 102])
+    self.assertEqual([vm['vmid'] for vm in self.snapshot.by_node('node1')], [100, 101])
+    self.assertEqual([vm['vmid'] for vm in self.snapshot.by_pool('prod')], [100, 102])
+    self.assertEqual(self.mock_proxmox.cluster.resources.get.call_count, 1)
+
+  def test_ttl_expiry(self):
+    self.snapshot.ttl = 0
+    self.snapshot.vms()
+    self.snapshot.vms()
+    self.assertEqual(self.mock_proxmox.cluster.resources.get.call_count, 2)
+
+  def test_invalidate(self):
+    self.snapshot.vms()
+    self.snapshot.invalidate()
+    self.assertTrue(self.snapshot.stale)
+    self.snapshot.vms()
+    self.assertEqual(self.mock_proxmox.cluster.resources.get.call_count, 2)
+
+  def test_shared_between_resources_and_info(self):
+    resources = Resources(self.mock_proxmox, self.snapshot)
+    info = Info(self.mock_proxmox, self.snapshot)
+    self.assertEqual(resources.get_vm(102)['name'], 'web')
+    self.assertEqual(info.get_vmid('db'), 101)
+    self.assertEqual(self.mock_proxmox.cluster.resources.get.call_count, 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
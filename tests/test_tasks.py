@@ -0,0 +1,132 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from proximate_utils.tasks import TaskLogTail, TaskWaiter, new_log_lines, parse_upid
+
+UPID_A = 'UPID:node1:000A1B2C:0123ABCD:65A0B1C2:vzcreate:100:root@pam:'
+UPID_B = 'UPID:node1:000A1B2D:0123ABCE:65A0B1C4:vzcreate:101:root@pam:'
+UPID_C = 'UPID:node2:000A1B2E:0123ABCF:65A0B1C0:vzstart:102:root@pam:'
+
+
+class TaskWaiterTest(unittest.TestCase):
+
+  @patch('proxmoxer.ProxmoxAPI')
+  def setUp(self, mock_proxmox):
+    self.mock_proxmox = mock_proxmox
+    self.waiter = TaskWaiter(self.mock_proxmox, min_interval=0.01, max_interval=0.05)
+    self.tasks = {'node1': [], 'node2': []}
+    self.mock_proxmox.nodes.side_effect = lambda node: self._node(node)
+
+  def _node(self, node):
+    mock_node = MagicMock()
+    mock_node.tasks.get.side_effect = lambda **params: self.tasks[node]
+    return mock_node
+
+  def test_parse_upid(self):
+    upid = parse_upid(UPID_A)
+    self.assertEqual(upid['node'], 'node1')
+    self.assertEqual(upid['starttime'], 0x65A0B1C2)
+    self.assertEqual(upid['type'], 'vzcreate')
+    self.assertEqual(parse_upid(100), {})
+
+  def test_submit_requires_node(self):
+    with self.assertRaises(ValueError):
+      self.waiter.submit(100)
+
+  def test_poll_batches_per_node(self):
+    with patch.object(self.waiter, '_run'):
+      futures = [self.waiter.submit(upid) for upid in (UPID_A, UPID_B, UPID_C)]
+    self.tasks['node1'] = [{'upid': UPID_A, 'endtime': 1, 'status': 'OK'}, {'upid': UPID_B}]
+    self.tasks['node2'] = [{'upid': UPID_C, 'endtime': 1, 'status': 'command failed'}]
+    self.assertEqual(self.waiter.poll(), 2)
+    self.assertEqual(self.mock_proxmox.nodes.call_count, 2)
+    self.assertTrue(TaskWaiter.task_ok(futures[0].result(timeout=0)))
+    self.assertFalse(futures[1].done())
+    self.assertFalse(TaskWaiter.task_ok(futures[2].result(timeout=0)))
+    self.assertEqual(self.waiter.pending, 1)
+
+  def test_wait(self):
+    self.tasks['node1'] = [{'upid': UPID_A, 'endtime': 1, 'status': 'OK'}]
+    self.assertTrue(self.waiter.wait(UPID_A, timeout=5))
+    self.assertEqual(self.waiter.pending, 0)
+
+  def test_wait_timeout(self):
+    self.tasks['node1'] = [{'upid': UPID_A}]
+    self.assertFalse(self.waiter.wait(UPID_A, timeout=0.1))
+    self.assertEqual(self.waiter.pending, 0)
+
+  def test_callback(self):
+    results = []
+    self.tasks['node2'] = [{'upid': UPID_C, 'endtime': 1, 'status': 'OK'}]
+    future = self.waiter.submit(UPID_C, callback=lambda f: results.append(f.result()['exitstatus']))
+    future.result(timeout=5)
+    self.assertEqual(results, ['OK'])
+
+
+class TaskLogTailTest(unittest.TestCase):
+
+  def setUp(self):
+    self.proxmox = MagicMock()
+    self.lines = [{'n': n, 't': 'line %d' % n} for n in range(1, 1201)]
+    self.calls = []
+
+    def get(start, limit):
+      self.calls.append((start, limit))
+      return self.lines[start:start + limit]
+
+    self.proxmox.nodes.return_value.tasks.return_value.log.get.side_effect = get
+    self.waiter = TaskWaiter(self.proxmox, min_interval=0.01, max_interval=0.05)
+
+  def test_new_log_lines(self):
+    self.assertEqual(new_log_lines([{'n': 1, 't': 'a'}, {'n': 2, 't': 'b'}], 1), [{'n': 2, 't': 'b'}])
+    self.assertEqual(new_log_lines(None, 0), [])
+
+  def test_empty_log_placeholder(self):
+    self.lines = []
+    self.proxmox.nodes.return_value.tasks.return_value.log.get.side_effect = lambda start, limit: (
+      self.lines[start:start + limit] or [{'n': 1, 't': 'no content'}])
+    tail = TaskLogTail(self.waiter, UPID_A)
+    self.assertEqual(tail.read(), [])
+    self.assertEqual(tail.offset, 0)
+    self.lines.append({'n': 1, 't': 'line 1'})
+    self.assertEqual(tail.read(), ['line 1'])
+    self.assertEqual(tail.offset, 1)
+
+  def test_read_pages_and_resumes(self):
+    tail = TaskLogTail(self.waiter, UPID_A)
+    lines = tail.read()
+    self.assertEqual(len(lines), 1200)
+    self.assertEqual(self.calls, [(0, 500), (500, 500), (1000, 500)])
+    self.assertEqual(tail.last_line, 'line 1200')
+    # only lines written since the previous read are transferred
+    self.lines.append({'n': 1201, 't': 'TASK OK'})
+    self.assertEqual(tail.read(), ['TASK OK'])
+    self.assertEqual(self.calls[-1], (1200, 500))
+    self.assertEqual(tail.read(), [])
+    self.assertEqual(tail.last_line, 'TASK OK')
+
+  def test_iterate_until_finished(self):
+    self.lines = self.lines[:3]
+    tasks = []
+    self.proxmox.nodes.return_value.tasks.get.side_effect = lambda **params: tasks
+    tail = self.waiter.tail(UPID_A, timeout=5)
+    received = []
+    for line in tail:
+      received.append(line)
+      if len(received) == 3:
+        self.lines.append({'n': 4, 't': 'TASK OK'})
+        tasks.append({'upid': UPID_A, 'endtime': 1, 'status': 'OK'})
+    self.assertEqual(received, ['line 1', 'line 2', 'line 3', 'TASK OK'])
+    self.assertTrue(TaskWaiter.task_ok(tail.status))
+
+  def test_iterate_timeout(self):
+    self.proxmox.nodes.return_value.tasks.get.side_effect = lambda **params: []
+    tail = self.waiter.tail(UPID_A, timeout=0.1)
+    with self.assertRaises(TimeoutError):
+      list(tail)
+    self.assertEqual(tail.last_line, 'line 1200')
+    self.assertEqual(self.waiter.pending, 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,145 @@
+import json
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import requests
+from requests.adapters import BaseAdapter
+
+from proximate_utils.ticket_cache import TicketCache
+
+
+class TicketServer(BaseAdapter):
+  """Stand-in for PVE answering 401 to every ticket but ``ticket``"""
+
+  def __init__(self, ticket):
+    super().__init__()
+    self.ticket = ticket
+    self.cookies = []
+
+  def send(self, request, **kwargs):
+    cookie = request.headers.get('Cookie', '')
+    self.cookies.append(cookie)
+    ok = self.ticket in cookie
+    response = requests.Response()
+    response.request, response.connection, response.url = request, self, request.url
+    response.status_code = 200 if ok else 401
+    response._content = json.dumps({'data': [{'node': 'node1'}] if ok else None}).encode('utf-8')
+    return response
+
+  def close(self):
+    pass
+
+
+def login_response(ticket, status_code=200):
+  response = MagicMock(status_code=status_code)
+  response.json.return_value = {'data': {'ticket': ticket, 'CSRFPreventionToken': 'csrf2'}}
+  return response
+
+
+class TicketCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    tmp = Path(self.tmp.name)
+    self.token = tmp / 'token'
+    self.key = tmp / 'key'
+    self.token.write_text('token-secret')
+    self.key.write_bytes(b'key-secret')
+    self.cache = TicketCache(tmp / 'state' / 'ticket', self.token, self.key)
+    self.entry = {'base_url': 'https://pve:8006/api2/json', 'username': 'root@pam', 'ticket': 'PVE:ticket',
+                  'csrf_token': 'csrf', 'issued': time.time()}
+
+  def tearDown(self):
+    self.tmp.cleanup()
+
+  def test_roundtrip(self):
+    self.assertIsNone(self.cache.load())
+    self.cache.save(self.entry)
+    self.assertEqual(self.cache.load(), self.entry)
+    self.assertNotIn(b'PVE:ticket', self.cache.path.read_bytes())
+    self.assertEqual(self.cache.path.stat().st_mode & 0o777, 0o600)
+
+  def test_expired(self):
+    self.cache.save(dict(self.entry, issued=time.time() - TicketCache.max_age))
+    self.assertIsNone(self.cache.load())
+
+  def test_other_key(self):
+    self.cache.save(self.entry)
+    self.key.write_bytes(b'rotated')
+    self.assertIsNone(self.cache.load())
+
+  def test_tampered(self):
+    self.cache.save(self.entry)
+    blob = bytearray(self.cache.path.read_bytes())
+    blob[-1] ^= 1
+    self.cache.path.write_bytes(bytes(blob))
+    self.assertIsNone(self.cache.load())
+
+  def test_connect_without_ticket_or_password(self):
+    self.assertIsNone(self.cache.connect())
+
+  @patch('proxmoxer.backends.https.requests.post')
+  def test_connect_warm_skips_login(self, mock_post):
+    self.cache.save(self.entry)
+    proxmox = self.cache.connect()
+    mock_post.assert_not_called()
+    self.assertEqual(proxmox.get_tokens(), ('PVE:ticket', 'csrf'))
+    self.assertEqual(proxmox._store['base_url'], 'https://pve:8006/api2/json')
+
+  @patch('proxmoxer.backends.https.requests.post')
+  def test_connect_cold_logs_in_and_saves(self, mock_post):
+    response = MagicMock(status_code=200)
+    response.json.return_value = {'data': {'ticket': 'PVE:fresh', 'CSRFPreventionToken': 'csrf2'}}
+    mock_post.return_value = response
+    proxmox = self.cache.connect('https://pve:8006', user='root@pam', password='secret')
+    self.assertEqual(mock_post.call_args.kwargs['data'], {'username': 'root@pam', 'password': 'secret'})
+    self.assertEqual(proxmox.get_tokens(), ('PVE:fresh', 'csrf2'))
+    self.assertEqual(self.cache.load()['ticket'], 'PVE:fresh')
+
+
+  def connect_to(self, server, **kwargs):
+    proxmox = self.cache.connect(**kwargs)
+    proxmox._store['session'].mount('https://', server)
+    return proxmox
+
+  @patch('proxmoxer.backends.https.requests.post')
+  def test_rejected_ticket_logs_in_again(self, mock_post):
+    # the server restarted and forgot the cached ticket
+    self.cache.save(self.entry)
+    mock_post.return_value = login_response('PVE:fresh')
+    login = MagicMock(return_value='secret')
+    server = TicketServer('PVE:fresh')
+    proxmox = self.connect_to(server, login=login)
+    self.assertEqual(proxmox.nodes.get(), [{'node': 'node1'}])
+    login.assert_called_once_with()
+    self.assertEqual(mock_post.call_args.kwargs['data'], {'username': 'root@pam', 'password': 'secret'})
+    self.assertEqual(self.cache.load()['ticket'], 'PVE:fresh')
+    self.assertEqual(len(server.cookies), 2)
+    self.assertEqual(proxmox.nodes.get(), [{'node': 'node1'}])
+    self.assertEqual((login.call_count, len(server.cookies)), (1, 3))
+
+  def test_rejected_ticket_without_login_is_dropped(self):
+    self.cache.save(self.entry)
+    proxmox = self.connect_to(TicketServer('PVE:fresh'))
+    with self.assertRaises(Exception):
+      proxmox.nodes.get()
+    self.assertIsNone(self.cache.load())
+
+  @patch('proxmoxer.backends.https.requests.post')
+  def test_revoked_ticket_can_not_be_renewed(self, mock_post):
+    # old enough to be renewed, renewing with the revoked ticket fails
+    self.cache.save(dict(self.entry, issued=time.time() - 3700))
+    mock_post.side_effect = [login_response(None, 401), login_response('PVE:fresh')]
+    server = TicketServer('PVE:fresh')
+    proxmox = self.connect_to(server, login=lambda: 'secret')
+    self.assertEqual(proxmox.nodes.get(), [{'node': 'node1'}])
+    self.assertEqual([call.kwargs['data']['password'] for call in mock_post.call_args_list], ['PVE:ticket', 'secret'])
+    self.assertEqual(len(server.cookies), 1)
+    self.assertEqual(self.cache.load()['ticket'], 'PVE:fresh')
+
+
+if __name__ == '__main__':
+  unittest.main()
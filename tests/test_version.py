@@ -0,0 +1,50 @@
+import unittest
+
+from proximate_utils.version import LooseVersion, version_key
+
+
+class VersionKeyTest(unittest.TestCase):
+
+  def test_order(self):
+    versions = ['1:2.0', '8.1.10', '8.1.4-1', '8.1.4', '8.1.4~rc1', '8.1', '2.99.0', '8.1.4+pve1']
+    self.assertEqual(
+      sorted(versions, key=version_key),
+      ['2.99.0', '8.1', '8.1.4~rc1', '8.1.4', '8.1.4-1', '8.1.4+pve1', '8.1.10', '1:2.0'])
+
+  def test_dpkg_order(self):
+    # upstream version before revision, as dpkg --compare-versions orders them
+    self.assertLess(version_key('3.1-5'), version_key('3.1.1-1'))
+    self.assertLess(version_key('7.4-3'), version_key('7.4-15'))
+    self.assertLess(version_key('1.0-1~bpo12'), version_key('1.0-1'))
+    self.assertEqual(version_key('1.0'), version_key('1.0-0'))
+
+  def test_mixed_components(self):
+    # LooseVersion can not compare these (int against str), the keys can, letters sort before other characters
+    self.assertLess(version_key('1.0a'), version_key('1.0.1'))
+    self.assertEqual(max(['3.1.7-pve3', '3.1.7-1'], key=version_key), '3.1.7-pve3')
+
+  def test_cached(self):
+    self.assertIs(version_key('8.1.4'), version_key('8.1.4'))
+    self.assertEqual(version_key('8.1.4'), version_key('8.01.4'))
+
+
+class LooseVersionTest(unittest.TestCase):
+
+  def test_hashable(self):
+    self.assertEqual(len({LooseVersion('8.1'), LooseVersion('8.1'), LooseVersion('8.2')}), 2)
+    self.assertEqual(LooseVersion('8.1'), LooseVersion('8.01'))
+    self.assertEqual(hash(LooseVersion('8.1')), hash(LooseVersion('8.01')))
+
+  def test_compare_with_str(self):
+    self.assertTrue(LooseVersion('8.1.4') > '8.1.3')
+    # strings are parsed for equality as for ordering
+    self.assertTrue(LooseVersion('8.1.4') == '8.1.4')
+    self.assertTrue(LooseVersion('6.5') == '6.05')
+    self.assertTrue(LooseVersion('6.5') != '6.6')
+    self.assertFalse(LooseVersion('6.5') == 6.5)
+    self.assertTrue(LooseVersion('8.1.4') <= '8.1.4')
+    self.assertEqual(sorted([LooseVersion('6.3'), LooseVersion('4.2')])[0].vstring, '4.2')
+
+
+if __name__ == '__main__':
+  unittest.main()
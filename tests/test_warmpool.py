@@ -0,0 +1,119 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from proxmoxer.core import ProxmoxResource, ResourceException
+
+from proximate_utils.actions import Actions
+from proximate_utils.info import Info
+from proximate_utils.warmpool import WarmPool
+
+from tests.fake_pve import FakeCluster, FakePVEServer
+
+
+class WarmPoolTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cluster = FakeCluster(nodes=2, guests=4, task_duration=0.02)
+    self.cluster._add_guest(9000, 'node1', 'debian-template', template=1)
+    self.server = FakePVEServer(self.cluster).start()
+    proxmox = self.server.connect()
+    self.actions = Actions(proxmox, Info(proxmox))
+    self.pool = WarmPool(self.actions, 9000, 'node1', size=2)
+    self.pool.retry_interval = 0.05
+
+  def tearDown(self):
+    self.pool.close()
+    self.server.stop()
+
+  def wait_ready(self, count):
+    deadline = time.monotonic() + 5
+    while self.pool.ready < count and time.monotonic() < deadline:
+      time.sleep(0.01)
+    self.assertEqual(self.pool.ready, count)
+
+  def test_fill_and_acquire(self):
+    self.pool.start()
+    self.wait_ready(2)
+    members = [vmid for vmid, guest in self.cluster.guests.items() if guest['name'].startswith('warm-9000-')]
+    self.assertEqual(len(members), 2)
+    clone_tasks = [task for task in self.cluster.tasks.values() if task['type'] == 'vzclone']
+    self.assertTrue(all(task['duration'] == self.cluster.task_duration for task in clone_tasks))
+
+    vmid = self.pool.acquire(config={'hostname': 'ci-runner', 'cores': 4}, start=True)
+    self.assertIn(vmid, members)
+    self.assertEqual(self.cluster.guests[vmid]['name'], 'ci-runner')
+    self.assertEqual(self.cluster.guests[vmid]['status'], 'running')
+    self.assertEqual(self.cluster.configs[vmid]['cores'], '4')
+    # the pool refills in the background
+    self.wait_ready(2)
+
+  def test_adopt_existing(self):
+    self.cluster._add_guest(500, 'node1', 'warm-9000-500')
+    self.cluster._add_guest(501, 'node1', 'warm-9000-501')
+    self.cluster.guests[501]['status'] = 'running'
+    self.assertEqual(self.pool.adopt(), [500])
+    self.assertEqual(self.pool.acquire(timeout=1), 500)
+    # handed out containers lose the pool hostname and are not adopted again
+    self.assertEqual(self.cluster.guests[500]['name'], 'CT500')
+    self.pool.close()
+    self.actions.snapshot.invalidate()
+    self.assertNotIn(500, WarmPool(self.actions, 9000, 'node1').adopt())
+
+  def failing(self, method, suffix):
+    original = getattr(ProxmoxResource, method)
+
+    def request(resource, *args, **kwargs):
+      if resource._store['base_url'].endswith(suffix):
+        raise ResourceException(500, 'Internal Server Error', 'failed')
+      return original(resource, *args, **kwargs)
+
+    return patch.object(ProxmoxResource, method, request)
+
+  def test_failed_config_goes_back_into_the_pool(self):
+    self.cluster._add_guest(500, 'node1', 'warm-9000-500')
+    self.pool.adopt()
+    with self.failing('put', '/lxc/500/config'), self.assertLogs('WarmPool', level='ERROR'):
+      self.assertIsNone(self.pool.acquire(config={'cores': 2}, timeout=1))
+    self.assertEqual(self.pool.acquire(timeout=1), 500)
+
+  def test_failed_start_is_destroyed(self):
+    self.cluster._add_guest(500, 'node1', 'warm-9000-500')
+    self.pool.adopt()
+    with self.failing('post', '/lxc/500/status/start'), self.assertLogs('WarmPool', level='ERROR'):
+      self.assertIsNone(self.pool.acquire(start=True, timeout=1))
+    self.assertNotIn(500, self.cluster.guests)
+
+  def test_refill_survives_clone_errors(self):
+    create_instance = self.actions.create_instance
+    calls = []
+
+    def flaky(**kwargs):
+      calls.append(kwargs['vmid'])
+      if len(calls) == 1:
+        raise ResourceException(500, 'Internal Server Error', 'CT %d already exists' % kwargs['vmid'])
+      return create_instance(**kwargs)
+
+    with patch.object(self.actions, 'create_instance', flaky), self.assertLogs('WarmPool', level='ERROR'):
+      self.pool.start()
+      self.wait_ready(2)
+    self.assertGreater(len(calls), 2)
+
+  def test_drain(self):
+    self.pool.start()
+    self.wait_ready(2)
+    destroyed = self.pool.drain(timeout=5)
+    self.assertEqual(len(destroyed), 2)
+    self.assertFalse(any(guest['name'].startswith('warm-9000-') for guest in self.cluster.guests.values()))
+
+  def test_acquire_timeout(self):
+    pool = WarmPool(self.actions, 12345, 'node1', size=1)
+    pool.retry_interval = 1
+    try:
+      self.assertIsNone(pool.acquire(timeout=0.1))
+    finally:
+      pool.close()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,67 @@
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from proximate_utils.resources import Resources
+from proximate_utils.watch import ADDED, CONFIG, MIGRATED, REMOVED, STATUS, diff, watch_resources
+
+
+def guest(vmid, **fields):
+  return dict({'vmid': vmid, 'name': 'ct%d' % vmid, 'node': 'node1', 'status': 'running', 'maxmem': 512, 'cpu': 0.1}, **fields)
+
+
+class WatchTest(unittest.TestCase):
+
+  def test_diff(self):
+    old = {100: guest(100), 101: guest(101), 102: guest(102), 103: guest(103)}
+    new = {
+      100: guest(100, cpu=0.9),
+      101: guest(101, node='node2', status='stopped'),
+      103: guest(103, maxmem=1024),
+      104: guest(104),
+    }
+    events = diff(old, new)
+    self.assertEqual(
+      [(event.kind, event.vmid) for event in events],
+      [(MIGRATED, 101), (STATUS, 101), (REMOVED, 102), (CONFIG, 103), (ADDED, 104)])
+    self.assertEqual(events[0].changes, {'node': ('node1', 'node2')})
+    self.assertEqual(events[3].changes, {'maxmem': (512, 1024)})
+    self.assertEqual(events[2].node, 'node1')
+
+  def test_watch_resources(self):
+    polls = [
+      [guest(100)],
+      [guest(100)],
+      Exception('unreachable'),
+      [guest(100, status='stopped'), guest(101)],
+      [guest(101)],
+    ]
+    stop = threading.Event()
+
+    def fetch():
+      poll = polls.pop(0)
+      if not polls:
+        stop.set()
+      if isinstance(poll, Exception):
+        raise poll
+      return poll
+
+    events = list(watch_resources(fetch, min_interval=0, max_interval=0, stop=stop))
+    self.assertEqual([(event.kind, event.vmid) for event in events], [(STATUS, 100), (ADDED, 101), (REMOVED, 100)])
+
+  def test_watch_initial(self):
+    events = watch_resources(lambda: [guest(100), guest(101)], min_interval=0, max_interval=0, initial=True)
+    self.assertEqual([next(events).kind, next(events).kind], [ADDED, ADDED])
+    events.close()
+
+  def test_resources_watch(self):
+    proxmox = MagicMock()
+    proxmox.cluster.resources.get.side_effect = [[guest(100)], [guest(100, node='node2')]]
+    resources = Resources(proxmox)
+    event = next(resources.watch(min_interval=0, max_interval=0))
+    self.assertEqual((event.kind, event.node), (MIGRATED, 'node2'))
+    self.assertEqual(resources.snapshot.by_vmid(100)['node'], 'node2')
+
+
+if __name__ == '__main__':
+  unittest.main()